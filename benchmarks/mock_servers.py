@@ -0,0 +1,373 @@
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+VOCABULARY = ("model", "summary", "search", "result", "context", "detail", "source", "claim", "update", "section",
+              "evidence", "method", "finding", "trend", "benchmark", "dataset", "training", "inference", "latency", "cost")
+
+class LatencyDistribution:
+    """Log-normal latency in seconds, described by its median and 99th percentile."""
+
+    def __init__(self, median: float, p99: float = None):
+        self.median = median
+        self.sigma = math.log(p99 / median) / 2.326 if p99 and median else 0.0
+
+    def sample(self, rng: random.Random) -> float:
+        return self.median * math.exp(self.sigma * rng.gauss(0, 1)) if self.median else 0.0
+
+def digest(payload) -> int:
+    """Stable integer hash of a JSON payload, so mock outputs depend only on the request."""
+    return int(hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()[:12], 16)
+
+def words(seed: int, count: int) -> list[str]:
+    rng = random.Random(seed)
+    return [rng.choice(VOCABULARY) for _ in range(count)]
+
+def estimate_tokens(payload) -> int:
+    return max(len(json.dumps(payload)) // 4, 1)
+
+def now() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+class MockHandler(BaseHTTPRequestHandler):
+    """Keep-alive JSON, NDJSON and server-sent-event responses for the mock servers."""
+
+    protocol_version = "HTTP/1.1"
+    mock = None
+
+    def log_message(self, *args):
+        pass
+
+    def read_json(self) -> dict:
+        length = int(self.headers.get("Content-Length") or 0)
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def send_json(self, payload, status: int = 200, headers: dict = None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def start_chunked(self, content_type: str, headers: dict = None):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Transfer-Encoding", "chunked")
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+
+    def write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+    def end_chunked(self):
+        self.wfile.write(b"0\r\n\r\n")
+        self.wfile.flush()
+
+class MockServer:
+    """Base class running a handler on a local ThreadingHTTPServer in a daemon thread."""
+
+    handler = MockHandler
+
+    def __init__(self, seed: int = 0):
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._server = None
+
+    def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        """Start serving and return the base URL."""
+        handler = type(self.handler.__name__, (self.handler,), {'mock': self})
+        self._server = ThreadingHTTPServer((host, port), handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self.url
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def latency(self, distribution: LatencyDistribution) -> float:
+        with self._lock:
+            self.requests += 1
+            return distribution.sample(self.rng)
+
+class OllamaHandler(MockHandler):
+
+    def do_GET(self):
+        if self.path == "/api/version":
+            self.send_json({"version": "0.0.0-mock"})
+        elif self.path in ("/api/tags", "/api/ps"):
+            self.send_json({"models": [{"name": model, "model": model, "size": 0, "digest": "mock",
+                                        "details": {}, "expires_at": now(), "size_vram": 0}
+                                       for model in sorted(self.mock.loaded)]})
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        if self.path != "/api/chat":
+            self.send_error(404)
+            return
+        request = self.read_json()
+        mock = self.mock
+        thinking, answer = mock.generate(request)
+        load_duration = mock.load(request['model'])
+        time.sleep(load_duration + mock.latency(mock.first_token_latency))
+        tokens = [mock.think_tag] + [f" {word}" for word in thinking] + [mock.think_end_tag] + [f" {word}" for word in answer]
+        counters = {
+            'done': True,
+            'done_reason': 'stop',
+            'total_duration': int((load_duration + len(tokens) / mock.tokens_per_second) * 1e9),
+            'load_duration': int(load_duration * 1e9),
+            'prompt_eval_count': estimate_tokens(request['messages']),
+            'prompt_eval_duration': int(estimate_tokens(request['messages']) / mock.prompt_tokens_per_second * 1e9),
+            'eval_count': len(tokens),
+            'eval_duration': int(len(tokens) / mock.tokens_per_second * 1e9),
+        }
+        base = {'model': request['model'], 'created_at': now()}
+
+        if not request.get('stream', True):
+            time.sleep(len(tokens) / mock.tokens_per_second)
+            self.send_json({**base, 'message': {'role': 'assistant', 'content': "".join(tokens)}, **counters})
+            return
+
+        self.start_chunked("application/x-ndjson")
+        try:
+            for token in tokens:
+                time.sleep(1 / mock.tokens_per_second)
+                self.write_chunk((json.dumps({**base, 'message': {'role': 'assistant', 'content': token}, 'done': False}) + "\n").encode())
+            self.write_chunk((json.dumps({**base, 'message': {'role': 'assistant', 'content': ""}, **counters}) + "\n").encode())
+            self.end_chunked()
+        except (BrokenPipeError, ConnectionResetError):
+            # The client closed the stream, e.g. after a thinking budget was exceeded
+            self.close_connection = True
+
+class MockOllama(MockServer):
+    """Stand-in for the Ollama chat API (`/api/chat`, streamed and not, plus `/api/ps`).
+
+    Responses are a thinking block followed by an answer, with lengths drawn per request.
+    Outputs depend only on the request, so identical requests get identical responses.
+
+    Args:
+        first_token_latency: Delay before the first token
+        tokens_per_second: Generation speed, used for streaming and reported durations
+        thinking_tokens: (min, max) thinking length in words
+        answer_tokens: (min, max) answer length in words
+        load_seconds: Extra delay the first time each model is requested
+    """
+
+    handler = OllamaHandler
+
+    def __init__(self,
+                 first_token_latency: LatencyDistribution = LatencyDistribution(0.05, 0.2),
+                 tokens_per_second: float = 400.0,
+                 prompt_tokens_per_second: float = 4000.0,
+                 thinking_tokens: tuple[int, int] = (40, 160),
+                 answer_tokens: tuple[int, int] = (40, 80),
+                 load_seconds: float = 0.0,
+                 think_tag: str = "<think>",
+                 think_end_tag: str = "</think>",
+                 seed: int = 0):
+        super().__init__(seed)
+        self.first_token_latency = first_token_latency
+        self.tokens_per_second = tokens_per_second
+        self.prompt_tokens_per_second = prompt_tokens_per_second
+        self.thinking_tokens = thinking_tokens
+        self.answer_tokens = answer_tokens
+        self.load_seconds = load_seconds
+        self.think_tag = think_tag
+        self.think_end_tag = think_end_tag
+        self.loaded = set()
+
+    def load(self, model: str) -> float:
+        with self._lock:
+            if model in self.loaded:
+                return 0.0
+            self.loaded.add(model)
+        return self.load_seconds
+
+    def generate(self, request: dict) -> tuple[list[str], list[str]]:
+        seed = digest({'messages': request['messages'], 'options': request.get('options')})
+        rng = random.Random(seed)
+        return (words(seed, rng.randint(*self.thinking_tokens)),
+                words(seed + 1, rng.randint(*self.answer_tokens)))
+
+class AnthropicHandler(MockHandler):
+
+    def do_GET(self):
+        parts = self.path.split("?")[0].strip("/").split("/")
+        if parts[:3] == ["v1", "messages", "batches"] and len(parts) == 4:
+            self.send_json(self.mock.batch_status(parts[3]))
+        elif parts[:3] == ["v1", "messages", "batches"] and len(parts) == 5 and parts[4] == "results":
+            body = "".join(json.dumps(result) + "\n" for result in self.mock.batch_results(parts[3])).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/binary")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        else:
+            self.send_error(404)
+
+    def do_POST(self):
+        path = self.path.split("?")[0]
+        request = self.read_json()
+        mock = self.mock
+        if path == "/v1/messages/count_tokens":
+            self.send_json({'input_tokens': estimate_tokens(request['messages'])})
+        elif path == "/v1/messages/batches":
+            self.send_json(mock.create_batch(request['requests']))
+        elif path == "/v1/messages":
+            time.sleep(mock.latency(mock.latency_distribution))
+            message = mock.respond(request)
+            if request.get('stream'):
+                self.stream(message)
+            else:
+                time.sleep(message['usage']['output_tokens'] / mock.tokens_per_second)
+                self.send_json(message, headers=mock.rate_limit_headers())
+        else:
+            self.send_error(404)
+
+    def stream(self, message: dict):
+        events = [("message_start", {'type': 'message_start',
+                                     'message': {**message, 'content': [], 'stop_reason': None,
+                                                 'usage': {**message['usage'], 'output_tokens': 1}}}),
+                  ("content_block_start", {'type': 'content_block_start', 'index': 0,
+                                           'content_block': {'type': 'text', 'text': ""}})]
+        text = message['content'][0]['text']
+        pieces = [text[i:i + 16] for i in range(0, len(text), 16)]
+        delay = message['usage']['output_tokens'] / self.mock.tokens_per_second / max(len(pieces), 1)
+        self.start_chunked("text/event-stream", self.mock.rate_limit_headers())
+        try:
+            for name, data in events:
+                self.write_chunk(f"event: {name}\ndata: {json.dumps(data)}\n\n".encode())
+            for piece in pieces:
+                time.sleep(delay)
+                data = {'type': 'content_block_delta', 'index': 0, 'delta': {'type': 'text_delta', 'text': piece}}
+                self.write_chunk(f"event: content_block_delta\ndata: {json.dumps(data)}\n\n".encode())
+            for name, data in [("content_block_stop", {'type': 'content_block_stop', 'index': 0}),
+                               ("message_delta", {'type': 'message_delta',
+                                                  'delta': {'stop_reason': message['stop_reason'], 'stop_sequence': None},
+                                                  'usage': {'output_tokens': message['usage']['output_tokens']}}),
+                               ("message_stop", {'type': 'message_stop'})]:
+                self.write_chunk(f"event: {name}\ndata: {json.dumps(data)}\n\n".encode())
+            self.end_chunked()
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True
+
+class MockAnthropic(MockServer):
+    """Stand-in for the Anthropic Messages API, including streaming, count-tokens and batches.
+
+    Requests with tools are answered with a `grade_response` tool call that passes with
+    probability `pass_rate`, decided by a hash of the request so reruns agree. Other
+    requests get a meta-prompt style answer with suggestions, an improved prompt and an
+    assessment. Cache breakpoints are reported as cache writes on first sight of a prefix
+    and cache reads afterwards.
+
+    Args:
+        latency: Delay before the response starts
+        tokens_per_second: Output speed, used for the response body and streaming
+        pass_rate: Probability that a graded response passes
+        batch_seconds: Time a batch stays `in_progress`
+        requests_per_minute: Limit advertised in the rate-limit response headers
+    """
+
+    handler = AnthropicHandler
+
+    def __init__(self,
+                 latency: LatencyDistribution = LatencyDistribution(0.3, 1.2),
+                 tokens_per_second: float = 200.0,
+                 pass_rate: float = 0.4,
+                 meta_output_tokens: int = 400,
+                 batch_seconds: float = 0.5,
+                 requests_per_minute: int = 4000,
+                 seed: int = 0):
+        super().__init__(seed)
+        self.latency_distribution = latency
+        self.tokens_per_second = tokens_per_second
+        self.pass_rate = pass_rate
+        self.meta_output_tokens = meta_output_tokens
+        self.batch_seconds = batch_seconds
+        self.requests_per_minute = requests_per_minute
+        self.cached_prefixes = set()
+        self.batches = {}
+
+    def rate_limit_headers(self) -> dict:
+        return {'anthropic-ratelimit-requests-limit': str(self.requests_per_minute),
+                'anthropic-ratelimit-requests-remaining': str(self.requests_per_minute),
+                'request-id': f"req_mock_{uuid.uuid4().hex[:12]}"}
+
+    def usage(self, request: dict, output_tokens: int) -> dict:
+        # Everything up to the last cache breakpoint counts as a cacheable prefix
+        blocks = list(request.get('tools') or []) + list(request.get('system') or [])
+        for message in request['messages']:
+            blocks.extend(message['content'] if isinstance(message['content'], list) else [message['content']])
+        cut = max((i + 1 for i, block in enumerate(blocks) if isinstance(block, dict) and 'cache_control' in block), default=0)
+        prefix_tokens = estimate_tokens(blocks[:cut]) if cut else 0
+        key = digest([request['model'], blocks[:cut]])
+        with self._lock:
+            hit = key in self.cached_prefixes
+            self.cached_prefixes.add(key)
+        return {'input_tokens': estimate_tokens(blocks) - prefix_tokens,
+                'output_tokens': output_tokens,
+                'cache_read_input_tokens': prefix_tokens if hit else 0,
+                'cache_creation_input_tokens': 0 if hit else prefix_tokens}
+
+    def respond(self, request: dict) -> dict:
+        seed = digest(request['messages'])
+        if request.get('tools'):
+            passed = (seed % 1000) / 1000 < self.pass_rate
+            content = [{'type': 'tool_use', 'id': f"toolu_mock_{seed:x}", 'name': request['tools'][0]['name'],
+                        'input': {'passed': passed,
+                                  'justification': "The response meets the objective." if passed else
+                                                   "The response repeats existing content and adds an introduction."}}]
+            stop_reason, output_tokens = 'tool_use', 40
+        else:
+            body = words(seed, self.meta_output_tokens)
+            third = len(body) // 3
+            text = (f"<suggestions>\n- {' '.join(body[:third])}\n</suggestions>\n"
+                    f"<improved_prompt>\nRevision {seed % 100000}: {' '.join(body[third:2 * third])}\n</improved_prompt>\n"
+                    f"<assessment>\n{' '.join(body[2 * third:])}\n</assessment>")
+            content = [{'type': 'text', 'text': text}]
+            stop_reason, output_tokens = 'end_turn', self.meta_output_tokens
+        return {'id': f"msg_mock_{uuid.uuid4().hex[:12]}", 'type': 'message', 'role': 'assistant',
+                'model': request['model'], 'content': content, 'stop_reason': stop_reason, 'stop_sequence': None,
+                'usage': self.usage(request, output_tokens)}
+
+    def create_batch(self, requests: list[dict]) -> dict:
+        batch_id = f"msgbatch_mock_{uuid.uuid4().hex[:12]}"
+        with self._lock:
+            self.batches[batch_id] = {'requests': requests, 'created': time.monotonic(),
+                                      'created_at': datetime.now(timezone.utc)}
+        return self.batch_status(batch_id)
+
+    def batch_status(self, batch_id: str) -> dict:
+        batch = self.batches[batch_id]
+        ended = time.monotonic() - batch['created'] >= self.batch_seconds
+        count = len(batch['requests'])
+        return {'id': batch_id, 'type': 'message_batch',
+                'processing_status': 'ended' if ended else 'in_progress',
+                'request_counts': {'processing': 0 if ended else count, 'succeeded': count if ended else 0,
+                                   'errored': 0, 'canceled': 0, 'expired': 0},
+                'created_at': batch['created_at'].isoformat(),
+                'expires_at': (batch['created_at'] + timedelta(days=1)).isoformat(),
+                'ended_at': now() if ended else None, 'archived_at': None, 'cancel_initiated_at': None,
+                'results_url': f"{self.url}/v1/messages/batches/{batch_id}/results" if ended else None}
+
+    def batch_results(self, batch_id: str) -> list[dict]:
+        return [{'custom_id': request['custom_id'], 'result': {'type': 'succeeded', 'message': self.respond(request['params'])}}
+                for request in self.batches[batch_id]['requests']]
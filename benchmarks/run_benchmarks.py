@@ -0,0 +1,192 @@
+"""Offline benchmarks for the prompt lab against local stand-ins for Ollama and Claude.
+
+Starts `MockOllama` and `MockAnthropic`, then runs each scenario in a fresh child process
+pointed at them through `OLLAMA_HOST` and `ANTHROPIC_BASE_URL`, so module state and peak
+memory are measured per scenario. Results are written as JSON and can be compared with a
+previous run:
+
+    python benchmarks/run_benchmarks.py --output results.json
+    python benchmarks/run_benchmarks.py --compare results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from mock_servers import LatencyDistribution, MockAnthropic, MockOllama
+
+BENCHMARKS_DIR = Path(__file__).resolve().parent
+SOURCE_DIR = BENCHMARKS_DIR.parent / "src" / "claude_prompt_lab"
+
+OBJECTIVE = "Integrate new search results into an existing research summary without an introduction."
+SYSTEM_PROMPT = "Your goal is to generate a high-quality summary of the web search results."
+INPUT = "<existing_summary>{summary}</existing_summary>\n<new_search_results>{results}</new_search_results>"
+
+def make_cases(count: int) -> list[dict]:
+    return [{'id': str(index), 'input': INPUT.format(summary=f"Summary {index} of recent model releases.",
+                                                     results=f"Search result {index} on benchmark scores.")}
+            for index in range(1, count + 1)]
+
+def run_interactive(lab, scale, **options):
+    for case in make_cases(scale):
+        lab.run_prompt_lab("mock-reasoner", "mock-claude", case['input'], OBJECTIVE, SYSTEM_PROMPT,
+                           "<think>", "</think>", 4, **options)
+    return scale
+
+def run_dataset(lab, scale, cache_path=None, runs=1, **options):
+    import cache
+    from pipeline import run_dataset
+    if cache_path:
+        cache.configure_cache(cache_path)
+    for _ in range(runs):
+        asyncio.run(run_dataset(make_cases(scale), "mock-reasoner", "mock-claude", OBJECTIVE, SYSTEM_PROMPT,
+                                "<think>", "</think>", 4, **options))
+    return scale * runs
+
+def run_dataset_batch(lab, scale, **options):
+    from batch import run_dataset_batch
+    asyncio.run(run_dataset_batch(make_cases(scale), "mock-reasoner", "mock-claude", OBJECTIVE, SYSTEM_PROMPT,
+                                  "<think>", "</think>", 4, poll_interval=0.1, **options))
+    return scale
+
+def run_search(lab, scale, **options):
+    from search import run_prompt_search
+    asyncio.run(run_prompt_search(make_cases(scale), "mock-reasoner", "mock-claude", OBJECTIVE, SYSTEM_PROMPT,
+                                  "<think>", "</think>", 3, **options))
+    return scale
+
+# Scenario name -> (runner, number of cases, keyword arguments)
+SCENARIOS = {
+    'interactive': (run_interactive, 3, {}),
+    'interactive-stream': (run_interactive, 3, {'stream': True}),
+    'sampled': (run_interactive, 2, {'samples': 6, 'sample_concurrency': 3}),
+    'dataset-serial': (run_dataset, 16, {'generator_concurrency': 1, 'evaluator_concurrency': 1, 'meta_concurrency': 1}),
+    'dataset': (run_dataset, 16, {'generator_concurrency': 2, 'evaluator_concurrency': 8, 'meta_concurrency': 4}),
+    'dataset-unscheduled': (run_dataset, 16, {'generator_concurrency': 2, 'evaluator_concurrency': 8, 'meta_concurrency': 4,
+                                              'scheduled': False}),
+    'dataset-cached': (run_dataset, 16, {'generator_concurrency': 2, 'evaluator_concurrency': 8, 'meta_concurrency': 4,
+                                         'cache_path': "{tmp}/cache.db", 'runs': 2}),
+    'dataset-batch': (run_dataset_batch, 16, {'generator_concurrency': 2}),
+    'search': (run_search, 4, {'beam_width': 2, 'num_candidates': 3, 'generator_concurrency': 2}),
+}
+
+def run_child(scenario: str, result_file: str):
+    """Run one scenario in this process and write its measurements to `result_file`."""
+    sys.path.insert(0, str(SOURCE_DIR))
+    import claude_prompt_lab as lab
+    import events
+    import scheduler
+    import telemetry
+
+    # Events are dropped, so the run renders nothing
+    events.configure_events("none")
+    collector = telemetry.configure_telemetry()
+    runner, scale, options = SCENARIOS[scenario]
+    options = dict(options)
+    # Claude calls go through the scheduler with the command line's defaults, unless the
+    # scenario measures the bare client for comparison
+    if options.pop('scheduled', True):
+        scheduler.configure_scheduler()
+    with tempfile.TemporaryDirectory() as tmp:
+        options = {name: value.format(tmp=tmp) if isinstance(value, str) else value for name, value in options.items()}
+        started = time.perf_counter()
+        cases = runner(lab, scale, **options)
+        wall = time.perf_counter() - started
+
+    stages = {name: {'calls': len(durations),
+                     'p50_seconds': telemetry.percentile(durations, 0.5),
+                     'p99_seconds': telemetry.percentile(durations, 0.99),
+                     'total_seconds': sum(durations)}
+              for name, durations in collector.durations.items()}
+    # ru_maxrss is in kilobytes on Linux and bytes on macOS
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1024 * 1024 if sys.platform == "darwin" else 1024)
+    # Every mode generates through the generator stage, so it measures attempts in all of them
+    generations = len(collector.durations.get('generator', []))
+    Path(result_file).write_text(json.dumps({
+        'wall_seconds': wall,
+        'cases': cases,
+        'generations': generations,
+        'cases_per_second': cases / wall,
+        'generations_per_second': generations / wall,
+        'peak_rss_mb': peak_rss,
+        'stages': stages,
+    }))
+
+def run_scenario(scenario: str, ollama_url: str, anthropic_url: str) -> dict:
+    env = {**os.environ, 'OLLAMA_HOST': ollama_url, 'ANTHROPIC_BASE_URL': anthropic_url,
+           'ANTHROPIC_API_KEY': os.environ.get('ANTHROPIC_API_KEY', 'mock-key')}
+    with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as result:
+        result_file = result.name
+    try:
+        subprocess.run([sys.executable, __file__, "--child", scenario, "--result-file", result_file],
+                       env=env, check=True)
+        return json.loads(Path(result_file).read_text())
+    finally:
+        os.unlink(result_file)
+
+def print_results(results: dict, baseline: dict = None):
+    def delta(value, old):
+        return f" ({(value - old) / old:+.0%})" if old else ""
+    for scenario, result in results['scenarios'].items():
+        old = (baseline or {}).get('scenarios', {}).get(scenario, {})
+        print(f"\n{scenario}: {result['wall_seconds']:.2f}s{delta(result['wall_seconds'], old.get('wall_seconds'))}, "
+              f"{result['cases_per_second']:.2f} cases/s{delta(result['cases_per_second'], old.get('cases_per_second'))}, "
+              f"{result['generations_per_second']:.2f} generations/s{delta(result['generations_per_second'], old.get('generations_per_second'))}, "
+              f"peak RSS {result['peak_rss_mb']:.0f} MB{delta(result['peak_rss_mb'], old.get('peak_rss_mb'))}")
+        for stage, stats in result['stages'].items():
+            old_stats = old.get('stages', {}).get(stage, {})
+            print(f"  {stage:<16} {stats['calls']:>4} calls  p50 {stats['p50_seconds']:.3f}s"
+                  f"{delta(stats['p50_seconds'], old_stats.get('p50_seconds'))}  p99 {stats['p99_seconds']:.3f}s"
+                  f"{delta(stats['p99_seconds'], old_stats.get('p99_seconds'))}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the prompt lab against mock Ollama and Claude servers")
+    parser.add_argument('--scenario', action='append', choices=list(SCENARIOS),
+                        help='Scenario to run (repeatable, default: all)')
+    parser.add_argument('--output', default=None, help='Write the results to this JSON file')
+    parser.add_argument('--compare', default=None, help='Show changes relative to a previous results file')
+    parser.add_argument('--tokens-per-second', type=float, default=400.0, help='Mock Ollama generation speed')
+    parser.add_argument('--first-token-latency', type=float, default=0.05, help='Median mock Ollama time to first token')
+    parser.add_argument('--claude-latency', type=float, default=0.3, help='Median mock Claude response latency')
+    parser.add_argument('--claude-latency-p99', type=float, default=1.2, help='99th percentile mock Claude latency')
+    parser.add_argument('--pass-rate', type=float, default=0.4, help='Probability that the mock grader passes a response')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the mock latency draws')
+    parser.add_argument('--child', default=None, help=argparse.SUPPRESS)
+    parser.add_argument('--result-file', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.result_file)
+        sys.exit(0)
+
+    ollama = MockOllama(first_token_latency=LatencyDistribution(args.first_token_latency, args.first_token_latency * 4),
+                        tokens_per_second=args.tokens_per_second, seed=args.seed)
+    anthropic = MockAnthropic(latency=LatencyDistribution(args.claude_latency, args.claude_latency_p99),
+                              pass_rate=args.pass_rate, seed=args.seed)
+    ollama_url, anthropic_url = ollama.start(), anthropic.start()
+
+    results = {'created_at': datetime.now(timezone.utc).isoformat(),
+               'python': platform.python_version(),
+               'settings': {name: value for name, value in vars(args).items()
+                            if name not in ('scenario', 'output', 'compare', 'child', 'result_file')},
+               'scenarios': {}}
+    try:
+        for scenario in args.scenario or list(SCENARIOS):
+            print(f"Running {scenario}...", flush=True)
+            results['scenarios'][scenario] = run_scenario(scenario, ollama_url, anthropic_url)
+    finally:
+        ollama.stop()
+        anthropic.stop()
+
+    print_results(results, json.loads(Path(args.compare).read_text()) if args.compare else None)
+    if args.output:
+        Path(args.output).write_text(json.dumps(results, indent=2))
+        print(f"\nResults written to {args.output}")
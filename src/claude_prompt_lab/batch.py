@@ -0,0 +1,277 @@
+import asyncio
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from anthropic import AsyncAnthropic
+from anthropic.types import Message
+from anthropic.types.messages import MessageBatch, MessageBatchIndividualResponse
+
+import cache
+import events
+import hosts
+import pregrader
+import store
+import telemetry
+from claude_prompt_lab import build_evaluator_request, generate_report_entry, GenerationAborted
+from context import estimate_tokens
+from events import Graded, Notice, Waiting
+from pipeline import generate_case, diagnose_case, generate_dataset_report
+from utils import extract_xml
+
+def local_grade(params: dict) -> Message:
+    """Default grader for `LocalBatchServer`: passes any non-empty response.
+
+    Stands in for Claude so the batch path can be exercised end to end without network."""
+    response = extract_xml(params['messages'][0]['content'][-1]['text'], "Reasoning Model Output").strip()
+    return Message.model_validate({
+        'id': f"msg_local_{uuid.uuid4().hex[:12]}",
+        'type': 'message',
+        'role': 'assistant',
+        'model': params['model'],
+        'content': [{'type': 'tool_use', 'id': f"toolu_local_{uuid.uuid4().hex[:12]}", 'name': 'grade_response',
+                     'input': {'passed': bool(response),
+                               'justification': "Graded by the local batch server: " +
+                                                ("response is non-empty." if response else "response is empty.")}}],
+        'stop_reason': 'tool_use',
+        'stop_sequence': None,
+        'usage': {'input_tokens': estimate_tokens(str(params['messages'])), 'output_tokens': 20},
+    })
+
+class LocalBatchServer:
+    """In-process stand-in for the Message Batches API (`AsyncAnthropic().messages.batches`).
+
+    Implements `create`, `retrieve` and `results` with the same request and response types.
+    Batches report `in_progress` until `processing_seconds` have passed, then every request
+    is answered by `grader(params)`, which returns a `Message` or raises to produce an
+    errored result.
+    """
+
+    def __init__(self, grader=local_grade, processing_seconds: float = 0.0):
+        self.grader = grader
+        self.processing_seconds = processing_seconds
+        self._batches = {}
+
+    async def create(self, requests: list[dict]) -> MessageBatch:
+        batch_id = f"msgbatch_local_{uuid.uuid4().hex[:12]}"
+        self._batches[batch_id] = {'requests': list(requests), 'created': time.monotonic(),
+                                   'created_at': datetime.now(timezone.utc)}
+        return await self.retrieve(batch_id)
+
+    async def retrieve(self, message_batch_id: str) -> MessageBatch:
+        batch = self._batches[message_batch_id]
+        ended = time.monotonic() - batch['created'] >= self.processing_seconds
+        if ended and 'results' not in batch:
+            batch['results'] = [self._run(request) for request in batch['requests']]
+            batch['ended_at'] = datetime.now(timezone.utc)
+        results = batch.get('results', [])
+        count = lambda kind: sum(result.result.type == kind for result in results)
+        return MessageBatch(
+            id=message_batch_id,
+            type='message_batch',
+            processing_status='ended' if ended else 'in_progress',
+            request_counts={'processing': 0 if ended else len(batch['requests']),
+                            'succeeded': count('succeeded'), 'errored': count('errored'),
+                            'canceled': 0, 'expired': 0},
+            created_at=batch['created_at'],
+            expires_at=batch['created_at'] + timedelta(days=1),
+            ended_at=batch.get('ended_at'),
+            archived_at=None,
+            cancel_initiated_at=None,
+            results_url=f"local://{message_batch_id}/results" if ended else None,
+        )
+
+    async def results(self, message_batch_id: str):
+        if 'results' not in self._batches[message_batch_id]:
+            raise RuntimeError(f"Batch {message_batch_id} has not ended yet")
+        async def stream():
+            for result in self._batches[message_batch_id]['results']:
+                yield result
+        return stream()
+
+    def _run(self, request: dict) -> MessageBatchIndividualResponse:
+        try:
+            result = {'type': 'succeeded', 'message': self.grader(request['params'])}
+        except Exception as e:
+            result = {'type': 'errored', 'error': {'type': 'error', 'error': {'type': 'api_error', 'message': str(e)}}}
+        return MessageBatchIndividualResponse.model_validate({'custom_id': request['custom_id'], 'result': result})
+
+async def grade_batch(items: list[dict], claude_model: str, batches, poll_interval: float = 30.0, on_result=None) -> dict:
+    """Grade many responses with one Message Batch using the `grade_response` tool.
+
+    Responses failed by the pre-grader and requests already in the response cache are
+    left out of the batch; fresh results are written back so a rerun does not resubmit them.
+
+    Args:
+        items (list[dict]): Dicts with `custom_id`, `objective`, `input` and `response`
+        claude_model (str): The name of the model to use for evaluation
+        batches: The batches resource, `AsyncAnthropic().messages.batches` or a `LocalBatchServer`
+        poll_interval (float): Seconds between status checks
+        on_result (callable): Called with (custom_id, grade or None, error or None) as each result arrives
+
+    Returns:
+        dict: custom_id -> grade dict for every succeeded request"""
+    grades = {}
+    def deliver(custom_id, grade, error=None):
+        if grade is not None:
+            grades[custom_id] = grade
+        if on_result:
+            on_result(custom_id, grade, error)
+
+    requests = {}
+    for item in items:
+        grade = pregrader.pregrade(item['objective'], item['input'], item['response'])
+        if grade is not None:
+            deliver(item['custom_id'], grade)
+            continue
+        params = build_evaluator_request(claude_model, item['objective'], item['input'], item['response'])
+        if cache.active_cache is not None:
+            cached = cache.active_cache.lookup("anthropic", params, Message)
+            if cached is not None:
+                deliver(item['custom_id'], cached.content[0].input)
+                continue
+        requests[item['custom_id']] = params
+
+    if not requests:
+        return grades
+
+    # One stage record per batch, from submission to the last result
+    with telemetry.stage("batch_evaluator"):
+        batch = await batches.create(requests=[{'custom_id': custom_id, 'params': params}
+                                               for custom_id, params in requests.items()])
+        events.emit(Waiting(f"📦 Grading {len(requests)} responses in batch {batch.id}..."))
+        while batch.processing_status != 'ended':
+            await asyncio.sleep(poll_interval)
+            batch = await batches.retrieve(batch.id)
+        counts = batch.request_counts
+        events.emit(Notice(f"Batch {batch.id} ended: {counts.succeeded} succeeded, {counts.errored} errored, "
+                           f"{counts.expired} expired, {counts.canceled} canceled", "done"))
+
+        async for entry in await batches.results(batch.id):
+            if entry.result.type == 'succeeded':
+                if cache.active_cache is not None:
+                    cache.active_cache.store("anthropic", requests[entry.custom_id], entry.result.message)
+                telemetry.note_anthropic(entry.result.message.usage)
+                deliver(entry.custom_id, entry.result.message.content[0].input)
+            elif entry.result.type == 'errored':
+                deliver(entry.custom_id, None, f"batch request errored: {entry.result.error.error.message}")
+            else:
+                deliver(entry.custom_id, None, f"batch request {entry.result.type}")
+    return grades
+
+async def run_dataset_batch(cases: list[dict],
+                            reasoning_model: str,
+                            claude_model: str,
+                            reasoning_model_objective: str,
+                            reasoning_model_system_prompt: str,
+                            think_tag: str,
+                            think_end_tag: str,
+                            max_attempts: int,
+                            generator_concurrency: int = 1,
+                            meta_concurrency: int = 4,
+                            batches=None,
+                            poll_interval: float = 30.0,
+                            stream: bool = False,
+                            max_thinking_tokens: int = None,
+                            max_generation_seconds: float = None,
+                            context_budget: int = 8000,
+                            recent_attempts: int = 2) -> str:
+    """Run the prompt lab over a test suite, grading each round with one Message Batch.
+
+    Intended for nightly regression runs, where throughput and cost matter more than
+    latency. Each round generates responses for every unfinished case, grades them all in
+    a single batch, then diagnoses the failures concurrently before the next round.
+
+    Args:
+        cases: Test cases from `pipeline.load_dataset`
+        batches: Batches resource to use, defaults to `AsyncAnthropic().messages.batches`;
+            pass a `LocalBatchServer` to run without network
+        poll_interval: Seconds between batch status checks
+        Other arguments are as for `pipeline.run_dataset`
+
+    Returns:
+        str: A medical-style report covering every case in the suite
+    """
+    anthropic_client = AsyncAnthropic()
+    ollama_client = hosts.async_client()
+    batches = batches or anthropic_client.messages.batches
+
+    # Position of each case in the suite, by identity, since identical cases are distinct requests
+    positions = {}
+    for index, case in enumerate(cases, 1):
+        positions[id(case)] = index - 1
+        case.setdefault('id', str(index))
+        case.setdefault('objective', reasoning_model_objective)
+        case.setdefault('system_prompt', reasoning_model_system_prompt)
+        case.update(attempt=1, report=[], history=[], grade=None, error=None)
+        store.record_prompt(case['system_prompt'])
+
+    generate_slots = asyncio.Semaphore(generator_concurrency)
+    meta_slots = asyncio.Semaphore(meta_concurrency)
+
+    async def generate(case):
+        async with generate_slots:
+            try:
+                await generate_case(ollama_client, case, reasoning_model, think_tag, think_end_tag,
+                                    stream, max_thinking_tokens, max_generation_seconds)
+            except GenerationAborted as e:
+                case['response'], case['thinking'] = e.chat_message, e.thinking_steps
+                case['grade'] = e.grade()
+            except Exception as e:
+                case['error'] = f"generation failed: {e}"
+
+    async def diagnose(case):
+        async with meta_slots:
+            try:
+                await diagnose_case(anthropic_client, case, claude_model, context_budget, recent_attempts)
+            except Exception as e:
+                case['error'] = f"meta-prompt failed: {e}"
+                return
+            case['report'].append(generate_report_entry(case['attempt'], case['grade'], case['parsed_response']))
+            store.record_prompt(case['parsed_response']['improved_prompt'], parent=case['system_prompt'],
+                                attempt=case['attempt'], suggestions=case['parsed_response']['suggestions'])
+            case['system_prompt'] = case['parsed_response']['improved_prompt']
+            case['attempt'] += 1
+
+    try:
+        active = list(cases)
+        while active:
+            events.emit(Notice(f"🔄 Round {active[0]['attempt']}: generating {len(active)} responses", "heading"))
+            for case in active:
+                case['grade'] = None
+            await asyncio.gather(*(generate(case) for case in active))
+
+            by_custom_id = {f"case-{positions[id(case)]}-attempt-{case['attempt']}": case
+                            for case in active if not case['error'] and case['grade'] is None}
+
+            def on_result(custom_id, grade, error):
+                case = by_custom_id[custom_id]
+                if error:
+                    case['error'] = error
+                    return
+                case['grade'] = grade
+                events.emit(Graded(case['attempt'], grade['passed'], grade['justification'], case['id']))
+
+            await grade_batch([{'custom_id': custom_id, 'objective': case['objective'],
+                                'input': case['input'], 'response': case['response']}
+                               for custom_id, case in by_custom_id.items()],
+                              claude_model, batches, poll_interval, on_result)
+
+            to_diagnose = []
+            for case in active:
+                if not case['error'] and case['grade'] is None:
+                    case['error'] = "batch returned no result"
+                if case['error']:
+                    continue
+                store.record_grade(case['system_prompt'], case['objective'], case['input'], reasoning_model,
+                                   claude_model, case['grade'], case['response'], case['thinking'])
+                if case['grade']['passed'] or case['attempt'] >= max_attempts:
+                    case['report'].append(generate_report_entry(case['attempt'], case['grade']))
+                else:
+                    to_diagnose.append(case)
+            await asyncio.gather(*(diagnose(case) for case in to_diagnose))
+            active = [case for case in to_diagnose if not case['error']]
+    finally:
+        await anthropic_client.close()
+
+    return generate_dataset_report(cases, reasoning_model, reasoning_model_objective)
@@ -0,0 +1,164 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+CACHE_MODES = ("read-through", "write-only", "offline")
+
+# The process-wide cache used by the generator, evaluator and meta-prompt calls, if any
+active_cache = None
+
+class CacheMiss(Exception):
+    """Raised in offline mode when a request has no cached response."""
+
+class ResponseCache:
+    """Content-addressed on-disk cache for Ollama and Claude responses.
+
+    Responses are stored in SQLite under a SHA-256 hash of the namespace and the full
+    request parameters (model, system prompt, messages, tools, sampling options), so any
+    change to a prompt or parameter is a miss. When the stored payload exceeds `max_bytes`
+    the least recently used entries are evicted.
+
+    Modes:
+        read-through: Serve hits from disk, call the API on a miss and store the result
+        write-only: Always call the API and store the result, never serve from disk
+        offline: Only serve from disk, raise `CacheMiss` instead of calling the API
+    """
+
+    # Hits whose access times are written together
+    TOUCH_BATCH = 100
+
+    def __init__(self, path: str, mode: str = "read-through", max_bytes: int = 512 * 1024 * 1024):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode {mode!r}, expected one of {', '.join(CACHE_MODES)}")
+        self.path = path
+        self.mode = mode
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("""CREATE TABLE IF NOT EXISTS responses (
+                                key TEXT PRIMARY KEY,
+                                namespace TEXT NOT NULL,
+                                response TEXT NOT NULL,
+                                size INTEGER NOT NULL,
+                                last_access REAL NOT NULL)""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_last_access ON responses (last_access)")
+        # WAL makes each commit an append instead of a journal rewrite and fsync
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.commit()
+        self._total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        # Hits only bump `last_access` in memory; they are written in batches and before eviction
+        self._touched = {}
+
+    @staticmethod
+    def key(namespace: str, request: dict) -> str:
+        """Hash a request into its cache key."""
+        payload = json.dumps([namespace, request], sort_keys=True, default=str, ensure_ascii=False)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def get(self, namespace: str, request: dict):
+        """Return the cached response for a request, or None."""
+        key = self.key(namespace, request)
+        with self._lock:
+            row = self._db.execute("SELECT response FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            self._touched[key] = time.time()
+            if len(self._touched) >= self.TOUCH_BATCH:
+                self._flush_touched()
+                self._db.commit()
+        return json.loads(row[0])
+
+    def _flush_touched(self):
+        self._db.executemany("UPDATE responses SET last_access = ? WHERE key = ?",
+                             [(accessed, key) for key, accessed in self._touched.items()])
+        self._touched.clear()
+
+    def put(self, namespace: str, request: dict, response: dict):
+        """Store a response, evicting least recently used entries beyond `max_bytes`."""
+        payload = json.dumps(response, ensure_ascii=False)
+        key = self.key(namespace, request)
+        with self._lock:
+            replaced = self._db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self._db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)",
+                             (key, namespace, payload, len(payload), time.time()))
+            self._total += len(payload) - (replaced[0] if replaced else 0)
+            if self._total > self.max_bytes:
+                self._evict()
+            self._db.commit()
+
+    def _evict(self):
+        """Delete least recently used entries until the payload fits in `max_bytes`."""
+        self._flush_touched()
+        evicted = []
+        # The cursor is read lazily, so only the oldest entries are scanned
+        for key, size in self._db.execute("SELECT key, size FROM responses ORDER BY last_access"):
+            if self._total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            self._total -= size
+        self._db.executemany("DELETE FROM responses WHERE key = ?", evicted)
+
+    def lookup(self, namespace: str, request: dict, response_type):
+        """Apply the cache mode to a request without calling the API.
+
+        Returns the cached response rebuilt as `response_type` on a hit, or None when the
+        caller should make the call and `store` the result. Raises `CacheMiss` in offline mode."""
+        if self.mode != "write-only":
+            cached = self.get(namespace, request)
+            if cached is not None:
+                self.hits += 1
+                return response_type.model_validate(cached)
+        if self.mode == "offline":
+            raise CacheMiss(f"No cached {namespace} response for request {self.key(namespace, request)[:12]}")
+        self.misses += 1
+        return None
+
+    def store(self, namespace: str, request: dict, response):
+        """Store a pydantic response fetched after a `lookup` miss."""
+        self.put(namespace, request, response.model_dump(mode="json"))
+
+    def fetch(self, namespace: str, request: dict, call, response_type):
+        """Serve a request from the cache according to the mode, calling `call()` on a miss.
+
+        Args:
+            namespace (str): Which API the request targets, e.g. "ollama" or "anthropic"
+            request (dict): The full request parameters
+            call (callable): Makes the real API call and returns a pydantic response
+            response_type (type): Pydantic model used to rebuild cached responses
+
+        Returns:
+            The response, either rebuilt from disk or freshly fetched"""
+        response = self.lookup(namespace, request, response_type)
+        if response is None:
+            response = call()
+            self.store(namespace, request, response)
+        return response
+
+    async def afetch(self, namespace: str, request: dict, call, response_type):
+        """Async variant of `fetch` where `call()` returns an awaitable."""
+        response = self.lookup(namespace, request, response_type)
+        if response is None:
+            response = await call()
+            self.store(namespace, request, response)
+        return response
+
+    def summary(self) -> str:
+        """One-line hit/miss summary for the end of a run."""
+        return f"Response cache ({self.mode}): {self.hits} hits, {self.misses} misses"
+
+    def close(self):
+        with self._lock:
+            self._flush_touched()
+            self._db.commit()
+            self._db.close()
+
+def configure_cache(path: str, mode: str = "read-through", max_bytes: int = 512 * 1024 * 1024) -> ResponseCache:
+    """Open a response cache and make it the process-wide `active_cache`."""
+    global active_cache
+    active_cache = ResponseCache(path, mode=mode, max_bytes=max_bytes)
+    return active_cache
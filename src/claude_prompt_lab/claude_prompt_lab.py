@@ -1,14 +1,33 @@
 import argparse
+import asyncio
+import atexit
+import contextvars
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 
 from anthropic import Anthropic
+from anthropic.types import Message, MessageTokensCount
 from ollama import chat, ChatResponse
 
 from rich.console import Console
-from rich.markdown import Markdown
-from rich.panel import Panel
 
-from utils import extract_xml, grade_response_schema
-from prompts import meta_prompt_input, evaluator_input_prompt, evaluator_system_prompt, meta_prompt_system
+import cache
+import events
+import hosts
+import pregrader
+import residency
+import scheduler
+import session
+import store
+import telemetry
+from sampling import SequentialPassRateTest
+from context import build_meta_prompt_context, calibrated_estimator, estimate_tokens, history_entry, render_attempt
+from events import (Notice, Waiting, AttemptStarted, ThinkingChunk, AssessmentChunk, StreamEnded, Generated,
+                    SampleGraded, Graded, Prescribed, RunFinished)
+from utils import extract_xml, grade_response_schema, split_thinking, ThinkStreamParser, TagStreamParser, text_block, format_cache_usage
+from prompts import (objective_prompt, input_prompt, evaluator_output_prompt, evaluator_system_prompt,
+                     meta_prompt_system, meta_prompt_attempt, meta_prompt_candidates, medical_report_start, medical_report_end)
 
 # Anthropic client
 client = Anthropic()
@@ -16,11 +35,231 @@ client = Anthropic()
 # Define the console
 console = Console()
 
+# Meta-prompt sections in the order they are requested, so the improved prompt arrives
+# before the long human-facing assessment
+META_PROMPT_SECTIONS = ['suggestions', 'improved_prompt', 'assessment']
+
+def ollama_chat(**request):
+    """Call Ollama `chat` on the best host of the pool, or on the local daemon when there is no pool."""
+    request = residency.pin(request)
+    if hosts.active_pool is not None:
+        return hosts.active_pool.chat(**request)
+    return chat(**request)
+
+def create_chat(**request) -> ChatResponse:
+    """Call Ollama `chat`, going through the response cache when one is configured."""
+    if cache.active_cache is None:
+        return ollama_chat(**request)
+    return cache.active_cache.fetch("ollama", request, lambda: ollama_chat(**request), ChatResponse)
+
+def create_message(hedge: bool = False, **request) -> Message:
+    """Call Claude `messages.create` through the scheduler, going through the response cache when one is configured.
+
+    Pass `hedge` for idempotent grading calls, which the scheduler may duplicate when slow."""
+    if cache.active_cache is None:
+        return scheduler.create_message(client, hedge, **request)
+    return cache.active_cache.fetch("anthropic", request, lambda: scheduler.create_message(client, hedge, **request), Message)
+
+def count_message_tokens(**request) -> MessageTokensCount:
+    """Call Claude `messages.count_tokens`, going through the response cache when one is configured."""
+    if cache.active_cache is None:
+        return client.messages.count_tokens(**request)
+    return cache.active_cache.fetch("anthropic-count", request, lambda: client.messages.count_tokens(**request),
+                                    MessageTokensCount)
+
+def build_generator_messages(model_input: str, system_prompt: str) -> list[dict]:
+    """Build the Ollama chat messages for a reasoning model call."""
+    return [
+        {
+        'role': 'system',
+        'content': system_prompt,
+        },
+        {
+        'role': 'user',
+        'content': model_input,
+        },
+    ]
+
+class GenerationAborted(Exception):
+    """Raised when a streamed generation exceeds its thinking-token or wall-clock budget.
+
+    Carries the partial output so the runaway thinking trace can still be diagnosed."""
+
+    def __init__(self, reason: str, chat_message: str, thinking_steps: str):
+        super().__init__(reason)
+        self.chat_message = chat_message
+        self.thinking_steps = thinking_steps
+
+    def grade(self) -> dict:
+        """The failing grade of the aborted attempt, marked `local` since no judge saw it."""
+        return {'passed': False, 'justification': str(self), 'local': True}
+
+class GenerationStream:
+    """Consumes a streamed Ollama generation chunk by chunk.
+
+    Separates thinking from answer tokens as they arrive, records time-to-first-token and
+    time-to-end-of-thinking, and raises `GenerationAborted` as soon as a budget is exceeded.
+    Ollama streams roughly one token per chunk, so thinking chunks are counted as tokens.
+    """
+
+    def __init__(self, think_tag: str, think_end_tag: str, max_thinking_tokens: int = None, max_seconds: float = None):
+        self.parser = ThinkStreamParser(think_tag, think_end_tag)
+        self.max_thinking_tokens = max_thinking_tokens
+        self.max_seconds = max_seconds
+        self.started = time.perf_counter()
+        self.thinking_tokens = 0
+        self.time_to_first_token = None
+        self.time_to_end_of_thinking = None
+        self.content = ""
+        self.last_part = None
+
+    def feed(self, part: ChatResponse) -> list[tuple[str, str]]:
+        """Consume one streamed chunk and return its ("thinking" | "answer", text) segments."""
+        elapsed = time.perf_counter() - self.started
+        text = part['message']['content']
+        self.content += text
+        self.last_part = part
+        if text and self.time_to_first_token is None:
+            self.time_to_first_token = elapsed
+
+        segments = self.parser.feed(text)
+        if any(kind == "thinking" for kind, _ in segments):
+            self.thinking_tokens += 1
+        if self.parser.state == "answer" and self.parser.thinking and self.time_to_end_of_thinking is None:
+            self.time_to_end_of_thinking = elapsed
+
+        if self.parser.state != "answer" and self.max_thinking_tokens and self.thinking_tokens > self.max_thinking_tokens:
+            self.abort(f"thinking budget of {self.max_thinking_tokens} tokens exceeded")
+        if self.max_seconds and elapsed > self.max_seconds:
+            self.abort(f"wall-clock budget of {self.max_seconds:g}s exceeded")
+        return segments
+
+    def abort(self, reason: str):
+        chat_message, thinking_steps = self.parser.finish()
+        raise GenerationAborted(f"Generation aborted after {time.perf_counter() - self.started:.1f}s: {reason}",
+                                chat_message, thinking_steps)
+
+    def finish(self) -> tuple[str, str]:
+        """Return the message with thinking removed and the thinking steps, as `split_thinking` would."""
+        return self.parser.finish()
+
+    def response(self) -> ChatResponse:
+        """The full generation as a single non-streamed response, e.g. for the response cache."""
+        return self.last_part.model_copy(update={'message': self.last_part.message.model_copy(update={'content': self.content})})
+
+    def timings(self) -> dict:
+        return {
+            'time_to_first_token': self.time_to_first_token,
+            'time_to_end_of_thinking': self.time_to_end_of_thinking,
+            'total_time': time.perf_counter() - self.started,
+            'thinking_tokens': self.thinking_tokens,
+        }
+
+def stream_generator(model: str,
+                     model_input: str,
+                     system_prompt: str,
+                     think_tag: str,
+                     think_end_tag: str,
+                     max_thinking_tokens: int = None,
+                     max_generation_seconds: float = None,
+                     options: dict = None,
+                     echo: bool = True):
+    """Stream a response from an Ollama reasoning model, emitting thinking tokens as they arrive.
+    
+    Args:
+        model (str): The name of the reasoning model to use
+        model_input (str): The user message to send to the model
+        system_prompt (str): System prompt to set context/behavior.
+        think_tag (str): Tag for the start of thinking steps
+        think_end_tag (str): Tag for the end of thinking steps
+        max_thinking_tokens (int): Abort once the model has thought for more tokens than this
+        max_generation_seconds (float): Abort once the generation has run longer than this
+        options (dict): Ollama model options, e.g. a sampling seed
+        echo (bool): Emit thinking tokens as events as they arrive
+        
+    Returns:
+        chat_message (str): The model's response text
+        thinking_steps (str): The model's thinking steps
+        timings (dict): Latency milestones of the stream, or None when served from the cache
+
+    Raises:
+        GenerationAborted: If a budget was exceeded; the request is closed immediately"""
+
+    request = dict(model=model, messages=build_generator_messages(model_input, system_prompt))
+    if options:
+        request['options'] = options
+    if cache.active_cache is not None:
+        cached = cache.active_cache.lookup("ollama", request, ChatResponse)
+        if cached is not None:
+            telemetry.note_ollama(cached)
+            chat_message, thinking_steps = split_thinking(cached['message']['content'], think_tag, think_end_tag)
+            return chat_message, thinking_steps, None
+
+    generation = GenerationStream(think_tag, think_end_tag, max_thinking_tokens, max_generation_seconds)
+    streamed_thinking = False
+    parts = ollama_chat(**request, stream=True)
+    try:
+        for part in parts:
+            for kind, text in generation.feed(part):
+                if kind == "thinking" and echo:
+                    events.emit(ThinkingChunk(text))
+                    streamed_thinking = True
+    finally:
+        # Closing the stream drops the connection, which stops Ollama generating
+        parts.close()
+        if streamed_thinking:
+            events.emit(StreamEnded("thinking"))
+
+    if cache.active_cache is not None:
+        cache.active_cache.store("ollama", request, generation.response())
+
+    telemetry.note_ollama(generation.last_part)
+    chat_message, thinking_steps = generation.finish()
+    return chat_message, thinking_steps, generation.timings()
+
+def fetch_generation(model: str,
+                     model_input: str,
+                     system_prompt: str,
+                     think_tag: str,
+                     think_end_tag: str,
+                     stream: bool = False,
+                     max_thinking_tokens: int = None,
+                     max_generation_seconds: float = None,
+                     options: dict = None,
+                     echo: bool = True):
+    """Get a response from an Ollama reasoning model without displaying it.
+
+    Safe to run in a background thread with `echo=False`, which is how the next attempt's
+    generation is started speculatively while the meta-prompt is still streaming.
+
+    Returns:
+        chat_message (str): The model's response text
+        thinking_steps (str): The model's thinking steps
+        timings (dict): Latency milestones of a streamed generation, otherwise None
+
+    Raises:
+        GenerationAborted: If a streamed generation exceeded its budget"""
+    with telemetry.stage("generator"):
+        if stream:
+            return stream_generator(model, model_input, system_prompt, think_tag, think_end_tag,
+                                    max_thinking_tokens, max_generation_seconds, options=options, echo=echo)
+        request = dict(model=model, messages=build_generator_messages(model_input, system_prompt))
+        if options:
+            request['options'] = options
+        response: ChatResponse = create_chat(**request)
+        telemetry.note_ollama(response)
+    chat_message, thinking_steps = split_thinking(response['message']['content'], think_tag, think_end_tag)
+    return chat_message, thinking_steps, None
+
 def run_generator(model: str, 
                 model_input: str, 
                 system_prompt: str, 
                 think_tag: str,
-                think_end_tag: str):
+                think_end_tag: str,
+                stream: bool = False,
+                max_thinking_tokens: int = None,
+                max_generation_seconds: float = None,
+                prefetched=None):
   
   """Chat with an Ollama reasoning model, which has designated thinking tags.
     
@@ -30,44 +269,155 @@ def run_generator(model: str,
         system_prompt (str): System prompt to set context/behavior.
         think_tag (str): Tag for the start of thinking steps
         think_end_tag (str): Tag for the end of thinking steps
+        stream (bool): Stream the response and emit thinking tokens as they arrive
+        max_thinking_tokens (int): With stream, abort once thinking exceeds this many tokens
+        max_generation_seconds (float): With stream, abort once generation exceeds this many seconds
+        prefetched (Future): A `fetch_generation` call already running for this system prompt,
+            whose result is displayed instead of generating again
         
     Returns:
         chat_message (str): The model's response text
-        thinking_steps (list[str]): The model's thinking steps"""
+        thinking_steps (list[str]): The model's thinking steps
 
-  # Call Ollama 
-  with console.status("[bold green]🤔 Generating reasoning model response...[/bold green]"):
-    response: ChatResponse = chat(model=model, messages=[
-        {
-        'role': 'system',
-        'content': system_prompt,
-        },
-        {
-        'role': 'user',
-        'content': model_input,
-        },
-    ])
+    Raises:
+        GenerationAborted: If a streamed generation exceeded its budget"""
 
-    console.print("[bold green]✓[/bold green] Reasoning model response generated")
+  if prefetched is not None:
+    events.emit(Waiting("⚡ Collecting the speculatively started response..."))
+    chat_message, thinking_steps, timings = prefetched.result()
+  elif stream:
+    chat_message, thinking_steps, timings = fetch_generation(model, model_input, system_prompt, think_tag, think_end_tag,
+                                                             stream, max_thinking_tokens, max_generation_seconds)
+  else:
+    # Call Ollama 
+    events.emit(Waiting("🤔 Generating reasoning model response..."))
+    chat_message, thinking_steps, timings = fetch_generation(model, model_input, system_prompt, think_tag, think_end_tag)
 
-  # Response
-  chat_message = response['message']['content']
+  # Streamed thinking was already sent live, unless it ran in the background
+  events.emit(Generated(chat_message, thinking_steps, timings, show_thinking=timings is None or prefetched is not None))
+  
+  return chat_message, thinking_steps
 
-  # Extract thinking content (if present) and remaining message
-  thinking_steps = ""
-  if chat_message.startswith(think_tag):
-      # Split on end tag to separate thinking content from rest of message
-      think_content, chat_message = chat_message[len(think_tag):].split(think_end_tag, 1)
-      thinking_steps = think_content.strip()  
+def run_sampled_evaluation(reasoning_model: str,
+                           claude_model: str,
+                           reasoning_model_objective: str,
+                           reasoning_model_input: str,
+                           system_prompt: str,
+                           think_tag: str,
+                           think_end_tag: str,
+                           test: SequentialPassRateTest,
+                           concurrency: int = 4,
+                           stream: bool = False,
+                           max_thinking_tokens: int = None,
+                           max_generation_seconds: float = None) -> dict:
+    """Grade a system prompt on several independent samples until the verdict is settled.
 
-  if thinking_steps:
-      console.print("\n[bold green]Thinking Steps:[/bold green]")
-      console.print(Panel(thinking_steps, border_style="green"))
+    Samples are drawn with distinct seeds and generated and graded `concurrency` at a time.
+    Every graded sample updates `test`, and no new samples are started once it has decided.
 
-  console.print("\n[bold green]Model Response:[/bold green]")
-  console.print(Panel(chat_message, border_style="green"))
-  
-  return chat_message, thinking_steps
+    Args:
+        reasoning_model (str): The name of the reasoning model to use
+        claude_model (str): The name of the model to use for evaluation
+        reasoning_model_objective (str): The task objective that responses should meet
+        reasoning_model_input (str): The user input to test with
+        system_prompt (str): The system prompt being evaluated
+        think_tag (str): Tag for the start of thinking steps
+        think_end_tag (str): Tag for the end of thinking steps
+        test (SequentialPassRateTest): Sequential test that decides when to stop
+        concurrency (int): Number of samples in flight at once
+        stream (bool): Stream generations so budgets can abort runaway thinking
+        max_thinking_tokens (int): With stream, fail a sample once thinking exceeds this many tokens
+        max_generation_seconds (float): With stream, fail a sample once generation exceeds this many seconds
+
+    Returns:
+        dict: Evaluation results containing:
+            - passed (bool): The sequential test's verdict
+            - justification (str): Sample statistics, plus an example grader justification
+            - samples (list[dict]): Counted samples with response, thinking and grade
+            - example (dict): A sample whose grade agrees with the verdict
+    """
+
+    def draw_sample(seed):
+        try:
+            chat_message, thinking_steps, _ = fetch_generation(reasoning_model, reasoning_model_input, system_prompt,
+                                                               think_tag, think_end_tag, stream, max_thinking_tokens,
+                                                               max_generation_seconds, options={'seed': seed}, echo=False)
+        except GenerationAborted as e:
+            return {'response': e.chat_message, 'thinking': e.thinking_steps,
+                    'grade': e.grade()}
+        grade = pregrader.pregrade(reasoning_model_objective, reasoning_model_input, chat_message)
+        if grade is not None:
+            return {'response': chat_message, 'thinking': thinking_steps, 'grade': grade}
+        with telemetry.stage("evaluator"):
+            message = create_message(hedge=True, **build_evaluator_request(claude_model, reasoning_model_objective,
+                                                                           reasoning_model_input, chat_message))
+            telemetry.note_anthropic(message.usage)
+        return {'response': chat_message, 'thinking': thinking_steps, 'grade': message.content[0].input}
+
+    samples = []
+    events.emit(Waiting("🎲 Sampling and grading reasoning model responses..."))
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    try:
+        pending = set()
+        seed = 0
+        while not test.decided:
+            while len(pending) < concurrency and test.samples + len(pending) < test.max_samples:
+                # Copy the context so samples are recorded under the current attempt's span
+                pending.add(executor.submit(contextvars.copy_context().run, draw_sample, seed))
+                seed += 1
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if test.decided:
+                    break
+                sample = future.result()
+                samples.append(sample)
+                test.update(sample['grade']['passed'])
+                events.emit(SampleGraded(test.samples, sample['grade']['passed'], test.estimate))
+    finally:
+        # Samples still in flight once the verdict is settled are not waited for
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    # A sample that agrees with the verdict: a failure to diagnose, or a pass to report
+    example = next((sample for sample in samples if sample['grade']['passed'] == test.passed), samples[0])
+    return {
+        'passed': test.passed,
+        'justification': f"{test.describe()}. Example: {example['grade']['justification']}",
+        'samples': samples,
+        'example': example,
+        # A verdict that counted budget-aborted or pre-graded samples depends on those settings
+        'local': any(sample['grade'].get('local') for sample in samples),
+    }
+
+def build_evaluator_request(model, reasoning_model_objective, reasoning_model_input, reasoning_model_response):
+    """Build the Claude Messages API request used to grade a reasoning model response.
+    
+    The request is laid out for Anthropic prompt caching: the grading tool, system prompt,
+    objective and input are cache breakpoints in that order, and only the response being
+    graded follows the last one.
+    
+    Returns:
+        dict: Keyword arguments for `messages.create`
+    """
+
+    return dict(
+        model=model,
+        max_tokens=1024,
+        system=[text_block(evaluator_system_prompt, cache=True)],
+        tools=[
+            {**grade_response_schema, "cache_control": {"type": "ephemeral"}}
+        ],
+        tool_choice={"type": "tool", "name": "grade_response"},
+        messages=[
+            {
+                "role": "user", 
+                "content": [
+                    text_block(objective_prompt.format(reasoning_model_objective=reasoning_model_objective), cache=True),
+                    text_block(input_prompt.format(reasoning_model_input=reasoning_model_input), cache=True),
+                    text_block(evaluator_output_prompt.format(reasoning_model_response=reasoning_model_response)),
+                ]
+            }
+        ]
+        )
 
 def run_evaluator(model, reasoning_model_objective, reasoning_model_input, reasoning_model_response):
     """Evaluates an AI model's response against a given objective using Claude.
@@ -83,33 +433,86 @@ def run_evaluator(model, reasoning_model_objective, reasoning_model_input, reaso
             - passed (bool): Whether the response meets requirements
             - justification (str): Brief explanation of the grading decision
     """
-     
-    # Format the input
-    input_formatted=evaluator_input_prompt.format(reasoning_model_objective=reasoning_model_objective, 
-                                                  reasoning_model_input=reasoning_model_input, 
-                                                  reasoning_model_response=reasoning_model_response)
 
-    with console.status("[bold green]🤔 Evaluating reasoning model response...[/bold green]"):
+    grade = pregrader.pregrade(reasoning_model_objective, reasoning_model_input, reasoning_model_response)
+    if grade is not None:
+        events.emit(Notice("Reasoning model response failed the pre-grader, Claude judge skipped", "done"))
+        return grade
+
+    events.emit(Waiting("🤔 Evaluating reasoning model response..."))
+    with telemetry.stage("evaluator"):
         # Run the evaluator
-        message = client.messages.create(
-            model=model,
-            max_tokens=1024,
-            system=evaluator_system_prompt,
-            tools=[
-                grade_response_schema
-            ],
-            tool_choice={"type": "tool", "name": "grade_response"},
-            messages=[
-                {
-                    "role": "user", 
-                    "content": input_formatted
-                }
-            ]
-            )
-
-    console.print("[bold green]✓[/bold green] Reasoning model response evaluated")
+        message = create_message(hedge=True, **build_evaluator_request(model, 
+                                                                    reasoning_model_objective, 
+                                                                    reasoning_model_input, 
+                                                                    reasoning_model_response))
+        telemetry.note_anthropic(message.usage)
+
+    events.emit(Notice("Reasoning model response evaluated", "done"))
+    events.emit(Notice(f"Prompt cache: {format_cache_usage(message.usage)}", "detail"))
     return message.content[0].input
 
+def build_meta_prompt_request(model,
+                              reasoning_model_objective, 
+                              reasoning_model_system_prompt, 
+                              reasoning_model_input, 
+                              reasoning_model_thinking, 
+                              reasoning_model_response,
+                              grader_feedback,
+                              medical_report,
+                              num_candidates=1):
+    """Build the Claude Messages API request for the meta-prompt analysis step.
+    
+    With `num_candidates` above one, the request asks for that many alternative
+    `<improved_prompt>` sections instead of one.
+    
+    Returns:
+        dict: Keyword arguments for `messages.create`
+    """
+
+    # Stable-first layout: objective and input never change within a case. The medical
+    # report is one block per entry, and once compaction starts the latest entries are
+    # summarized on the next call, so besides the breakpoint after the last entry there is
+    # one after the last summary (see `CompactHistory`), the prefix the next call repeats
+    stable = getattr(medical_report, 'stable', 0)
+    if isinstance(medical_report, str):
+        medical_report = [medical_report]
+    report_blocks = [text_block(entry) for entry in medical_report] or [text_block("No prior attempts.")]
+    report_blocks[0]["text"] = medical_report_start + report_blocks[0]["text"]
+    report_blocks[-1]["cache_control"] = {"type": "ephemeral"}
+    if 0 < stable < len(report_blocks):
+        report_blocks[stable - 1]["cache_control"] = {"type": "ephemeral"}
+
+    attempt_formatted = meta_prompt_attempt.format(reasoning_model_system_prompt=reasoning_model_system_prompt, 
+                                                   reasoning_model_thinking=reasoning_model_thinking, 
+                                                   reasoning_model_response=reasoning_model_response,
+                                                   grader_feedback=grader_feedback)
+    if num_candidates > 1:
+        attempt_formatted += meta_prompt_candidates.format(num_candidates=num_candidates)
+
+    return dict(
+        model=model,
+        # 4096 is the output limit of the default model without a beta header, candidates included
+        max_tokens=4096,
+        system=[text_block(meta_prompt_system, cache=True)],
+        messages=[{"role": "user", "content": [
+            # The input's breakpoint covers the objective too; the API allows four breakpoints
+            text_block(objective_prompt.format(reasoning_model_objective=reasoning_model_objective)),
+            text_block(input_prompt.format(reasoning_model_input=reasoning_model_input), cache=True),
+            *report_blocks,
+            text_block(medical_report_end + attempt_formatted),
+        ]}],
+        temperature=0.1,
+        )
+
+def parse_meta_prompt(reasoning_model_diagnosis: str) -> dict:
+    """Extract the assessment, suggestions and improved prompt from a meta-prompt response."""
+    return {
+        'assessment': extract_xml(reasoning_model_diagnosis, 'assessment'),
+        'suggestions': extract_xml(reasoning_model_diagnosis, 'suggestions'),
+        'improved_prompt': extract_xml(reasoning_model_diagnosis, 'improved_prompt')
+    }
+
 def run_meta_prompt(model,
                     reasoning_model_objective, 
                     reasoning_model_system_prompt, 
@@ -117,11 +520,14 @@ def run_meta_prompt(model,
                     reasoning_model_thinking, 
                     reasoning_model_response,
                     grader_feedback,
-                    medical_report):
+                    medical_report,
+                    on_section=None):
     """Analyzes an AI model's performance and generates improved system prompts using Claude.
     
     This function evaluates the model's reasoning process and output quality, then provides
     feedback and suggestions for improvement through an expert system analyst perspective.
+    The response is streamed, and each section is handed to `on_section` as soon as its
+    closing tag arrives; the human-facing assessment comes last and is printed live.
     
     Args:
         model (str): The name of the model to use for evaluation
@@ -131,33 +537,59 @@ def run_meta_prompt(model,
         reasoning_model_thinking (str): The model's intermediate reasoning or thinking steps
         reasoning_model_response (str): The model's final response or output
         grader_feedback (str): Feedback from the grader that the output didn't meet the task
-        medical_report (str]: Medical report on prior attempts
+        medical_report (list[str]): Medical report on prior attempts, e.g. a `CompactHistory`
+        on_section (callable): Called with (tag, content) as each section completes
     Returns:
         str: A structured analysis containing:
             - Assessment of the model's performance
             - Specific suggestions for improvement
             - An improved version of the system prompt"""
 
-    # Format the meta prompt
-    input_formatted = meta_prompt_input.format(reasoning_model_objective=reasoning_model_objective, 
-                                     reasoning_model_system_prompt=reasoning_model_system_prompt, 
-                                     reasoning_model_input=reasoning_model_input, 
-                                     reasoning_model_thinking=reasoning_model_thinking, 
-                                     reasoning_model_response=reasoning_model_response,
-                                     grader_feedback=grader_feedback,
-                                     medical_report=medical_report)
-
-    # Response
-    with console.status("[bold green]🔄 Analyzing and improving prompt...[/bold green]"):
-        response = client.messages.create(
-            model=model,
-            max_tokens=4096,
-            system=meta_prompt_system,
-            messages=[{"role": "user", "content": input_formatted}],
-            temperature=0.1,
-            )
+    request = build_meta_prompt_request(model,
+                                        reasoning_model_objective, 
+                                        reasoning_model_system_prompt, 
+                                        reasoning_model_input, 
+                                        reasoning_model_thinking, 
+                                        reasoning_model_response,
+                                        grader_feedback,
+                                        medical_report)
+    parser = TagStreamParser(META_PROMPT_SECTIONS)
+    echoed = None
+
+    def echo_assessment(text):
+        nonlocal echoed
+        if text[echoed or 0:]:
+            events.emit(AssessmentChunk(text[echoed or 0:]))
+        echoed = len(text)
+
+    def consume(text):
+        for tag, content in parser.feed(text):
+            if tag == 'assessment':
+                echo_assessment(content)
+                events.emit(StreamEnded("assessment"))
+            else:
+                events.emit(Notice(f"{tag.replace('_', ' ').capitalize()} received", "done"))
+            if on_section:
+                on_section(tag, content)
+        if parser.tag == 'assessment':
+            echo_assessment(parser.partial())
+
+    events.emit(Notice("🔄 Analyzing and improving prompt...", "status"))
+    with telemetry.stage("meta_prompt"):
+        response = cache.active_cache.lookup("anthropic", request, Message) if cache.active_cache is not None else None
+        if response is not None:
+            consume(response.content[0].text)
+        else:
+            with scheduler.stream_message(client, **request) as stream:
+                for text in stream.text_stream:
+                    consume(text)
+                response = stream.get_final_message()
+            if cache.active_cache is not None:
+                cache.active_cache.store("anthropic", request, response)
+        telemetry.note_anthropic(response.usage)
     
-    console.print("[bold green]✓[/bold green] Prompt analyzed and improved")
+    events.emit(Notice("Prompt analyzed and improved", "done"))
+    events.emit(Notice(f"Prompt cache: {format_cache_usage(response.usage)}", "detail"))
     
     return response.content[0].text
 
@@ -187,7 +619,16 @@ def run_prompt_lab(reasoning_model: str,
                    reasoning_model_system_prompt: str,
                    think_tag: str,
                    think_end_tag: str,
-                   max_attempts: int) -> str:
+                   max_attempts: int,
+                   stream: bool = False,
+                   max_thinking_tokens: int = None,
+                   max_generation_seconds: float = None,
+                   context_budget: int = 8000,
+                   recent_attempts: int = 2,
+                   count_tokens_api: bool = False,
+                   samples: int = 1,
+                   sample_concurrency: int = 4,
+                   pass_rate: float = 0.7) -> str:
     """Run the prompt lab to test and improve system prompts.
     
     Args:
@@ -199,6 +640,15 @@ def run_prompt_lab(reasoning_model: str,
         think_tag: Tag for the start of thinking steps
         think_end_tag: Tag for the end of thinking steps
         max_attempts: Maximum number of improvement attempts
+        stream: Stream generations and print thinking tokens as they arrive
+        max_thinking_tokens: With stream, fail an attempt once thinking exceeds this many tokens
+        max_generation_seconds: With stream, fail an attempt once generation exceeds this many seconds
+        context_budget: Token budget for the medical history and thinking trace sent to the meta-prompt
+        recent_attempts: Number of latest attempts kept verbatim in the meta-prompt's medical history
+        count_tokens_api: Calibrate the token estimator with Claude's count-tokens endpoint
+        samples: Maximum samples per attempt; above one, a sequential test on the pass rate decides
+        sample_concurrency: Number of samples generated and graded at once
+        pass_rate: Pass rate a prompt needs when sampling
         
     Returns:
         str: A complete medical-style report of the prompt improvement process
@@ -209,78 +659,185 @@ def run_prompt_lab(reasoning_model: str,
                     f"\n## Patient Information: {reasoning_model}",
                     f"\n**Treatment Objective**: {reasoning_model_objective}",
                     "\n## Treatment History"]
+
+    # Structured history of prior attempts, compacted into the meta-prompt's context budget
+    treatment_history = []
+    count_tokens = estimate_tokens
+
+    # The next attempt's generation starts as soon as the meta-prompt's improved prompt
+    # closes, while the assessment is still streaming; holds (system prompt, span, future)
+    speculative_executor = ThreadPoolExecutor(max_workers=1)
+    speculation = None
+
+    def start_next_generation(tag, content):
+        nonlocal speculation
+        if tag != 'improved_prompt' or samples > 1 or attempt >= max_attempts:
+            return
+        next_span = telemetry.span(attempt=attempt + 1)
+        # The caller's context carries its event sink, e.g. a server job's stream
+        speculation = (content, next_span, speculative_executor.submit(contextvars.copy_context().run, next_span.run,
+                                                                       fetch_generation, reasoning_model,
+                                                                       reasoning_model_input, content, think_tag, think_end_tag,
+                                                                       stream, max_thinking_tokens, max_generation_seconds,
+                                                                       echo=False))
+        events.emit(Notice("⚡ Started the next attempt's generation with the improved prompt", "detail"))
      
     attempt = 1
+    store.record_prompt(reasoning_model_system_prompt)
     
     # Run the loop
     while attempt <= max_attempts:
-        console.print(f"\n[bold green]🔄 Attempt {attempt}/{max_attempts}[/bold green]")
-
-        # Step 1: Run generator
-        console.print("[green]Step 1: Running generator with system prompt:[/green]")
-        console.print(Panel(reasoning_model_system_prompt, title="Current System Prompt", border_style="green"))
+        # The span already exists when this attempt's generation was started speculatively
+        with speculation[1] if speculation is not None else telemetry.span(attempt=attempt):
+            # Step 1: Run generator
+            events.emit(AttemptStarted(attempt, max_attempts, reasoning_model_system_prompt))
        
-        # Run the generator
-        reasoning_model_response, reasoning_model_thinking = run_generator(
-            model=reasoning_model,
-            model_input=reasoning_model_input, 
-            system_prompt=reasoning_model_system_prompt,
-            think_tag=think_tag,
-            think_end_tag=think_end_tag
-        )
-        
-        # Grade the response
-        # Step 2: Grade the response
-        console.print("\n[green]Step 2: Evaluating response...[/green]")
-        grade = run_evaluator(model=claude_model, reasoning_model_objective=reasoning_model_objective, reasoning_model_input=reasoning_model_input, reasoning_model_response=reasoning_model_response)
-
-        status = "✅ PASSED" if grade['passed'] else "❌ FAILED"
-        console.print(f"[bold]Evaluation Result:[/bold] {status}")
-        console.print(f"[bold]Justification:[/bold] {grade['justification']}")
-
-        # Generate report entry
-        parsed_response = None
-        if not grade['passed']:
-            console.print("\n[green]Step 3: Response failed evaluation, running meta-prompt analysis...[/green]")
-            reasoning_model_diagnosis = run_meta_prompt(
-                model=claude_model,
-                reasoning_model_objective=reasoning_model_objective, 
-                reasoning_model_system_prompt=reasoning_model_system_prompt, 
-                reasoning_model_input=reasoning_model_input, 
-                reasoning_model_thinking=reasoning_model_thinking, 
-                reasoning_model_response=reasoning_model_response,
-                grader_feedback=grade['justification'],
-                medical_report=medical_report
-            )
-
-            console.print("\n[green]Step 4: Extracting improvements from analysis...[/green]")
-            parsed_response = {
-                'assessment': extract_xml(reasoning_model_diagnosis, 'assessment'),
-                'suggestions': extract_xml(reasoning_model_diagnosis, 'suggestions'),
-                'improved_prompt': extract_xml(reasoning_model_diagnosis, 'improved_prompt')
-            }
+            # Completed steps of a resumed session are replayed from its log
+            generation = session.replay('generation', attempt, system_prompt=reasoning_model_system_prompt)
+            grade = session.replay('grade', attempt) if generation is not None else None
+            if generation is not None:
+                events.emit(Notice(f"↺ Replayed attempt {attempt}'s generation from the session log", "detail"))
+                reasoning_model_response, reasoning_model_thinking = generation['response'], generation['thinking']
+                if speculation is not None:
+                    speculation[2].cancel()
+                    speculation = None
+            elif samples > 1:
+                # Step 1-2: Draw and grade samples until the pass rate verdict is settled
+                events.emit(Notice(f"Step 1-2: Sampling up to {samples} responses and grading them...", "section"))
+                evaluation = run_sampled_evaluation(
+                    reasoning_model=reasoning_model,
+                    claude_model=claude_model,
+                    reasoning_model_objective=reasoning_model_objective,
+                    reasoning_model_input=reasoning_model_input,
+                    system_prompt=reasoning_model_system_prompt,
+                    think_tag=think_tag,
+                    think_end_tag=think_end_tag,
+                    test=SequentialPassRateTest(pass_rate=pass_rate, max_samples=samples),
+                    concurrency=sample_concurrency,
+                    stream=stream,
+                    max_thinking_tokens=max_thinking_tokens,
+                    max_generation_seconds=max_generation_seconds
+                )
+                reasoning_model_response = evaluation['example']['response']
+                reasoning_model_thinking = evaluation['example']['thinking']
+                grade = {'passed': evaluation['passed'], 'justification': evaluation['justification']}
+            else:
+                # Reuse the speculatively started generation if it used this exact prompt
+                prefetched = None
+                if speculation is not None:
+                    speculative_prompt, _, future = speculation
+                    speculation = None
+                    if speculative_prompt == reasoning_model_system_prompt:
+                        prefetched = future
+                    else:
+                        future.cancel()
+
+                # Run the generator
+                try:
+                    reasoning_model_response, reasoning_model_thinking = run_generator(
+                        model=reasoning_model,
+                        model_input=reasoning_model_input, 
+                        system_prompt=reasoning_model_system_prompt,
+                        think_tag=think_tag,
+                        think_end_tag=think_end_tag,
+                        stream=stream,
+                        max_thinking_tokens=max_thinking_tokens,
+                        max_generation_seconds=max_generation_seconds,
+                        prefetched=prefetched
+                    )
+                except GenerationAborted as e:
+                    # A runaway generation fails the attempt without a grading call, but its
+                    # partial thinking trace still goes to the meta-prompt for diagnosis
+                    events.emit(Notice(f"⏹ {e}", "warning"))
+                    reasoning_model_response, reasoning_model_thinking = e.chat_message, e.thinking_steps
+                    grade = e.grade()
+
+            if generation is None:
+                session.record('generation', attempt, {'system_prompt': reasoning_model_system_prompt,
+                                                       'response': reasoning_model_response,
+                                                       'thinking': reasoning_model_thinking})
+            if grade is None:
+                # Grade the response
+                # Step 2: Grade the response
+                events.emit(Notice("Step 2: Evaluating response...", "section"))
+                grade = run_evaluator(model=claude_model, reasoning_model_objective=reasoning_model_objective, reasoning_model_input=reasoning_model_input, reasoning_model_response=reasoning_model_response)
+                session.record('grade', attempt, grade)
+            elif generation is None:
+                session.record('grade', attempt, grade)
+
+            store.record_grade(reasoning_model_system_prompt, reasoning_model_objective, reasoning_model_input,
+                               reasoning_model, claude_model, grade, reasoning_model_response, reasoning_model_thinking)
+
+            events.emit(Graded(attempt, grade['passed'], grade['justification']))
+
+            # Generate report entry
+            parsed_response = None
+            if not grade['passed']:
+                events.emit(Notice("Step 3: Response failed evaluation, running meta-prompt analysis...", "section"))
+                if count_tokens_api and count_tokens is estimate_tokens:
+                    sample = "".join(render_attempt(entry) for entry in treatment_history) + reasoning_model_thinking
+                    if sample:
+                        calibration = session.replay('calibration', attempt)
+                        if calibration is None:
+                            calibration = {'tokens': count_message_tokens(
+                                model=claude_model, messages=[{"role": "user", "content": sample}]).input_tokens}
+                            session.record('calibration', attempt, calibration)
+                        count_tokens = calibrated_estimator(sample, calibration['tokens'])
+                medical_history, selected_thinking = build_meta_prompt_context(
+                    treatment_history,
+                    reasoning_model_thinking,
+                    focus=f"{grade['justification']}\n{reasoning_model_objective}",
+                    budget_tokens=context_budget,
+                    recent_attempts=recent_attempts,
+                    count_tokens=count_tokens
+                )
+                diagnosis = session.replay('diagnosis', attempt)
+                if diagnosis is not None:
+                    events.emit(Notice(f"↺ Replayed attempt {attempt}'s diagnosis from the session log", "detail"))
+                    reasoning_model_diagnosis = diagnosis['text']
+                else:
+                    reasoning_model_diagnosis = run_meta_prompt(
+                        model=claude_model,
+                        reasoning_model_objective=reasoning_model_objective, 
+                        reasoning_model_system_prompt=reasoning_model_system_prompt, 
+                        reasoning_model_input=reasoning_model_input, 
+                        reasoning_model_thinking=selected_thinking, 
+                        reasoning_model_response=reasoning_model_response,
+                        grader_feedback=grade['justification'],
+                        medical_report=medical_history,
+                        on_section=start_next_generation
+                    )
+                    session.record('diagnosis', attempt, {'text': reasoning_model_diagnosis})
+
+                events.emit(Notice("Step 4: Extracting improvements from analysis...", "section"))
+                parsed_response = parse_meta_prompt(reasoning_model_diagnosis)
+                treatment_history.append(history_entry(attempt, reasoning_model_system_prompt, grade, parsed_response))
+                store.record_prompt(parsed_response['improved_prompt'], parent=reasoning_model_system_prompt,
+                                    attempt=attempt, suggestions=parsed_response['suggestions'])
             
-            # Update system prompt for next attempt
-            # Step 5: Update system prompt for next attempt
-            console.print("\n[green]Step 5: Updating system prompt for next attempt...[/green]")
-            reasoning_model_system_prompt = parsed_response['improved_prompt']
+                # Update system prompt for next attempt
+                # Step 5: Update system prompt for next attempt
+                events.emit(Prescribed(attempt, parsed_response['improved_prompt']))
+                reasoning_model_system_prompt = parsed_response['improved_prompt']
         
-        # Add to medical report
-        medical_report.append(generate_report_entry(attempt, grade, parsed_response))
+            # Add to medical report
+            medical_report.append(generate_report_entry(attempt, grade, parsed_response))
         
-        # Check if we should continue
-        if grade['passed']:
-            medical_report.extend([
-                "\n## 🎉 Final Diagnosis",
-                "\nPatient has achieved optimal response quality. Treatment successful!",
-                "\n### Final System Prompt:",
-                f"\n```\n{reasoning_model_system_prompt}\n```",
-                "\n### Final Response:",
-                f"\n```\n{reasoning_model_response}\n```"
-            ])
-            break
+            # Check if we should continue
+            if grade['passed']:
+                medical_report.extend([
+                    "\n## 🎉 Final Diagnosis",
+                    "\nPatient has achieved optimal response quality. Treatment successful!",
+                    "\n### Final System Prompt:",
+                    f"\n```\n{reasoning_model_system_prompt}\n```",
+                    "\n### Final Response:",
+                    f"\n```\n{reasoning_model_response}\n```"
+                ])
+                break
         
-        attempt += 1
+            attempt += 1
+
+    speculative_executor.shutdown(wait=False, cancel_futures=True)
 
     if attempt > max_attempts:
         medical_report.extend([
@@ -328,9 +885,266 @@ if __name__ == "__main__":
     parser.add_argument('--think-end-tag', 
                        default="</think>",
                        help='Tag for the end of thinking steps')
+
+    parser.add_argument('--dataset', 
+                       default=None,
+                       help='JSONL test suite to run as a pipelined batch instead of a single --input')
+
+    parser.add_argument('--generator-concurrency', 
+                       type=int,
+                       default=1,
+                       help='Concurrent Ollama requests in dataset mode')
+
+    parser.add_argument('--evaluator-concurrency', 
+                       type=int,
+                       default=4,
+                       help='Concurrent Claude grading requests in dataset mode')
+
+    parser.add_argument('--meta-concurrency', 
+                       type=int,
+                       default=4,
+                       help='Concurrent Claude meta-prompt requests in dataset mode')
+
+    parser.add_argument('--queue-size', 
+                       type=int,
+                       default=16,
+                       help='Capacity of each stage queue in dataset mode')
+
+    parser.add_argument('--batch-evaluation', 
+                       action='store_true',
+                       help='In dataset mode, grade each round with one Message Batch instead of individual requests')
+
+    parser.add_argument('--batch-poll-interval', 
+                       type=float,
+                       default=30.0,
+                       help='Seconds between Message Batch status checks')
+
+    parser.add_argument('--search', 
+                       action='store_true',
+                       help='Beam search over candidate prompts; --max-attempts sets the number of rounds')
+
+    parser.add_argument('--beam-width', 
+                       type=int,
+                       default=2,
+                       help='Number of prompts kept after each search round')
+
+    parser.add_argument('--candidates', 
+                       type=int,
+                       default=3,
+                       help='Number of candidate prompts the meta-prompt proposes per beam prompt')
+
+    parser.add_argument('--samples', 
+                       type=int,
+                       default=1,
+                       help='Maximum responses sampled per attempt in interactive mode; a sequential test stops early once the verdict is clear')
+
+    parser.add_argument('--sample-concurrency', 
+                       type=int,
+                       default=4,
+                       help='Number of samples generated and graded at once')
+
+    parser.add_argument('--pass-rate', 
+                       type=float,
+                       default=0.7,
+                       help='Pass rate a prompt needs across samples when --samples is above one')
+
+    parser.add_argument('--stream', 
+                       action='store_true',
+                       help='Stream generations and print thinking tokens as they arrive')
+
+    parser.add_argument('--max-thinking-tokens', 
+                       type=int,
+                       default=None,
+                       help='With --stream, abort a generation once it thinks for more tokens than this')
+
+    parser.add_argument('--max-generation-seconds', 
+                       type=float,
+                       default=None,
+                       help='With --stream, abort a generation once it runs longer than this')
+
+    parser.add_argument('--context-budget', 
+                       type=int,
+                       default=8000,
+                       help='Token budget for the medical history and thinking trace sent to the meta-prompt')
+
+    parser.add_argument('--recent-attempts', 
+                       type=int,
+                       default=2,
+                       help='Number of latest attempts kept verbatim in the meta-prompt history')
+
+    parser.add_argument('--count-tokens-api', 
+                       action='store_true',
+                       help="Calibrate token estimates with Claude's count-tokens endpoint instead of a local estimate")
+
+    parser.add_argument('--cache', 
+                       default=None,
+                       help='SQLite file for caching model responses across runs')
+
+    parser.add_argument('--cache-mode', 
+                       choices=["read-through", "write-only", "offline"],
+                       default="read-through",
+                       help='read-through serves hits and stores misses, write-only refreshes entries, offline replays without network calls')
+
+    parser.add_argument('--cache-max-mb', 
+                       type=int,
+                       default=512,
+                       help='Evict least recently used cache entries beyond this size')
+
+    parser.add_argument('--pregrade', 
+                       default="empty",
+                       help=f'Comma-separated local checks that fail responses before the Claude judge ({", ".join(pregrader.CHECKS)}), or "none"')
+
+    parser.add_argument('--require-tag', 
+                       action='append',
+                       default=[],
+                       help='Fail responses missing this XML tag without calling the judge (repeatable)')
+
+    parser.add_argument('--copy-threshold', 
+                       type=float,
+                       default=0.9,
+                       help='Share of response shingles found in the existing summary of the input at which the copy check fails it')
+
+    parser.add_argument('--ollama-host', 
+                       action='append',
+                       default=[],
+                       help='Ollama base URL to generate on (repeatable); requests are routed across hosts by load')
+
+    parser.add_argument('--keep-alive', 
+                       default="30m",
+                       help='How long Ollama keeps the reasoning model loaded between requests, e.g. 30m or -1 for forever')
+
+    parser.add_argument('--preload', 
+                       action=argparse.BooleanOptionalAction,
+                       default=True,
+                       help='Load and warm up the reasoning model in the background during the first Claude call (skipped when a generation comes first, or with a read-through or offline --cache)')
+
+    parser.add_argument('--rpm', 
+                       type=float,
+                       default=None,
+                       help='Claude requests per minute to stay under (default: learned from rate-limit headers)')
+
+    parser.add_argument('--tpm', 
+                       type=float,
+                       default=None,
+                       help='Claude tokens per minute to stay under (default: learned from rate-limit headers)')
+
+    parser.add_argument('--api-retries', 
+                       type=int,
+                       default=4,
+                       help='Retries of a Claude call on rate limit, overload, server or connection errors')
+
+    parser.add_argument('--hedge-percentile', 
+                       type=float,
+                       default=None,
+                       help='Send a duplicate grading call when one runs past this latency percentile, e.g. 95 (default: off)')
+
+    parser.add_argument('--telemetry', 
+                       default=None,
+                       help='Append per-attempt latency and token spans to this JSONL file')
+
+    parser.add_argument('--metrics-port', 
+                       type=int,
+                       default=None,
+                       help='Serve Prometheus metrics on this port at /metrics while running')
+
+    parser.add_argument('--store', 
+                       default=None,
+                       help='SQLite file keeping every prompt version and its memoized grades')
+
+    parser.add_argument('--regress', 
+                       nargs='*',
+                       default=None,
+                       metavar='PROMPT_HASH',
+                       help='Check stored prompts (hash prefixes, default: --system-prompt) against the suite, grading only pairs without a stored verdict')
+
+    parser.add_argument('--tournament', 
+                       nargs='+',
+                       default=None,
+                       metavar='MODEL',
+                       help='Grade every pair of these Ollama reasoning models and the candidate prompts on the suite')
+
+    parser.add_argument('--prompt-file', 
+                       action='append',
+                       default=[],
+                       help='File holding a candidate system prompt for --tournament (repeatable, default: --system-prompt)')
+
+    parser.add_argument('--session', 
+                       default=None,
+                       help='Log every completed step to this JSONL file so the run can be resumed')
+
+    parser.add_argument('--resume', 
+                       default=None,
+                       help='Resume the session logged in this file, replaying its completed steps')
+
+    parser.add_argument('--events', 
+                       choices=events.CONSUMERS,
+                       default="rich",
+                       help='How progress is reported: rendered on the console, written as JSON lines, or not at all')
+
+    parser.add_argument('--events-file', 
+                       default=None,
+                       help='With --events jsonl, append the events to this file instead of stdout')
+
+    parser.add_argument('--serve', 
+                       default=None,
+                       metavar='ADDRESS',
+                       help='Stay resident and run jobs posted to this port, host:port or unix socket path (containing a /), streaming their events back')
+
+    parser.add_argument('--max-jobs', 
+                       type=int,
+                       default=4,
+                       help='With --serve, the number of jobs run at once')
     
     args = parser.parse_args()
 
+    if args.resume:
+        if not os.path.exists(args.resume):
+            parser.error(f"no session log at {args.resume}")
+        # The resumed run keeps its original settings, unless a flag is given again
+        resumed = session.configure_session(args.resume, resume=True)
+        parser.set_defaults(**(resumed.settings or {}))
+        args = parser.parse_args()
+    elif args.session:
+        session.configure_session(args.session)
+    if args.regress is not None and not args.store:
+        parser.error("--regress needs a --store")
+    if args.serve:
+        from server import check_address
+        try:
+            check_address(args.serve)
+        except ValueError as e:
+            parser.error(str(e))
+    if args.samples > 1 and (args.dataset or args.search or args.tournament or args.regress is not None):
+        parser.error("--samples is only supported in interactive and --serve mode")
+    if args.store:
+        store.configure_store(args.store)
+    if session.active_session is not None:
+        if args.search or args.serve or args.tournament or args.regress is not None or (args.dataset and args.batch_evaluation):
+            parser.error("--session and --resume are not supported with --search, --serve, --tournament, --regress or --batch-evaluation")
+        session.active_session.start({name: value for name, value in vars(args).items() if name not in ('session', 'resume')})
+
+    events.configure_events(args.events, console, args.events_file)
+    # Deliver the queued events even if the run fails
+    atexit.register(events.close)
+
+    if args.cache:
+        cache.configure_cache(args.cache, mode=args.cache_mode, max_bytes=args.cache_max_mb * 1024 * 1024)
+
+    checks = [name.strip() for name in args.pregrade.split(",") if name.strip() and name.strip() != "none"]
+    unknown = [name for name in checks if name not in pregrader.CHECKS]
+    if unknown:
+        parser.error(f"unknown pre-grader checks: {', '.join(unknown)}")
+    pregrader.configure_pregrader(checks, args.think_tag, args.think_end_tag, args.require_tag, args.copy_threshold)
+    telemetry.configure_telemetry(args.telemetry, args.metrics_port)
+    if args.ollama_host:
+        hosts.configure_pool(args.ollama_host)
+    # A read-through or offline cache may serve every generation from disk, so the model is
+    # left to load on the first cache miss rather than preloaded and warmed up
+    preload = args.preload and (cache.active_cache is None or cache.active_cache.mode == "write-only")
+    residency.configure_residency(args.tournament[0] if args.tournament else args.local_reasoning_model,
+                                  args.keep_alive, preload=preload)
+    scheduler.configure_scheduler(args.rpm, args.tpm, args.api_retries, args.hedge_percentile)
+
     # Use default examples if no arguments provided as a test
     reasoning_model_objective = args.objective or """I am prompting a distilled reasoning model to produce research summaries. 
     I want it to be able to create a high quality summary and seamlessly integrate new search results into 
@@ -364,20 +1178,170 @@ if __name__ == "__main__":
     have improved models' ability to break down complex problems into smaller steps."""
     
     # Print header
-    console.print("\n[bold green]🧪 Starting Claude's Prompt Lab...[/bold green]\n", style="bold")
+    events.emit(Notice("🧪 Starting Claude's Prompt Lab...", "heading"))
     
     # Run the prompt lab
-    report = run_prompt_lab(
-        reasoning_model=args.local_reasoning_model,
-        claude_model=args.claude_model,
-        reasoning_model_input=reasoning_model_input,
-        reasoning_model_objective=reasoning_model_objective,
-        reasoning_model_system_prompt=reasoning_model_system_prompt,
-        think_tag=args.think_tag,
-        think_end_tag=args.think_end_tag,
-        max_attempts=args.max_attempts
-    )
+    if args.serve:
+        from server import serve
+        # Jobs run with the command line's settings unless they set their own
+        report = serve(args.serve, {
+            'reasoning_model': args.local_reasoning_model,
+            'claude_model': args.claude_model,
+            'reasoning_model_input': reasoning_model_input,
+            'reasoning_model_objective': reasoning_model_objective,
+            'reasoning_model_system_prompt': reasoning_model_system_prompt,
+            'think_tag': args.think_tag,
+            'think_end_tag': args.think_end_tag,
+            'max_attempts': args.max_attempts,
+            'stream': args.stream,
+            'max_thinking_tokens': args.max_thinking_tokens,
+            'max_generation_seconds': args.max_generation_seconds,
+            'context_budget': args.context_budget,
+            'recent_attempts': args.recent_attempts,
+            'count_tokens_api': args.count_tokens_api,
+            'samples': args.samples,
+            'sample_concurrency': args.sample_concurrency,
+            'pass_rate': args.pass_rate
+        }, max_jobs=args.max_jobs)
+    elif args.regress is not None:
+        from pipeline import load_dataset
+        from regress import run_regression
+        try:
+            prompts = [store.active_store.prompt(prefix) for prefix in args.regress] or \
+                      [store.active_store.prompt(store.active_store.add_prompt(reasoning_model_system_prompt))]
+        except KeyError as e:
+            parser.error(e.args[0])
+        report = asyncio.run(run_regression(
+            cases=load_dataset(args.dataset) if args.dataset else [{'input': reasoning_model_input}],
+            prompts=prompts,
+            reasoning_model=args.local_reasoning_model,
+            claude_model=args.claude_model,
+            reasoning_model_objective=reasoning_model_objective,
+            think_tag=args.think_tag,
+            think_end_tag=args.think_end_tag,
+            generator_concurrency=args.generator_concurrency,
+            evaluator_concurrency=args.evaluator_concurrency,
+            stream=args.stream,
+            max_thinking_tokens=args.max_thinking_tokens,
+            max_generation_seconds=args.max_generation_seconds
+        ))
+    elif args.tournament:
+        from pipeline import load_dataset
+        from tournament import run_tournament
+        try:
+            prompts = [open(path, encoding="utf-8").read() for path in args.prompt_file] or [reasoning_model_system_prompt]
+        except OSError as e:
+            parser.error(f"cannot read prompt file: {e}")
+        report = asyncio.run(run_tournament(
+            cases=load_dataset(args.dataset) if args.dataset else [{'input': reasoning_model_input}],
+            models=args.tournament,
+            prompts=prompts,
+            claude_model=args.claude_model,
+            reasoning_model_objective=reasoning_model_objective,
+            think_tag=args.think_tag,
+            think_end_tag=args.think_end_tag,
+            generator_concurrency=args.generator_concurrency,
+            evaluator_concurrency=args.evaluator_concurrency,
+            stream=args.stream,
+            max_thinking_tokens=args.max_thinking_tokens,
+            max_generation_seconds=args.max_generation_seconds
+        ))
+    elif args.search:
+        from pipeline import load_dataset
+        from search import run_prompt_search
+        report = asyncio.run(run_prompt_search(
+            cases=load_dataset(args.dataset) if args.dataset else [{'input': reasoning_model_input}],
+            reasoning_model=args.local_reasoning_model,
+            claude_model=args.claude_model,
+            reasoning_model_objective=reasoning_model_objective,
+            reasoning_model_system_prompt=reasoning_model_system_prompt,
+            think_tag=args.think_tag,
+            think_end_tag=args.think_end_tag,
+            max_rounds=args.max_attempts,
+            beam_width=args.beam_width,
+            num_candidates=args.candidates,
+            generator_concurrency=args.generator_concurrency,
+            evaluator_concurrency=args.evaluator_concurrency,
+            meta_concurrency=args.meta_concurrency,
+            stream=args.stream,
+            max_thinking_tokens=args.max_thinking_tokens,
+            max_generation_seconds=args.max_generation_seconds,
+            context_budget=args.context_budget,
+            recent_attempts=args.recent_attempts
+        ))
+    elif args.dataset and args.batch_evaluation:
+        from batch import run_dataset_batch
+        from pipeline import load_dataset
+        report = asyncio.run(run_dataset_batch(
+            cases=load_dataset(args.dataset),
+            reasoning_model=args.local_reasoning_model,
+            claude_model=args.claude_model,
+            reasoning_model_objective=reasoning_model_objective,
+            reasoning_model_system_prompt=reasoning_model_system_prompt,
+            think_tag=args.think_tag,
+            think_end_tag=args.think_end_tag,
+            max_attempts=args.max_attempts,
+            generator_concurrency=args.generator_concurrency,
+            meta_concurrency=args.meta_concurrency,
+            poll_interval=args.batch_poll_interval,
+            stream=args.stream,
+            max_thinking_tokens=args.max_thinking_tokens,
+            max_generation_seconds=args.max_generation_seconds,
+            context_budget=args.context_budget,
+            recent_attempts=args.recent_attempts
+        ))
+    elif args.dataset:
+        from pipeline import load_dataset, run_dataset
+        report = asyncio.run(run_dataset(
+            cases=load_dataset(args.dataset),
+            reasoning_model=args.local_reasoning_model,
+            claude_model=args.claude_model,
+            reasoning_model_objective=reasoning_model_objective,
+            reasoning_model_system_prompt=reasoning_model_system_prompt,
+            think_tag=args.think_tag,
+            think_end_tag=args.think_end_tag,
+            max_attempts=args.max_attempts,
+            generator_concurrency=args.generator_concurrency,
+            evaluator_concurrency=args.evaluator_concurrency,
+            meta_concurrency=args.meta_concurrency,
+            queue_size=args.queue_size,
+            stream=args.stream,
+            max_thinking_tokens=args.max_thinking_tokens,
+            max_generation_seconds=args.max_generation_seconds,
+            context_budget=args.context_budget,
+            recent_attempts=args.recent_attempts,
+            count_tokens_api=args.count_tokens_api
+        ))
+    else:
+        report = run_prompt_lab(
+            reasoning_model=args.local_reasoning_model,
+            claude_model=args.claude_model,
+            reasoning_model_input=reasoning_model_input,
+            reasoning_model_objective=reasoning_model_objective,
+            reasoning_model_system_prompt=reasoning_model_system_prompt,
+            think_tag=args.think_tag,
+            think_end_tag=args.think_end_tag,
+            max_attempts=args.max_attempts,
+            stream=args.stream,
+            max_thinking_tokens=args.max_thinking_tokens,
+            max_generation_seconds=args.max_generation_seconds,
+            context_budget=args.context_budget,
+            recent_attempts=args.recent_attempts,
+            count_tokens_api=args.count_tokens_api,
+            samples=args.samples,
+            sample_concurrency=args.sample_concurrency,
+            pass_rate=args.pass_rate
+        )
+
     
-    # Print the report with markdown formatting
-    console.print(Markdown(report))
-    console.print("\n[bold green]🎬 Prompt Lab Session Complete![/bold green]\n", style="bold")
\ No newline at end of file
+    # The consumer renders the report with markdown formatting, off the main thread
+    summaries = [component.summary() for component in (cache.active_cache, pregrader.active_pregrader, hosts.active_pool,
+                                                       residency.active_residency if preload else None,
+                                                       scheduler.active_scheduler,
+                                                       store.active_store, session.active_session)
+                 if component is not None]
+    events.emit(RunFinished(report, summaries))
+    events.close()
+    for component in (cache.active_cache, hosts.active_pool, store.active_store, session.active_session, telemetry.active_telemetry):
+        if component is not None:
+            component.close()
\ No newline at end of file
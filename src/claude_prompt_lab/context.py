@@ -0,0 +1,197 @@
+import math
+import re
+
+from utils import normalize_prompt
+
+def estimate_tokens(text: str) -> int:
+    """Local token estimate (about four characters per token for English prose)."""
+    return math.ceil(len(text) / 4)
+
+def calibrated_estimator(sample: str, sample_tokens: int):
+    """Build a token estimator fitted to a real token count for a sample text.
+
+    Pass the `input_tokens` from one count-tokens call on representative text, and the
+    returned estimator scales character counts by the observed characters-per-token ratio,
+    so the context builder can measure many candidate segments without further API calls.
+
+    Args:
+        sample (str): Text that was counted
+        sample_tokens (int): Its token count from the count-tokens endpoint
+
+    Returns:
+        callable: str -> int token estimator"""
+    chars_per_token = max(len(sample), 1) / max(sample_tokens, 1)
+    return lambda text: math.ceil(len(text) / chars_per_token)
+
+def history_entry(attempt, system_prompt, grade, parsed_response=None) -> dict:
+    """Structured record of one attempt, used to build the meta-prompt's medical history."""
+    entry = {
+        'attempt': attempt,
+        'system_prompt': system_prompt,
+        'passed': grade['passed'],
+        'justification': grade['justification'],
+    }
+    if parsed_response:
+        entry['suggestions'] = parsed_response['suggestions']
+    return entry
+
+def render_attempt(entry: dict) -> str:
+    """Full rendering of an attempt, used for the most recent attempts."""
+    lines = [f"Attempt {entry['attempt']}: {'PASSED' if entry['passed'] else 'FAILED'}",
+             f"Grader feedback: {entry['justification']}",
+             f"System prompt tested:\n```\n{entry['system_prompt']}\n```"]
+    if entry.get('suggestions'):
+        lines.append(f"Suggestions made: {entry['suggestions'].strip()}")
+    return "\n".join(lines) + "\n"
+
+def summarize_attempt(entry: dict, same_as: int = None) -> str:
+    """One-line summary of an older attempt, referring back to an identical earlier prompt."""
+    status = 'PASSED' if entry['passed'] else 'FAILED'
+    if same_as is not None:
+        prompt = f"same system prompt as attempt {same_as}"
+    else:
+        first_line = entry['system_prompt'].strip().splitlines()[0] if entry['system_prompt'].strip() else ""
+        prompt = f"system prompt starting \"{first_line[:120]}\""
+    return f"Attempt {entry['attempt']}: {status} with {prompt}. Grader feedback: {entry['justification']}\n"
+
+class CompactHistory(list):
+    """Rendered history entries, oldest first, that know how many of them are stable.
+
+    Summaries of older attempts never change once written, while the latest attempts are
+    rendered in full and summarized on later calls, so only the first `stable` entries are
+    repeated unchanged by the next meta-prompt call."""
+
+    def __init__(self, entries: list[str], stable: int = 0):
+        super().__init__(entries)
+        self.stable = stable
+
+def compact_history(history: list[dict], budget_tokens: int, recent_attempts: int = 2, count_tokens=estimate_tokens) -> CompactHistory:
+    """Fit the treatment history into a token budget.
+
+    The most recent attempts are kept verbatim and older ones are reduced to one-line
+    summaries, with repeated system prompts replaced by a reference to their first use.
+    If that is still over budget, fewer attempts are kept verbatim and finally the oldest
+    summaries are dropped.
+
+    Args:
+        history (list[dict]): Entries from `history_entry`, oldest first
+        budget_tokens (int): Token budget for the whole history
+        recent_attempts (int): Number of latest attempts to keep verbatim when they fit
+        count_tokens (callable): Token counter
+
+    Returns:
+        CompactHistory: One rendered entry per attempt kept, oldest first"""
+    first_use = {}
+    summaries = []
+    for entry in history:
+        key = normalize_prompt(entry['system_prompt'])
+        summaries.append(summarize_attempt(entry, first_use.get(key)))
+        first_use.setdefault(key, entry['attempt'])
+
+    for verbatim in range(min(recent_attempts, len(history)), -1, -1):
+        split = len(history) - verbatim
+        rendered = summaries[:split] + [render_attempt(entry) for entry in history[split:]]
+        if sum(count_tokens(text) for text in rendered) <= budget_tokens:
+            return CompactHistory(rendered, stable=split)
+
+    # Even the summaries do not fit, keep as many of the latest as possible
+    kept = []
+    used = 0
+    for text in reversed(summaries):
+        used += count_tokens(text)
+        if used > budget_tokens:
+            break
+        kept.insert(0, text)
+    omitted = len(summaries) - len(kept)
+    # Dropping the oldest summaries shifts every entry, so none is stable
+    return CompactHistory([f"({omitted} earlier attempts omitted)\n"] + kept if omitted else kept)
+
+def truncate_to_budget(text: str, budget_tokens: int, count_tokens=estimate_tokens) -> str:
+    """Cut the middle out of a text so it fits a token budget, keeping its start and end."""
+    marker = " [...] "
+    while True:
+        cost = count_tokens(text)
+        if cost <= budget_tokens:
+            return text
+        keep = int(len(text) * budget_tokens / cost) - len(marker)
+        if keep <= 0:
+            return ""
+        text = text[:keep - keep // 2] + marker + text[len(text) - keep // 2:]
+
+def select_thinking(thinking: str, budget_tokens: int, focus: str = "", count_tokens=estimate_tokens) -> str:
+    """Fit a reasoning trace into a token budget by keeping its most relevant segments.
+
+    The opening and closing paragraphs are always kept since they show how the model
+    framed the task and what it concluded. The remaining budget goes to the paragraphs
+    sharing the most words with `focus` (typically the grader feedback and objective).
+    Kept segments stay in their original order, with gaps marked.
+
+    Args:
+        thinking (str): The full thinking trace
+        budget_tokens (int): Token budget for the trace
+        focus (str): Text describing what went wrong, used to rank segments
+        count_tokens (callable): Token counter
+
+    Returns:
+        str: The trace, untouched if it already fits"""
+    if count_tokens(thinking) <= budget_tokens:
+        return thinking
+
+    segments = [segment for segment in re.split(r"\n\s*\n", thinking) if segment.strip()]
+    if len(segments) < 3:
+        segments = [segment for segment in re.split(r"(?<=[.!?])\s+", thinking) if segment.strip()]
+
+    focus_words = set(re.findall(r"\w{4,}", focus.lower()))
+    def relevance(index):
+        words = set(re.findall(r"\w{4,}", segments[index].lower()))
+        return len(words & focus_words) / (len(words) ** 0.5 or 1)
+
+    order = [0, len(segments) - 1] + sorted(range(1, len(segments) - 1), key=relevance, reverse=True)
+    kept = {}
+    used = 0
+    for index in order:
+        if index in kept:
+            continue
+        segment = segments[index]
+        cost = count_tokens(segment)
+        if cost > budget_tokens and used < budget_tokens:
+            # A runaway segment on its own is cut down rather than dropped, so there is
+            # still something to diagnose
+            segment = truncate_to_budget(segment, budget_tokens - used, count_tokens)
+            cost = count_tokens(segment)
+        if used + cost > budget_tokens:
+            continue
+        kept[index] = segment
+        used += cost
+
+    selected = []
+    for index in range(len(segments)):
+        if index in kept:
+            selected.append(kept[index])
+        elif not selected or selected[-1] != "[...]":
+            selected.append("[...]")
+    return "\n\n".join(selected)
+
+def build_meta_prompt_context(history: list[dict],
+                              thinking: str,
+                              focus: str,
+                              budget_tokens: int,
+                              recent_attempts: int = 2,
+                              count_tokens=estimate_tokens) -> tuple[list[str], str]:
+    """Fit the medical history and thinking trace for a meta-prompt call into a token budget.
+
+    The history may use at most half the budget; the thinking trace gets the rest.
+
+    Args:
+        history (list[dict]): Entries from `history_entry`, oldest first
+        thinking (str): Thinking trace of the attempt being diagnosed
+        focus (str): Grader feedback and objective, used to pick relevant thinking
+        budget_tokens (int): Combined token budget
+        recent_attempts (int): Number of latest attempts to keep verbatim when they fit
+        count_tokens (callable): Token counter
+
+    Returns:
+        tuple[CompactHistory, str]: Medical history entries and the selected thinking trace"""
+    medical_history = compact_history(history, budget_tokens // 2, recent_attempts, count_tokens)
+    history_tokens = sum(count_tokens(text) for text in medical_history)
+    return medical_history, select_thinking(thinking, budget_tokens - history_tokens, focus, count_tokens)
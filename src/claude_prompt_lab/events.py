@@ -0,0 +1,315 @@
+import contextvars
+import json
+import logging
+import queue
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict
+
+from rich.console import Console
+from rich.markdown import Markdown
+from rich.panel import Panel
+
+import telemetry
+
+CONSUMERS = ("rich", "jsonl", "none")
+
+# Rich markup per `Notice` level
+NOTICE_FORMATS = {
+    'heading': "\n[bold green]{}[/bold green]",
+    'status': "[bold green]{}[/bold green]",
+    'section': "\n[green]{}[/green]",
+    'step': "[green]{}[/green]",
+    'done': "[bold green]✓[/bold green] {}",
+    'detail': "[dim]{}[/dim]",
+    'warning': "\n[bold red]{}[/bold red]",
+    'info': "{}",
+}
+
+logger = logging.getLogger(__name__)
+
+# The process-wide event bus, if events are rendered or written anywhere
+active_bus = None
+
+# Whether `configure_events` has run; until then events are rendered on a console, so the
+# lab still reports progress when it is used as a library, e.g. from the notebook
+configured = False
+_configure_lock = threading.Lock()
+
+# Overrides `active_bus` for the current thread or task, e.g. to give one job its own stream
+current_sink = contextvars.ContextVar("event_sink", default=None)
+
+@dataclass
+class Notice:
+    """A progress line, rendered according to its level (see `NOTICE_FORMATS`)."""
+    text: str
+    level: str = "step"
+
+@dataclass
+class Waiting:
+    """A slow call has started; it is over at the next event."""
+    text: str
+
+@dataclass
+class AttemptStarted:
+    attempt: int
+    max_attempts: int
+    system_prompt: str
+
+@dataclass
+class ThinkingChunk:
+    """Thinking tokens of a streamed generation, as they arrive."""
+    text: str
+
+@dataclass
+class AssessmentChunk:
+    """Text of the meta-prompt's assessment, as it streams."""
+    text: str
+
+@dataclass
+class StreamEnded:
+    """The end of a run of `ThinkingChunk` or `AssessmentChunk` events."""
+    section: str
+
+@dataclass
+class Generated:
+    response: str
+    thinking: str
+    timings: dict = None
+    # False when the thinking was already sent as chunks
+    show_thinking: bool = True
+
+@dataclass
+class SampleGraded:
+    index: int
+    passed: bool
+    pass_rate: float
+
+@dataclass
+class Graded:
+    attempt: int
+    passed: bool
+    justification: str
+    case_id: str = None
+
+@dataclass
+class Prescribed:
+    """The meta-prompt's improved prompt for the next attempt."""
+    attempt: int
+    prompt: str
+
+@dataclass
+class CaseFinished:
+    case_id: str
+    finished: int
+    total: int
+    status: str
+    attempts: int
+    error: str = None
+
+@dataclass
+class RunFinished:
+    report: str
+    summaries: list
+
+def serialize(event, emitted_at: float) -> str:
+    """An event as a JSON object with its type, emission time and fields."""
+    return json.dumps({'event': type(event).__name__, 'time': emitted_at, **asdict(event)},
+                      ensure_ascii=False, default=str)
+
+class RichConsumer:
+    """Renders events on a rich console, with spinners for `Waiting` and panels for prompts and responses."""
+
+    def __init__(self, console):
+        self.console = console
+        self._status = None
+        self._streaming = None
+
+    def handle(self, event, emitted_at: float):
+        if self._status is not None:
+            self._status.stop()
+            self._status = None
+        console = self.console
+        if isinstance(event, Notice):
+            console.print(NOTICE_FORMATS.get(event.level, "{}").format(event.text))
+        elif isinstance(event, Waiting):
+            self._status = console.status(f"[bold green]{event.text}[/bold green]")
+            self._status.start()
+        elif isinstance(event, AttemptStarted):
+            console.print(f"\n[bold green]🔄 Attempt {event.attempt}/{event.max_attempts}[/bold green]")
+            console.print("[green]Step 1: Running generator with system prompt:[/green]")
+            console.print(Panel(event.system_prompt, title="Current System Prompt", border_style="green"))
+        elif isinstance(event, (ThinkingChunk, AssessmentChunk)):
+            section = "Thinking Steps" if isinstance(event, ThinkingChunk) else "Assessment"
+            if self._streaming != section:
+                console.print(f"\n[bold green]{section}:[/bold green]")
+                self._streaming = section
+            console.print(event.text, end="", style="dim green", markup=False, highlight=False)
+        elif isinstance(event, StreamEnded):
+            self._streaming = None
+            console.print()
+        elif isinstance(event, Generated):
+            console.print("[bold green]✓[/bold green] Reasoning model response generated")
+            if event.timings:
+                timings = event.timings
+                milestones = [f"first token {timings['time_to_first_token'] or 0:.2f}s"]
+                if timings['time_to_end_of_thinking'] is not None:
+                    milestones.append(f"thinking ended {timings['time_to_end_of_thinking']:.2f}s ({timings['thinking_tokens']} tokens)")
+                milestones.append(f"total {timings['total_time']:.2f}s")
+                console.print(f"[dim]⏱  {' · '.join(milestones)}[/dim]")
+            if event.thinking and event.show_thinking:
+                console.print("\n[bold green]Thinking Steps:[/bold green]")
+                console.print(Panel(event.thinking, border_style="green"))
+            console.print("\n[bold green]Model Response:[/bold green]")
+            console.print(Panel(event.response, border_style="green"))
+        elif isinstance(event, SampleGraded):
+            console.print(f"  Sample {event.index}: {'✅' if event.passed else '❌'} (running pass rate {event.pass_rate:.0%})")
+        elif isinstance(event, Graded) and event.case_id is not None:
+            status = "[bold green]✅ PASSED[/bold green]" if event.passed else "[bold red]❌ FAILED[/bold red]"
+            console.print(f"Case {event.case_id} attempt {event.attempt}: {status}")
+        elif isinstance(event, Graded):
+            console.print(f"[bold]Evaluation Result:[/bold] {'✅ PASSED' if event.passed else '❌ FAILED'}")
+            console.print(f"[bold]Justification:[/bold] {event.justification}")
+        elif isinstance(event, Prescribed):
+            console.print("\n[green]Step 5: Updating system prompt for next attempt...[/green]")
+        elif isinstance(event, CaseFinished):
+            if event.status == "error":
+                status = f"[bold red]⚠ ERROR[/bold red] {event.error}"
+            elif event.status == "passed":
+                status = f"[bold green]✅ PASSED[/bold green] on attempt {event.attempts}"
+            else:
+                status = f"[bold red]❌ FAILED[/bold red] after {event.attempts} attempts"
+            console.print(f"[{event.finished}/{event.total}] Case {event.case_id}: {status}")
+        elif isinstance(event, RunFinished):
+            console.print(Markdown(event.report))
+            for summary in event.summaries:
+                console.print(f"[dim]{summary}[/dim]")
+            if telemetry.active_telemetry is not None:
+                console.print(telemetry.active_telemetry.summary_table())
+            console.print("\n[bold green]🎬 Prompt Lab Session Complete![/bold green]\n", style="bold")
+
+    def close(self):
+        if self._status is not None:
+            self._status.stop()
+
+class JsonlConsumer:
+    """Writes each event as one JSON line: its type, emission time and fields."""
+
+    def __init__(self, path: str = None):
+        self._file = open(path, "a", encoding="utf-8") if path else sys.stdout
+
+    def handle(self, event, emitted_at: float):
+        self._file.write(serialize(event, emitted_at) + "\n")
+        self._file.flush()
+
+    def close(self):
+        if self._file is not sys.stdout:
+            self._file.close()
+
+class EventBus:
+    """Hands events from the lab to a consumer running on its own thread.
+
+    `emit` only puts the event on an unbounded queue, so the generation and grading loops
+    never wait on terminal or file I/O; the consumer renders or writes events in order.
+
+    Args:
+        consumer: An object with `handle(event, emitted_at)` and `close()`
+    """
+
+    _STOP = object()
+
+    def __init__(self, consumer):
+        self.consumer = consumer
+        self._failed = False
+        self._queue = queue.SimpleQueue()
+        self._thread = threading.Thread(target=self._drain, daemon=True)
+        self._thread.start()
+
+    def emit(self, event):
+        self._queue.put((time.time(), event))
+
+    def _drain(self):
+        while True:
+            emitted_at, event = self._queue.get()
+            if event is self._STOP:
+                break
+            try:
+                self.consumer.handle(event, emitted_at)
+            except Exception:
+                # A broken consumer must not take the run down with it, but it is reported once
+                if not self._failed:
+                    self._failed = True
+                    logger.exception("%s failed on %s; later failures are not reported",
+                                     type(self.consumer).__name__, type(event).__name__)
+
+    def close(self):
+        """Deliver the events still queued, then stop the consumer."""
+        if not self._thread.is_alive():
+            return
+        self._queue.put((time.time(), self._STOP))
+        self._thread.join()
+        self.consumer.close()
+
+class InlineBus:
+    """Hands each event to a consumer on the emitting thread, so output stays with the call that made it.
+
+    Used when the lab runs as a library, where a notebook cell's output should be complete
+    when the call returns."""
+
+    def __init__(self, consumer):
+        self.consumer = consumer
+        self._lock = threading.Lock()
+
+    def emit(self, event):
+        with self._lock:
+            self.consumer.handle(event, time.time())
+
+    def close(self):
+        self.consumer.close()
+
+def default_bus():
+    """Render events inline on a rich console, unless `configure_events` has chosen otherwise."""
+    global active_bus, configured
+    with _configure_lock:
+        if not configured:
+            active_bus = InlineBus(RichConsumer(Console()))
+            configured = True
+    return active_bus
+
+def emit(event):
+    """Send an event to the current sink, or drop it when events are configured off."""
+    sink = current_sink.get() or active_bus
+    if sink is None and not configured:
+        sink = default_bus()
+    if sink is not None:
+        sink.emit(event)
+
+@contextmanager
+def sink(bus):
+    """Send the events of the enclosed code to `bus` instead of the process-wide one."""
+    token = current_sink.set(bus)
+    try:
+        yield bus
+    finally:
+        current_sink.reset(token)
+
+def configure_events(kind: str, console=None, path: str = None) -> EventBus:
+    """Start the consumer for `kind` and make its bus the process-wide `active_bus`.
+
+    With `none` there is no bus and events are dropped where they are emitted."""
+    global active_bus, configured
+    configured = True
+    if kind == "rich":
+        active_bus = EventBus(RichConsumer(console))
+    elif kind == "jsonl":
+        active_bus = EventBus(JsonlConsumer(path))
+    else:
+        active_bus = None
+    return active_bus
+
+def close():
+    """Flush and stop the process-wide bus, if there is one."""
+    if active_bus is not None:
+        active_bus.close()
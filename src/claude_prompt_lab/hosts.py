@@ -0,0 +1,229 @@
+import asyncio
+import threading
+import weakref
+from contextlib import contextmanager
+
+import httpx
+from ollama import AsyncClient, Client, ResponseError
+
+# The process-wide pool of Ollama hosts, if generation is spread over several
+active_pool = None
+
+class HostUnavailable(Exception):
+    """Raised when no healthy Ollama host is left to route a request to."""
+
+def is_host_failure(error: Exception) -> bool:
+    """Whether an error means the host is unreachable or broken, rather than the request being bad."""
+    if isinstance(error, ResponseError):
+        return error.status_code >= 500
+    # The ollama client reports refused connections as the builtin ConnectionError
+    return isinstance(error, (ConnectionError, httpx.TransportError))
+
+class OllamaHost:
+    """One Ollama daemon and what the pool has observed about it."""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.client = Client(host=url)
+        self.in_flight = 0
+        self.tokens_per_second = None
+        self.resident = set()
+        self.healthy = True
+        self.failures = 0
+        self.requests = 0
+
+    def observe(self, response, model: str, smoothing: float = 0.3):
+        """Update the throughput estimate from a final chat response."""
+        self.resident.add(model)
+        eval_count, eval_duration = response.get('eval_count'), response.get('eval_duration')
+        if eval_count and eval_duration:
+            rate = eval_count / (eval_duration / 1e9)
+            self.tokens_per_second = rate if self.tokens_per_second is None else \
+                (1 - smoothing) * self.tokens_per_second + smoothing * rate
+
+class OllamaPool:
+    """Routes Ollama chat requests over several hosts.
+
+    Each request goes to the healthy host with the lowest expected wait: its queue depth
+    (requests in flight plus this one) divided by its observed generation speed, with a
+    cold-start penalty when the model is not resident there. Resident models come from
+    `/api/ps` health checks and from completed requests. A host that fails
+    `failure_threshold` requests in a row gets no requests until a health check succeeds again,
+    and a failed request is retried once on another host.
+
+    Args:
+        urls (list[str]): Ollama base URLs, e.g. http://gpu-1:11434
+        health_interval (float): Seconds between background health checks
+        failure_threshold (int): Consecutive failures before a host is taken out of rotation
+        cold_start_penalty (float): Extra queue slots charged for a host that must load the model
+    """
+
+    def __init__(self, urls: list[str], health_interval: float = 15.0, failure_threshold: int = 2,
+                 cold_start_penalty: float = 2.0):
+        self.hosts = [OllamaHost(url) for url in urls]
+        self.health_interval = health_interval
+        self.failure_threshold = failure_threshold
+        self.cold_start_penalty = cold_start_penalty
+        self._lock = threading.Lock()
+        self._async_clients = weakref.WeakKeyDictionary()
+        self._stop = threading.Event()
+
+    def pick(self, model: str, exclude: OllamaHost = None) -> OllamaHost:
+        """Choose the host for a request and take a slot on it, or raise `HostUnavailable`.
+
+        The choice and the `in_flight` increment share one critical section, so concurrent
+        requests see each other's slots and spread out. `exclude` is avoided when another
+        healthy host is available."""
+        with self._lock:
+            candidates = [host for host in self.hosts if host.healthy]
+            if not candidates:
+                raise HostUnavailable(f"No healthy Ollama host among {', '.join(host.url for host in self.hosts)}")
+            candidates = [host for host in candidates if host is not exclude] or candidates
+            known = [host.tokens_per_second for host in candidates if host.tokens_per_second]
+            default_rate = sum(known) / len(known) if known else 1.0
+            def expected_wait(host):
+                slots = host.in_flight + 1 + (0 if model in host.resident else self.cold_start_penalty)
+                return slots / (host.tokens_per_second or default_rate)
+            host = min(candidates, key=expected_wait)
+            host.in_flight += 1
+            host.requests += 1
+            return host
+
+    @contextmanager
+    def lease(self, model: str, exclude: OllamaHost = None):
+        """Reserve a slot on the best host for the duration of a request."""
+        host = self.pick(model, exclude)
+        try:
+            yield host
+        except Exception as e:
+            if is_host_failure(e):
+                self.record_failure(host)
+            raise
+        else:
+            with self._lock:
+                host.failures = 0
+        finally:
+            with self._lock:
+                host.in_flight -= 1
+
+    def record_failure(self, host: OllamaHost):
+        with self._lock:
+            host.failures += 1
+            if host.failures >= self.failure_threshold:
+                host.healthy = False
+
+    def chat(self, **request):
+        """`ollama.chat` routed to the best host, retried once on another host if it fails."""
+        if request.get('stream'):
+            return self._stream(request)
+        failed = None
+        for attempt in range(2):
+            try:
+                with self.lease(request['model'], exclude=failed) as host:
+                    response = host.client.chat(**request)
+                    host.observe(response, request['model'])
+                    return response
+            except Exception as e:
+                if attempt or not is_host_failure(e):
+                    raise
+                failed = host
+
+    def _stream(self, request):
+        # Streams are not retried, since chunks may already have been consumed
+        with self.lease(request['model']) as host:
+            parts = host.client.chat(**request)
+            try:
+                for part in parts:
+                    if part.get('done'):
+                        host.observe(part, request['model'])
+                    yield part
+            finally:
+                parts.close()
+
+    def async_client(self):
+        """An object with the `AsyncClient.chat` interface that routes through the pool."""
+        return AsyncPoolClient(self)
+
+    def _async_client_for(self, host: OllamaHost) -> AsyncClient:
+        # httpx async clients are bound to the event loop they were first used on
+        clients = self._async_clients.setdefault(asyncio.get_running_loop(), {})
+        if host.url not in clients:
+            clients[host.url] = AsyncClient(host=host.url)
+        return clients[host.url]
+
+    def check_health(self):
+        """Ask every host for its resident models, restoring hosts that answer and benching those that do not."""
+        for host in self.hosts:
+            try:
+                models = host.client.ps().models
+            except Exception:
+                with self._lock:
+                    host.healthy = False
+                continue
+            with self._lock:
+                host.resident = {model.model for model in models} | {model.name for model in models if model.name}
+                host.healthy = True
+                host.failures = 0
+
+    def start_health_checks(self):
+        """Run `check_health` now and then every `health_interval` seconds in a daemon thread."""
+        self.check_health()
+        def loop():
+            while not self._stop.wait(self.health_interval):
+                self.check_health()
+        threading.Thread(target=loop, daemon=True).start()
+
+    def close(self):
+        self._stop.set()
+
+    def summary(self) -> str:
+        """One-line summary of how requests were spread, for the end of a run."""
+        parts = []
+        for host in self.hosts:
+            rate = f", {host.tokens_per_second:.0f} tok/s" if host.tokens_per_second else ""
+            state = "" if host.healthy else " unhealthy"
+            parts.append(f"{host.url} {host.requests} requests{rate}{state}")
+        return "Ollama hosts: " + "; ".join(parts)
+
+class AsyncPoolClient:
+    """Async counterpart of `OllamaPool.chat`, used in place of `ollama.AsyncClient`."""
+
+    def __init__(self, pool: OllamaPool):
+        self.pool = pool
+
+    async def chat(self, **request):
+        if request.get('stream'):
+            return self._stream(request)
+        failed = None
+        for attempt in range(2):
+            try:
+                with self.pool.lease(request['model'], exclude=failed) as host:
+                    response = await self.pool._async_client_for(host).chat(**request)
+                    host.observe(response, request['model'])
+                    return response
+            except Exception as e:
+                if attempt or not is_host_failure(e):
+                    raise
+                failed = host
+
+    async def _stream(self, request):
+        with self.pool.lease(request['model']) as host:
+            parts = await self.pool._async_client_for(host).chat(**request)
+            try:
+                async for part in parts:
+                    if part.get('done'):
+                        host.observe(part, request['model'])
+                    yield part
+            finally:
+                await parts.aclose()
+
+def async_client():
+    """The async Ollama client for a run: routed through the pool if one is configured."""
+    return active_pool.async_client() if active_pool is not None else AsyncClient()
+
+def configure_pool(urls: list[str], health_interval: float = 15.0) -> OllamaPool:
+    """Create a pool over `urls`, start its health checks and make it the process-wide `active_pool`."""
+    global active_pool
+    active_pool = OllamaPool(urls, health_interval)
+    active_pool.start_health_checks()
+    return active_pool
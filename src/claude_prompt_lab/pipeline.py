@@ -0,0 +1,390 @@
+import asyncio
+import json
+
+from anthropic import AsyncAnthropic
+from anthropic.types import Message, MessageTokensCount
+from ollama import ChatResponse
+
+import cache
+import events
+import hosts
+import pregrader
+import residency
+import scheduler
+import session
+import store
+import telemetry
+from context import build_meta_prompt_context, calibrated_estimator, estimate_tokens, history_entry, render_attempt
+from claude_prompt_lab import (build_generator_messages, build_evaluator_request,
+                               build_meta_prompt_request, parse_meta_prompt, generate_report_entry,
+                               GenerationAborted, GenerationStream)
+from events import CaseFinished, Notice
+from utils import split_thinking
+
+def load_dataset(path: str) -> list[dict]:
+    """Load a JSONL test suite for dataset mode.
+
+    Each line is a JSON object with an `input` field and optional `id`, `objective`
+    and `system_prompt` fields that override the session defaults for that case.
+
+    Args:
+        path (str): Path to the JSONL file
+
+    Returns:
+        list[dict]: The test cases, in file order"""
+    cases = []
+    with open(path) as f:
+        for line_number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            case = json.loads(line)
+            if 'input' not in case:
+                raise ValueError(f"{path}:{line_number}: test case is missing the 'input' field")
+            case.setdefault('id', str(len(cases) + 1))
+            cases.append(case)
+    return cases
+
+async def acreate_chat(ollama_client, **request) -> ChatResponse:
+    """Async counterpart of `claude_prompt_lab.create_chat`."""
+    if cache.active_cache is None:
+        return await ollama_client.chat(**residency.pin(request))
+    return await cache.active_cache.afetch("ollama", request, lambda: ollama_client.chat(**residency.pin(request)), ChatResponse)
+
+async def acreate_message(anthropic_client, hedge: bool = False, **request) -> Message:
+    """Async counterpart of `claude_prompt_lab.create_message`."""
+    if cache.active_cache is None:
+        return await scheduler.acreate_message(anthropic_client, hedge, **request)
+    return await cache.active_cache.afetch("anthropic", request,
+                                           lambda: scheduler.acreate_message(anthropic_client, hedge, **request), Message)
+
+async def acount_message_tokens(anthropic_client, **request) -> MessageTokensCount:
+    """Async counterpart of `claude_prompt_lab.count_message_tokens`."""
+    if cache.active_cache is None:
+        return await anthropic_client.messages.count_tokens(**request)
+    return await cache.active_cache.afetch("anthropic-count", request, lambda: anthropic_client.messages.count_tokens(**request),
+                                           MessageTokensCount)
+
+async def astream_chat(ollama_client, request, think_tag, think_end_tag, max_thinking_tokens, max_generation_seconds):
+    """Async counterpart of `claude_prompt_lab.stream_generator`, without thinking events."""
+    if cache.active_cache is not None:
+        cached = cache.active_cache.lookup("ollama", request, ChatResponse)
+        if cached is not None:
+            telemetry.note_ollama(cached)
+            return (*split_thinking(cached['message']['content'], think_tag, think_end_tag), None)
+
+    generation = GenerationStream(think_tag, think_end_tag, max_thinking_tokens, max_generation_seconds)
+    parts = await ollama_client.chat(**residency.pin(request), stream=True)
+    try:
+        async for part in parts:
+            generation.feed(part)
+    finally:
+        await parts.aclose()
+
+    if cache.active_cache is not None:
+        cache.active_cache.store("ollama", request, generation.response())
+    telemetry.note_ollama(generation.last_part)
+    return (*generation.finish(), generation.timings())
+
+async def generate_case(ollama_client, case, reasoning_model, think_tag, think_end_tag,
+                        stream=False, max_thinking_tokens=None, max_generation_seconds=None):
+    """Generation stage: run the local reasoning model on one test case."""
+    request = dict(model=reasoning_model, messages=build_generator_messages(case['input'], case['system_prompt']))
+    with telemetry.stage("generator", case.get('span')):
+        if stream:
+            case['response'], case['thinking'], case['timings'] = await astream_chat(
+                ollama_client, request, think_tag, think_end_tag, max_thinking_tokens, max_generation_seconds)
+        else:
+            response = await acreate_chat(ollama_client, **request)
+            telemetry.note_ollama(response)
+            case['response'], case['thinking'] = split_thinking(response['message']['content'], think_tag, think_end_tag)
+
+async def evaluate_case(anthropic_client, case, claude_model):
+    """Evaluation stage: grade the latest response of one test case with Claude.
+
+    Responses the pre-grader fails are graded locally and return no usage."""
+    grade = pregrader.pregrade(case['objective'], case['input'], case['response'])
+    if grade is not None:
+        case['grade'] = grade
+        return None
+    with telemetry.stage("evaluator", case.get('span')):
+        message = await acreate_message(anthropic_client, hedge=True, **build_evaluator_request(claude_model,
+                                                                                                case['objective'],
+                                                                                                case['input'],
+                                                                                                case['response']))
+        telemetry.note_anthropic(message.usage)
+    case['grade'] = message.content[0].input
+    return message.usage
+
+async def diagnose_case(anthropic_client, case, claude_model, context_budget=8000, recent_attempts=2, count_tokens=estimate_tokens):
+    """Meta-prompt stage: diagnose a failed attempt and prescribe the next system prompt."""
+    medical_history, selected_thinking = build_meta_prompt_context(case['history'],
+                                                                   case['thinking'],
+                                                                   focus=f"{case['grade']['justification']}\n{case['objective']}",
+                                                                   budget_tokens=context_budget,
+                                                                   recent_attempts=recent_attempts,
+                                                                   count_tokens=count_tokens)
+    with telemetry.stage("meta_prompt", case.get('span')):
+        response = await acreate_message(anthropic_client, **build_meta_prompt_request(claude_model,
+                                                                                       case['objective'],
+                                                                                       case['system_prompt'],
+                                                                                       case['input'],
+                                                                                       selected_thinking,
+                                                                                       case['response'],
+                                                                                       case['grade']['justification'],
+                                                                                       medical_history))
+        telemetry.note_anthropic(response.usage)
+    case['diagnosis'] = response.content[0].text
+    case['parsed_response'] = parse_meta_prompt(case['diagnosis'])
+    case['history'].append(history_entry(case['attempt'], case['system_prompt'], case['grade'], case['parsed_response']))
+    return response.usage
+
+async def run_dataset(cases: list[dict],
+                      reasoning_model: str,
+                      claude_model: str,
+                      reasoning_model_objective: str,
+                      reasoning_model_system_prompt: str,
+                      think_tag: str,
+                      think_end_tag: str,
+                      max_attempts: int,
+                      generator_concurrency: int = 1,
+                      evaluator_concurrency: int = 4,
+                      meta_concurrency: int = 4,
+                      queue_size: int = 16,
+                      stream: bool = False,
+                      max_thinking_tokens: int = None,
+                      max_generation_seconds: float = None,
+                      context_budget: int = 8000,
+                      recent_attempts: int = 2,
+                      count_tokens_api: bool = False) -> str:
+    """Run the prompt lab over a test suite as a staged async pipeline.
+
+    Each case runs its own generate -> evaluate -> meta-prompt chain, exactly like
+    `run_prompt_lab`, but the three stages are decoupled by bounded queues and served by
+    independent worker pools. Ollama keeps generating the next case while Claude grades
+    or diagnoses earlier ones. Failed cases re-enter the generation queue with their
+    prescribed prompt until they pass or run out of attempts.
+
+    Args:
+        cases: Test cases from `load_dataset`
+        reasoning_model: Name of the Ollama reasoning model to use
+        claude_model: Name of the claude model to use
+        reasoning_model_objective: Default task objective for cases without one
+        reasoning_model_system_prompt: Default initial system prompt for cases without one
+        think_tag: Tag for the start of thinking steps
+        think_end_tag: Tag for the end of thinking steps
+        max_attempts: Maximum number of improvement attempts per case
+        generator_concurrency: Number of concurrent Ollama requests
+        evaluator_concurrency: Number of concurrent Claude grading requests
+        meta_concurrency: Number of concurrent Claude meta-prompt requests
+        queue_size: Capacity of each stage queue, which also bounds the cases in flight
+        stream: Stream generations so budgets can abort runaway thinking early
+        max_thinking_tokens: With stream, fail an attempt once thinking exceeds this many tokens
+        max_generation_seconds: With stream, fail an attempt once generation exceeds this many seconds
+        context_budget: Token budget for the medical history and thinking trace sent to the meta-prompt
+        recent_attempts: Number of latest attempts kept verbatim in the meta-prompt's medical history
+        count_tokens_api: Calibrate the token estimator with Claude's count-tokens endpoint
+
+    Returns:
+        str: A medical-style report covering every case in the suite
+    """
+    anthropic_client = AsyncAnthropic()
+    ollama_client = hosts.async_client()
+
+    for index, case in enumerate(cases, 1):
+        case.setdefault('id', str(index))
+        case.setdefault('objective', reasoning_model_objective)
+        case.setdefault('system_prompt', reasoning_model_system_prompt)
+        case.update(attempt=1, report=[], history=[], grade=None, error=None,
+                    span=telemetry.span(case=case['id'], attempt=1))
+        store.record_prompt(case['system_prompt'])
+
+    generate_queue = asyncio.Queue(maxsize=queue_size)
+    evaluate_queue = asyncio.Queue(maxsize=queue_size)
+    meta_queue = asyncio.Queue(maxsize=queue_size)
+
+    # Never admit more cases than a single queue can hold, so a worker handing a case
+    # downstream can always make progress even though the stages form a cycle
+    in_flight = asyncio.Semaphore(queue_size)
+    all_done = asyncio.Event()
+    finished = 0
+    usage_totals = {'input_tokens': 0, 'cache_read_input_tokens': 0, 'cache_creation_input_tokens': 0}
+
+    count_tokens = estimate_tokens
+
+    async def calibrate(case):
+        # One count-tokens call on the first diagnosed case fits the estimator to Claude's tokenizer
+        nonlocal count_tokens, count_tokens_api
+        count_tokens_api = False
+        sample = "".join(render_attempt(entry) for entry in case['history']) + case['thinking']
+        if sample:
+            calibration = session.replay('calibration', case['attempt'], case['id'])
+            if calibration is None:
+                counted = await acount_message_tokens(anthropic_client, model=claude_model,
+                                                      messages=[{"role": "user", "content": sample}])
+                calibration = {'tokens': counted.input_tokens}
+                session.record('calibration', case['attempt'], calibration, case['id'])
+            count_tokens = calibrated_estimator(sample, calibration['tokens'])
+
+    def record_usage(usage):
+        for field in usage_totals:
+            usage_totals[field] += getattr(usage, field, None) or 0
+
+    def finish(case):
+        nonlocal finished
+        finished += 1
+        in_flight.release()
+        case['span'].finish()
+        status = "error" if case['error'] else ("passed" if case['grade']['passed'] else "failed")
+        events.emit(CaseFinished(case['id'], finished, len(cases), status, case['attempt'], case['error']))
+        if finished == len(cases):
+            all_done.set()
+
+    async def feed():
+        for case in cases:
+            await in_flight.acquire()
+            await generate_queue.put(case)
+
+    def record_grade(case):
+        session.record('grade', case['attempt'], case['grade'], case['id'])
+        store.record_grade(case['system_prompt'], case['objective'], case['input'], reasoning_model, claude_model,
+                           case['grade'], case['response'], case['thinking'])
+
+    async def route_graded(case):
+        if case['grade']['passed'] or case['attempt'] >= max_attempts:
+            case['report'].append(generate_report_entry(case['attempt'], case['grade']))
+            finish(case)
+        else:
+            await meta_queue.put(case)
+
+    def record_generation(case):
+        session.record('generation', case['attempt'], {'system_prompt': case['system_prompt'],
+                                                       'response': case['response'],
+                                                       'thinking': case['thinking']}, case['id'])
+
+    async def generate_worker():
+        while True:
+            case = await generate_queue.get()
+            # Completed steps of a resumed session are replayed from its log
+            generation = session.replay('generation', case['attempt'], case['id'], case['system_prompt'])
+            if generation is not None:
+                case['response'], case['thinking'] = generation['response'], generation['thinking']
+                grade = session.replay('grade', case['attempt'], case['id'])
+                if grade is None:
+                    await evaluate_queue.put(case)
+                else:
+                    case['grade'] = grade
+                    await route_graded(case)
+                continue
+            try:
+                await generate_case(ollama_client, case, reasoning_model, think_tag, think_end_tag,
+                                    stream, max_thinking_tokens, max_generation_seconds)
+            except GenerationAborted as e:
+                # Fail the attempt without a grading call, the partial trace goes to the meta-prompt
+                case['response'], case['thinking'] = e.chat_message, e.thinking_steps
+                case['grade'] = e.grade()
+                record_generation(case)
+                record_grade(case)
+                await route_graded(case)
+            except Exception as e:
+                case['error'] = f"generation failed: {e}"
+                finish(case)
+            else:
+                record_generation(case)
+                await evaluate_queue.put(case)
+
+    async def evaluate_worker():
+        while True:
+            case = await evaluate_queue.get()
+            try:
+                record_usage(await evaluate_case(anthropic_client, case, claude_model))
+            except Exception as e:
+                case['error'] = f"evaluation failed: {e}"
+                finish(case)
+                continue
+            record_grade(case)
+            await route_graded(case)
+
+    async def meta_worker():
+        while True:
+            case = await meta_queue.get()
+            try:
+                diagnosis = session.replay('diagnosis', case['attempt'], case['id'])
+                if diagnosis is not None:
+                    case['parsed_response'] = parse_meta_prompt(diagnosis['text'])
+                    case['history'].append(history_entry(case['attempt'], case['system_prompt'], case['grade'],
+                                                         case['parsed_response']))
+                else:
+                    if count_tokens_api:
+                        await calibrate(case)
+                    record_usage(await diagnose_case(anthropic_client, case, claude_model,
+                                                     context_budget, recent_attempts, count_tokens))
+                    session.record('diagnosis', case['attempt'], {'text': case['diagnosis']}, case['id'])
+            except Exception as e:
+                case['error'] = f"meta-prompt failed: {e}"
+                finish(case)
+                continue
+            case['report'].append(generate_report_entry(case['attempt'], case['grade'], case['parsed_response']))
+            store.record_prompt(case['parsed_response']['improved_prompt'], parent=case['system_prompt'],
+                                attempt=case['attempt'], suggestions=case['parsed_response']['suggestions'])
+            case['system_prompt'] = case['parsed_response']['improved_prompt']
+            case['span'].finish()
+            case['attempt'] += 1
+            case['span'] = telemetry.span(case=case['id'], attempt=case['attempt'])
+            await generate_queue.put(case)
+
+    events.emit(Notice(f"🧪 Running {len(cases)} cases (generator x{generator_concurrency}, "
+                       f"evaluator x{evaluator_concurrency}, meta-prompt x{meta_concurrency})", "status"))
+
+    workers = [asyncio.create_task(feed())]
+    workers += [asyncio.create_task(generate_worker()) for _ in range(generator_concurrency)]
+    workers += [asyncio.create_task(evaluate_worker()) for _ in range(evaluator_concurrency)]
+    workers += [asyncio.create_task(meta_worker()) for _ in range(meta_concurrency)]
+    try:
+        if cases:
+            # Workers only return by raising, so surface a crashed stage instead of hanging
+            waiter = asyncio.create_task(all_done.wait())
+            await asyncio.wait([waiter, *workers[1:]], return_when=asyncio.FIRST_COMPLETED)
+            waiter.cancel()
+            for worker in workers[1:]:
+                if worker.done():
+                    worker.result()
+    finally:
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        await anthropic_client.close()
+
+    return generate_dataset_report(cases, reasoning_model, reasoning_model_objective, usage_totals)
+
+def generate_dataset_report(cases, reasoning_model, reasoning_model_objective, usage_totals=None):
+    """Generate a medical-style report summarizing a dataset run"""
+    passed = [case for case in cases if not case['error'] and case['grade']['passed']]
+    errored = [case for case in cases if case['error']]
+
+    report = ["# 🏥 Dr Claude's Prompt Lab: Dataset Report",
+              f"\n## Patient Information: {reasoning_model}",
+              f"\n**Treatment Objective**: {reasoning_model_objective}",
+              f"\n**Pass Rate**: {len(passed)}/{len(cases)}" + (f" ({len(errored)} errored)" if errored else ""),
+              *([f"\n**Claude Input Tokens**: {usage_totals['cache_read_input_tokens']} read from prompt cache, "
+                 f"{usage_totals['cache_creation_input_tokens']} written to cache, {usage_totals['input_tokens']} uncached"]
+                if usage_totals else []),
+              "\n| Case | Status | Attempts |",
+              "|---|---|---|"]
+    for case in cases:
+        if case['error']:
+            status = "⚠️ ERROR"
+        else:
+            status = "✅ PASSED" if case['grade']['passed'] else "❌ FAILED"
+        report.append(f"| {case['id']} | {status} | {case['attempt']} |")
+
+    for case in cases:
+        report.append(f"\n## Case {case['id']}")
+        if case['error']:
+            report.append(f"\n**Error**: {case['error']}")
+        report.extend(case['report'])
+        if not case['error'] and case['grade']['passed']:
+            report.extend(["\n### Final System Prompt:",
+                           f"\n```\n{case['system_prompt']}\n```"])
+
+    return "\n".join(report)
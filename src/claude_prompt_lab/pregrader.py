@@ -0,0 +1,136 @@
+import re
+import threading
+from collections import Counter
+
+# The process-wide pre-grader consulted before every Claude grading call, if any
+active_pregrader = None
+
+# Openings that introduce the answer rather than start it, e.g. "Here is the updated summary:"
+# or "Sure, ...", but not content that happens to begin with "This" or "The following"
+PREAMBLE_PATTERN = re.compile(
+    r"^\s*(here(\s+is|\s+are|'s)\s+(the|your|a|an|my)\b|below\s+is\b|(sure|certainly|of course|okay|ok)\s*[,.!])",
+    re.IGNORECASE)
+
+# Where the existing summary sits in an input: inside <existing_summary> tags, or before
+# the line that introduces the new content ("Include new search results:")
+EXISTING_SUMMARY_PATTERN = re.compile(r"<existing_summary>(.*?)</existing_summary>", re.IGNORECASE | re.DOTALL)
+NEW_CONTENT_PATTERN = re.compile(r"^\s*(include\s+)?(the\s+)?new\s+(search\s+results|content)\b", re.IGNORECASE | re.MULTILINE)
+
+def shingles(text: str, size: int = 5) -> set[tuple[str, ...]]:
+    """Word n-gram shingles of a text, lowercased and stripped of punctuation."""
+    words = re.findall(r"\w+", text.lower())
+    return {tuple(words[i:i + size]) for i in range(max(len(words) - size + 1, 1))} if words else set()
+
+def containment(text: str, source: str, size: int = 5) -> float:
+    """Fraction of the text's shingles that also appear in the source."""
+    text_shingles = shingles(text, size)
+    if not text_shingles:
+        return 0.0
+    return len(text_shingles & shingles(source, size)) / len(text_shingles)
+
+def existing_summary(model_input: str) -> str:
+    """The existing-summary part of an input, or None when the input has no recognizable one."""
+    tagged = EXISTING_SUMMARY_PATTERN.search(model_input)
+    if tagged:
+        return tagged.group(1)
+    new_content = NEW_CONTENT_PATTERN.search(model_input)
+    return model_input[:new_content.start()] if new_content else None
+
+def check_empty(think_tag: str, think_end_tag: str):
+    """Fail responses with no content once any leftover thinking block is removed."""
+    leftover = re.compile(f"{re.escape(think_tag)}.*?({re.escape(think_end_tag)}|$)", re.DOTALL)
+    def check(objective, model_input, response):
+        if not leftover.sub("", response).strip():
+            return "The response is empty once the thinking block is removed."
+    return check
+
+def check_preamble():
+    """Fail responses that open with conversational filler instead of the content."""
+    def check(objective, model_input, response):
+        first_line = response.strip().splitlines()[0] if response.strip() else ""
+        if PREAMBLE_PATTERN.match(first_line):
+            return f"The response starts with a preamble (\"{first_line[:60]}\") instead of the content itself."
+    return check
+
+def check_required_tags(tags: list[str]):
+    """Fail responses missing any of the required XML tags."""
+    def check(objective, model_input, response):
+        missing = [tag for tag in tags if not re.search(f"<{re.escape(tag)}>.*?</{re.escape(tag)}>", response, re.DOTALL)]
+        if missing:
+            return f"The response is missing the required {', '.join(f'<{tag}>' for tag in missing)} tag(s)."
+    return check
+
+def check_copies_input(threshold: float = 0.9, min_words: int = 20):
+    """Fail responses that return the input's existing summary nearly unchanged.
+
+    Only the existing summary is compared against, since a good answer that merges the new
+    content would also be found in the input as a whole. Inputs without a recognizable
+    existing summary are left for Claude."""
+    def check(objective, model_input, response):
+        if len(response.split()) < min_words:
+            return None
+        summary = existing_summary(model_input)
+        if summary is None:
+            return None
+        overlap = containment(response, summary)
+        if overlap >= threshold:
+            return (f"The response repeats the existing summary nearly verbatim "
+                    f"({overlap:.0%} of its 5-word shingles appear in it).")
+    return check
+
+# Checks that can be enabled by name from the command line
+CHECKS = {
+    'empty': lambda options: check_empty(options['think_tag'], options['think_end_tag']),
+    'preamble': lambda options: check_preamble(),
+    'copy': lambda options: check_copies_input(options.get('copy_threshold', 0.9)),
+}
+
+class PreGrader:
+    """Cascade of fast local checks run before the Claude judge.
+
+    Each check returns a failure reason or None. The checks only ever fail a response:
+    when one fires the response is graded as failed without an API call, and every
+    response that passes all of them is left for Claude to judge. Failing grades are
+    marked `local`, so they are not memoized as the judge's verdict.
+    """
+
+    def __init__(self, checks: dict):
+        self.checks = checks
+        self.checked = 0
+        self.saved = Counter()
+        self._lock = threading.Lock()
+
+    def grade(self, objective: str, model_input: str, response: str):
+        """Return a failing grade if a check is confident, otherwise None."""
+        with self._lock:
+            self.checked += 1
+        for name, check in self.checks.items():
+            reason = check(objective, model_input, response)
+            if reason:
+                with self._lock:
+                    self.saved[name] += 1
+                return {'passed': False, 'justification': f"Pre-grader ({name}): {reason}", 'local': True}
+        return None
+
+    def summary(self) -> str:
+        """One-line summary of the judge calls saved, for the end of a run."""
+        saved = sum(self.saved.values())
+        by_check = ", ".join(f"{name} {count}" for name, count in self.saved.most_common())
+        return f"Pre-grader: {saved}/{self.checked} judge calls saved" + (f" ({by_check})" if by_check else "")
+
+def configure_pregrader(names: list[str], think_tag: str, think_end_tag: str, required_tags: list[str] = (),
+                        copy_threshold: float = 0.9) -> PreGrader:
+    """Build a pre-grader from check names and make it the process-wide `active_pregrader`."""
+    global active_pregrader
+    options = {'think_tag': think_tag, 'think_end_tag': think_end_tag, 'copy_threshold': copy_threshold}
+    checks = {name: CHECKS[name](options) for name in names}
+    if required_tags:
+        checks['required-tags'] = check_required_tags(list(required_tags))
+    active_pregrader = PreGrader(checks) if checks else None
+    return active_pregrader
+
+def pregrade(objective: str, model_input: str, response: str):
+    """Grade with the active pre-grader, returning a failing grade or None when Claude should judge."""
+    if active_pregrader is None:
+        return None
+    return active_pregrader.grade(objective, model_input, response)
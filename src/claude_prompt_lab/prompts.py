@@ -16,16 +16,25 @@ Use the grading tool to provide a pass/fail grade with clear justification.
 </Grading Tool>
 """
 
-# Input to the evaluator
-evaluator_input_prompt = """ 
+# Inputs to the evaluator and meta prompt are split into blocks ordered from most to least stable,
+# so the Anthropic prompt cache can reuse the objective and input across attempts and test cases
+
+# Task objective, shared by every case in a session
+objective_prompt = """ 
 <Reasoning Model Objective>
 {reasoning_model_objective}
 </Reasoning Model Objective>
+"""
 
+# Reasoning model input, shared by every attempt on a case
+input_prompt = """
 <Reasoning Model Input>
 {reasoning_model_input}
 </Reasoning Model Input>
+"""
 
+# Response being graded by the evaluator
+evaluator_output_prompt = """
 <Reasoning Model Output>
 {reasoning_model_response}
 </Reasoning Model Output>
@@ -49,11 +58,7 @@ You will analyze:
 - Grader feedback
 - Previous attempts (medical history)
 
-Please provide your response using these tags:
-
-<assessment>
-Write a playful medical-style analysis of the model's thinking process and behavior. Be creative and humorous here. Focus on explaining the reasoning trace, shown in <Reasoning Model Thinking> tags, and where things went wrong.
-</assessment>
+Please provide your response using these tags, in this order:
 
 <suggestions>
 List specific, concrete suggestions for improving the prompt. Focus on:
@@ -71,23 +76,24 @@ Provide a clear, simple system prompt that implements your suggestions. This sho
 - Easy for the model to follow
 </improved_prompt>
 
+<assessment>
+Write a playful medical-style analysis of the model's thinking process and behavior. Be creative and humorous here. Focus on explaining the reasoning trace, shown in <Reasoning Model Thinking> tags, and where things went wrong.
+</assessment>
+
 Remember: Keep the playful tone ONLY in the assessment section. The improved prompt must be simple and clear.
 """
 
-# Input to the meta prompt
-meta_prompt_input = """
-<Reasoning Model Objective>
-{reasoning_model_objective}
-</Reasoning Model Objective>
-
-<Reasoning Model Input>
-{reasoning_model_input}
-</Reasoning Model Input>
+# Medical report on prior attempts, which only grows during a session
+medical_report_start = """
+<Medical Report>
+"""
 
-<Reasoning Model Output>
-{reasoning_model_response}
-</Reasoning Model Output>
+medical_report_end = """
+</Medical Report>
+"""
 
+# Details of the attempt being diagnosed, which change every time
+meta_prompt_attempt = """
 <Reasoning Model System Prompt>
 {reasoning_model_system_prompt}
 </Reasoning Model System Prompt>
@@ -96,11 +102,20 @@ meta_prompt_input = """
 {reasoning_model_thinking}
 </Reasoning Model Thinking>
 
+<Reasoning Model Output>
+{reasoning_model_response}
+</Reasoning Model Output>
+
 <Grader Feedback>
 {grader_feedback}
 </Grader Feedback>
+"""
 
-<Medical Report>
-{medical_report}
-</Medical Report>
+# Appended to the meta prompt input when searching over several candidate prompts at once
+meta_prompt_candidates = """
+<Candidates>
+Instead of a single improved prompt, provide {num_candidates} alternative improved prompts, each in its own <improved_prompt> tags.
+Make them genuinely different approaches to fixing the diagnosed problem, not rewordings of each other.
+Keep the suggestions and assessment brief so that every candidate fits in the response.
+</Candidates>
 """
\ No newline at end of file
@@ -0,0 +1,117 @@
+import asyncio
+
+from anthropic import AsyncAnthropic
+
+import events
+import hosts
+import store
+from claude_prompt_lab import GenerationAborted
+from events import Notice
+from pipeline import generate_case, evaluate_case
+
+async def run_regression(cases: list[dict],
+                         prompts: list[dict],
+                         reasoning_model: str,
+                         claude_model: str,
+                         reasoning_model_objective: str,
+                         think_tag: str,
+                         think_end_tag: str,
+                         generator_concurrency: int = 1,
+                         evaluator_concurrency: int = 4,
+                         stream: bool = False,
+                         max_thinking_tokens: int = None,
+                         max_generation_seconds: float = None) -> str:
+    """Check stored prompts against a test suite, grading only pairs without a stored verdict.
+
+    Every (prompt, case) pair is first looked up in the active prompt store. Only the pairs
+    with no memoized grade for this generator and judge are generated and graded, and their
+    grades are stored, so re-checking a prompt after a tweak costs only the new pairs. Each
+    prompt is compared with its parent, and cases that the parent passed but the prompt
+    fails are reported as regressions.
+
+    Args:
+        cases: Test cases from `pipeline.load_dataset`
+        prompts: Prompts from `PromptStore.prompt` to check
+        Other arguments are as for `pipeline.run_dataset`
+
+    Returns:
+        str: A report of pass rates, regressions and fixes per prompt
+    """
+    anthropic_client = AsyncAnthropic()
+    ollama_client = hosts.async_client()
+    generate_slots = asyncio.Semaphore(generator_concurrency)
+    evaluate_slots = asyncio.Semaphore(evaluator_concurrency)
+    counts = {'memoized': 0, 'graded': 0}
+
+    for index, case in enumerate(cases, 1):
+        case.setdefault('id', str(index))
+        case.setdefault('objective', reasoning_model_objective)
+
+    async def evaluate_one(prompt, case):
+        memo = store.lookup_grade(prompt, case['objective'], case['input'], reasoning_model, claude_model)
+        if memo is not None:
+            counts['memoized'] += 1
+            return memo
+        result = {'input': case['input'], 'objective': case['objective'], 'system_prompt': prompt}
+        async with generate_slots:
+            try:
+                await generate_case(ollama_client, result, reasoning_model, think_tag, think_end_tag,
+                                    stream, max_thinking_tokens, max_generation_seconds)
+            except GenerationAborted as e:
+                result['response'], result['thinking'] = e.chat_message, e.thinking_steps
+                result['grade'] = e.grade()
+            except Exception as e:
+                # A failed call errors its pair, not the whole regression
+                return {'error': f"generation failed: {e}"}
+        if 'grade' not in result:
+            async with evaluate_slots:
+                try:
+                    await evaluate_case(anthropic_client, result, claude_model)
+                except Exception as e:
+                    return {'error': f"evaluation failed: {e}"}
+        store.record_grade(prompt, case['objective'], case['input'], reasoning_model, claude_model,
+                           result['grade'], result['response'], result['thinking'])
+        counts['graded'] += 1
+        return result
+
+    events.emit(Notice(f"🔁 Checking {len(prompts)} prompts on {len(cases)} cases", "status"))
+    try:
+        results = await asyncio.gather(*(asyncio.gather(*(evaluate_one(prompt['text'], case) for case in cases))
+                                         for prompt in prompts))
+    finally:
+        await anthropic_client.close()
+    errors = sum('error' in result for prompt_results in results for result in prompt_results)
+    events.emit(Notice(f"{counts['graded']} pairs graded, {counts['memoized']} memoized verdicts reused" +
+                       (f", {errors} errored" if errors else ""), "done"))
+
+    report = ["# 🏥 Dr Claude's Prompt Lab: Regression Report",
+              f"\n## Patient Information: {reasoning_model}",
+              f"\n**Judge**: {claude_model}",
+              f"\n**Pairs**: {counts['graded']} graded, {counts['memoized']} memoized verdicts reused" +
+              (f", {errors} errored" if errors else ""),
+              "\n| Prompt | Parent | Pass Rate | Regressions | Fixes |",
+              "|---|---|---|---|---|"]
+    sections = []
+    for prompt, prompt_results in zip(prompts, results):
+        passed = sum(result['grade']['passed'] for result in prompt_results if 'grade' in result)
+        errored = [(case, result) for case, result in zip(cases, prompt_results) if 'error' in result]
+        regressions, fixes = [], []
+        if prompt['parent_hash'] is not None:
+            parent = store.active_store.prompt(prompt['parent_hash'])
+            for case, result in zip(cases, prompt_results):
+                if 'error' in result:
+                    continue
+                # The parent is only compared where its verdict is already known
+                before = store.active_store.get_grade(parent['text'], case['objective'], case['input'], reasoning_model, claude_model)
+                if before is None or before['grade']['passed'] == result['grade']['passed']:
+                    continue
+                (fixes if result['grade']['passed'] else regressions).append((case, result))
+        report.append(f"| {prompt['hash'][:12]} | {(prompt['parent_hash'] or '')[:12]} | {passed}/{len(cases)}" +
+                      (f" ({len(errored)} errored)" if errored else "") + f" | {len(regressions)} | {len(fixes)} |")
+        if regressions:
+            sections.append(f"\n## Regressions in {prompt['hash'][:12]}")
+            sections.extend(f"\n**Case {case['id']}**: {result['grade']['justification']}" for case, result in regressions)
+        if errored:
+            sections.append(f"\n## Errors in {prompt['hash'][:12]}")
+            sections.extend(f"\n**Case {case['id']}**: {result['error']}" for case, result in errored)
+    return "\n".join(report + sections)
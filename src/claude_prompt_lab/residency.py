@@ -0,0 +1,126 @@
+import threading
+import time
+
+from ollama import Client
+
+import hosts
+import telemetry
+
+# The process-wide residency manager, if the reasoning model is pinned
+active_residency = None
+
+def pin(request: dict) -> dict:
+    """Add the session's `keep_alive` to an Ollama chat request.
+
+    Applied when a request is sent rather than when it is built, so the response cache
+    key does not depend on the keep-alive setting. A generation sent before the preload
+    started loads the model itself, so the preload is dropped."""
+    if active_residency is None:
+        return request
+    active_residency.cancel()
+    if 'keep_alive' in request:
+        return request
+    return {**request, 'keep_alive': active_residency.keep_alive}
+
+def start_preload():
+    """Start the active residency manager's preload, if one is still waiting to start.
+
+    Called as each Claude request is issued, so the model loads while Claude answers."""
+    if active_residency is not None:
+        active_residency.trigger()
+
+class ResidencyManager:
+    """Keeps the reasoning model loaded for the whole session.
+
+    `start` preloads the model on every Ollama host in background threads (an empty chat
+    request loads it without generating), then sends a one-token warmup request. An armed
+    manager starts when the first Claude request is issued (see `start_preload`), so the
+    load overlaps that call instead of competing with a generation, and if a generation
+    comes first the preload is dropped, since that generation loads the model. Every
+    request carries the same `keep_alive` through `pin`, so the model is not unloaded
+    during the gaps spent waiting on Claude. Load and warmup times are recorded as their
+    own telemetry stages, separate from generation.
+
+    Args:
+        model (str): The reasoning model to keep resident
+        keep_alive (str): Ollama keep-alive duration, e.g. "30m", or seconds such as "-1" to never unload
+    """
+
+    def __init__(self, model: str, keep_alive: str = "30m"):
+        self.model = model
+        # Ollama reads strings as Go durations, which need a unit; plain seconds go as a number
+        self.keep_alive = int(keep_alive) if keep_alive.lstrip("-").isdigit() else keep_alive
+        self.load_seconds = {}
+        self.warmup_seconds = {}
+        self.errors = {}
+        self.state = 'idle'
+        self._lock = threading.Lock()
+
+    def arm(self):
+        """Preload on the next `trigger`, unless a generation `cancel`s it first."""
+        self.state = 'armed'
+
+    def trigger(self):
+        """Start the preload if it is armed."""
+        if self.state != 'armed':
+            return
+        with self._lock:
+            if self.state != 'armed':
+                return
+            self.state = 'started'
+        self.start()
+
+    def cancel(self):
+        """Drop an armed preload that has not started."""
+        if self.state == 'armed':
+            with self._lock:
+                if self.state == 'armed':
+                    self.state = 'skipped'
+
+    def targets(self) -> list:
+        """(name, client, pool host) for every daemon the model should be loaded on."""
+        if hosts.active_pool is not None:
+            return [(host.url, host.client, host) for host in hosts.active_pool.hosts if host.healthy]
+        return [('local', Client(), None)]
+
+    def start(self):
+        """Preload and warm up the model on every daemon now, each in its own daemon thread."""
+        self.state = 'started'
+        for target in self.targets():
+            threading.Thread(target=self.preload, args=target, daemon=True).start()
+
+    def preload(self, name, client, host=None):
+        try:
+            with telemetry.stage("preload"):
+                response = client.chat(model=self.model, messages=[], keep_alive=self.keep_alive)
+                telemetry.note_ollama(response)
+            self.load_seconds[name] = (response.get('load_duration') or 0) / 1e9
+            if host is not None:
+                host.resident.add(self.model)
+
+            started = time.perf_counter()
+            with telemetry.stage("warmup"):
+                response = client.chat(model=self.model, messages=[{'role': 'user', 'content': "Hi"}],
+                                       options={'num_predict': 1}, keep_alive=self.keep_alive)
+                telemetry.note_ollama(response)
+            self.warmup_seconds[name] = time.perf_counter() - started
+        except Exception as e:
+            # The first generation loads the model itself if the preload fails
+            self.errors[name] = str(e)
+
+    def summary(self) -> str:
+        """One-line summary of the preload, for the end of a run."""
+        parts = [f"{name} loaded in {seconds:.2f}s, warmed up in {self.warmup_seconds.get(name, 0):.2f}s"
+                 for name, seconds in self.load_seconds.items()]
+        parts += [f"{name} preload failed: {error}" for name, error in self.errors.items()]
+        if self.state == 'skipped':
+            parts.append("preload skipped, the first generation loaded the model")
+        return f"Model residency ({self.model}, keep_alive {self.keep_alive}): " + ("; ".join(parts) or f"preload {self.state}")
+
+def configure_residency(model: str, keep_alive: str = "30m", preload: bool = True) -> ResidencyManager:
+    """Pin `model` with `keep_alive`, optionally arm its preload, and make it the process-wide `active_residency`."""
+    global active_residency
+    active_residency = ResidencyManager(model, keep_alive)
+    if preload:
+        active_residency.arm()
+    return active_residency
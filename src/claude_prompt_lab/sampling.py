@@ -0,0 +1,58 @@
+import math
+
+class SequentialPassRateTest:
+    """Wald's sequential probability ratio test on a prompt's pass rate.
+
+    A prompt should pass when its true pass rate is at least `pass_rate`. The test compares
+    H0: p = pass_rate - margin (the prompt fails) against H1: p = pass_rate + margin (the
+    prompt passes) and stops as soon as the log-likelihood ratio of the graded samples
+    crosses a boundary set by the error rates `alpha` (wrongly passing a prompt) and
+    `beta` (wrongly failing it). Clear cases stop after a few samples, borderline ones
+    keep sampling until `max_samples`, where the point estimate decides.
+    """
+
+    def __init__(self, pass_rate: float = 0.7, margin: float = 0.2, alpha: float = 0.05, beta: float = 0.1,
+                 max_samples: int = 10):
+        self.pass_rate = pass_rate
+        self.p0 = min(max(pass_rate - margin, 0.01), 0.98)
+        self.p1 = min(max(pass_rate + margin, self.p0 + 0.01), 0.99)
+        self.upper = math.log((1 - beta) / alpha)
+        self.lower = math.log(beta / (1 - alpha))
+        self.max_samples = max_samples
+        self.llr = 0.0
+        self.passes = 0
+        self.samples = 0
+
+    def update(self, passed: bool):
+        """Record one graded sample."""
+        self.samples += 1
+        if passed:
+            self.passes += 1
+            self.llr += math.log(self.p1 / self.p0)
+        else:
+            self.llr += math.log((1 - self.p1) / (1 - self.p0))
+
+    @property
+    def estimate(self) -> float:
+        """Running pass-rate estimate."""
+        return self.passes / self.samples if self.samples else 0.0
+
+    @property
+    def decided(self) -> bool:
+        """Whether sampling can stop."""
+        return self.llr >= self.upper or self.llr <= self.lower or self.samples >= self.max_samples
+
+    @property
+    def passed(self) -> bool:
+        """The verdict, valid once `decided`."""
+        if self.llr >= self.upper:
+            return True
+        if self.llr <= self.lower:
+            return False
+        return self.estimate >= self.pass_rate
+
+    def describe(self) -> str:
+        """Human-readable summary of the verdict."""
+        reason = "sequential test" if self.llr >= self.upper or self.llr <= self.lower else "sample limit"
+        return (f"{self.passes}/{self.samples} samples passed (estimated pass rate {self.estimate:.0%}, "
+                f"threshold {self.pass_rate:.0%}, decided by {reason})")
@@ -0,0 +1,381 @@
+import asyncio
+import inspect
+import collections
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from contextlib import contextmanager
+
+import anthropic
+
+import residency
+from context import estimate_tokens
+
+# The process-wide scheduler for Claude calls, if they are rate limited and retried
+active_scheduler = None
+
+# Status codes worth retrying; 529 is Anthropic's "overloaded"
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504, 529}
+
+class TokenBucket:
+    """A per-minute allowance refilled continuously, as Anthropic enforces its limits.
+
+    The level may go below zero when a call turns out to cost more than was reserved for
+    it, and later calls wait until the debt is refilled.
+
+    Args:
+        per_minute (float): The limit, or None for no limit until one is learned from headers
+    """
+
+    def __init__(self, per_minute: float = None):
+        self.capacity = per_minute
+        self.level = per_minute
+        self._updated = time.monotonic()
+
+    def refill(self, now: float):
+        if self.capacity is not None:
+            self.level = min(self.capacity, self.level + (now - self._updated) * self.capacity / 60)
+        self._updated = now
+
+    def wait_time(self, cost: float) -> float:
+        """Seconds until `cost` can be taken, after `refill`."""
+        if self.capacity is None:
+            return 0.0
+        cost = min(cost, self.capacity)
+        return max(0.0, (cost - self.level) * 60 / self.capacity)
+
+    def take(self, cost: float):
+        if self.capacity is not None:
+            self.level -= cost
+
+    def update(self, limit: float, remaining: float = None):
+        """Adopt the limit and remaining allowance reported by the API."""
+        if self.capacity is None:
+            self.level = limit
+        self.capacity = limit
+        if remaining is not None:
+            # Calls still in flight have been counted by us but maybe not yet by the API
+            self.level = min(self.level, remaining)
+
+def request_tokens(request: dict) -> int:
+    """Tokens a Messages API request is expected to use: its input estimate plus `max_tokens`."""
+    prompt = json.dumps([request.get('system'), request.get('tools'), request.get('messages')], ensure_ascii=False)
+    return estimate_tokens(prompt) + request.get('max_tokens', 0)
+
+def used_tokens(usage) -> int:
+    """Tokens a call actually counted against the limit, from its `usage`; cache reads are not counted."""
+    return usage.input_tokens + usage.output_tokens + (usage.cache_creation_input_tokens or 0)
+
+class Scheduler:
+    """Shared gate for Claude calls: rate limits, retries and hedged grading calls.
+
+    Every call first takes one request from a requests-per-minute bucket and its estimated
+    tokens from a tokens-per-minute bucket, waiting until both have room, so concurrent
+    loops share the account's limits instead of racing into 429s. The buckets start at the
+    given limits and follow the `anthropic-ratelimit-*` headers of every response. Rate
+    limit (429), overload (529), server and connection errors are retried with full-jitter
+    exponential backoff, never sooner than a `retry-after` header allows, and a 429 pauses
+    every caller until then. The SDK's own retries are turned off for scheduled calls.
+
+    Grading calls are idempotent, so with `hedge_percentile` set, a grading call still
+    running after that percentile of recent grading latencies gets a duplicate request,
+    when the buckets have room for one, and the first answer wins.
+
+    Args:
+        requests_per_minute (float): Starting request limit, or None to learn it from headers
+        tokens_per_minute (float): Starting token limit, or None to learn it from headers
+        max_retries (int): Retries per call before its error is raised
+        hedge_percentile (float): Latency percentile (0-100) after which grading calls are hedged, or None
+        hedge_min_samples (int): Grading latencies observed before hedging starts
+        base_delay (float): First backoff ceiling in seconds, doubled per retry
+        max_delay (float): Largest backoff ceiling in seconds
+    """
+
+    def __init__(self,
+                 requests_per_minute: float = None,
+                 tokens_per_minute: float = None,
+                 max_retries: int = 4,
+                 hedge_percentile: float = None,
+                 hedge_min_samples: int = 20,
+                 base_delay: float = 0.5,
+                 max_delay: float = 30.0):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.max_retries = max_retries
+        self.hedge_percentile = hedge_percentile
+        self.hedge_min_samples = hedge_min_samples
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.latencies = collections.deque(maxlen=500)
+        self.counts = collections.Counter()
+        self.waited = 0.0
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(thread_name_prefix="claude")
+
+    def count(self, name: str, seconds: float = None):
+        with self._lock:
+            self.counts[name] += 1
+            if seconds is not None:
+                self.waited += seconds
+
+    def reserve(self, cost: int, wait_if_needed: bool = True) -> float:
+        """Take one request and `cost` tokens now and return 0, or return the seconds to wait.
+
+        With `wait_if_needed` False nothing is taken when there is no room, and -1 is returned."""
+        with self._lock:
+            now = time.monotonic()
+            self.requests.refill(now)
+            self.tokens.refill(now)
+            delay = max(self._paused_until - now, self.requests.wait_time(1), self.tokens.wait_time(cost))
+            if delay <= 0:
+                self.requests.take(1)
+                self.tokens.take(cost)
+                return 0.0
+        return delay if wait_if_needed else -1.0
+
+    def acquire(self, cost: int):
+        while (delay := self.reserve(cost)) > 0:
+            self.count('waits', delay)
+            time.sleep(delay)
+
+    async def aacquire(self, cost: int):
+        while (delay := self.reserve(cost)) > 0:
+            self.count('waits', delay)
+            await asyncio.sleep(delay)
+
+    def observe(self, headers):
+        """Follow the limits and remaining allowance in a response's rate-limit headers."""
+        for bucket, name in ((self.requests, "requests"), (self.tokens, "tokens")):
+            limit = headers.get(f"anthropic-ratelimit-{name}-limit")
+            if limit is None:
+                continue
+            remaining = headers.get(f"anthropic-ratelimit-{name}-remaining")
+            with self._lock:
+                bucket.refill(time.monotonic())
+                bucket.update(float(limit), float(remaining) if remaining is not None else None)
+
+    def settle(self, reserved: int, usage):
+        """Charge the difference between the tokens reserved for a call and those it used."""
+        with self._lock:
+            self.tokens.take(used_tokens(usage) - reserved)
+
+    def backoff(self, error: Exception, attempt: int):
+        """Seconds to wait before retrying after `error`, or None when it should be raised."""
+        if isinstance(error, anthropic.APIStatusError):
+            if error.status_code not in RETRYABLE_STATUS:
+                return None
+            self.observe(error.response.headers)
+            self.count('throttled' if error.status_code == 429 else 'overloaded' if error.status_code == 529 else 'failed')
+            retry_after = error.response.headers.get("retry-after")
+        elif isinstance(error, anthropic.APIConnectionError):
+            self.count('failed')
+            retry_after = None
+        else:
+            return None
+        if attempt >= self.max_retries:
+            return None
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+        try:
+            delay = max(delay, float(retry_after))
+        except (TypeError, ValueError):
+            pass
+        if isinstance(error, anthropic.RateLimitError):
+            # Everyone waits out a 429, not just the caller that hit it
+            with self._lock:
+                self._paused_until = max(self._paused_until, time.monotonic() + delay)
+        self.count('retries')
+        return delay
+
+    def hedge_delay(self):
+        """Seconds after which a grading call is hedged, or None while hedging is off."""
+        if self.hedge_percentile is None or len(self.latencies) < self.hedge_min_samples:
+            return None
+        latencies = sorted(self.latencies)
+        return latencies[min(len(latencies) - 1, int(len(latencies) * self.hedge_percentile / 100))]
+
+    def _send(self, create, request: dict, hedge: bool):
+        started = time.perf_counter()
+        raw = create(**request)
+        self.observe(raw.headers)
+        if hedge:
+            self.latencies.append(time.perf_counter() - started)
+        return raw
+
+    async def _asend(self, create, request: dict, hedge: bool):
+        started = time.perf_counter()
+        raw = await create(**request)
+        self.observe(raw.headers)
+        if hedge:
+            self.latencies.append(time.perf_counter() - started)
+        return raw
+
+    def _hedged(self, create, request: dict, cost: int):
+        delay = self.hedge_delay()
+        if delay is None:
+            return self._send(create, request, True)
+        pending = {self._executor.submit(self._send, create, request, True)}
+        done, pending = wait(pending, timeout=delay)
+        if not done and self.reserve(cost, wait_if_needed=False) == 0:
+            self.count('hedged')
+            hedge = self._executor.submit(self._send, create, request, True)
+            pending.add(hedge)
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            if hedge in done and hedge.exception() is None:
+                self.count('hedges_won')
+        while True:
+            # The first success wins; an error counts only once both calls have failed
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+            if not pending:
+                return next(iter(done)).result()
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+
+    async def _ahedged(self, create, request: dict, cost: int):
+        delay = self.hedge_delay()
+        if delay is None:
+            return await self._asend(create, request, True)
+        first = asyncio.ensure_future(self._asend(create, request, True))
+        done, pending = await asyncio.wait({first}, timeout=delay)
+        hedge = None
+        if not done and self.reserve(cost, wait_if_needed=False) == 0:
+            self.count('hedged')
+            hedge = asyncio.ensure_future(self._asend(create, request, True))
+            pending.add(hedge)
+        try:
+            while True:
+                if not done:
+                    done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            self.count('hedges_won')
+                        return task.result()
+                if not pending:
+                    return next(iter(done)).result()
+                done = set()
+        finally:
+            # The losing request is abandoned and its connection closed
+            for task in pending:
+                task.cancel()
+
+    def call(self, client, request: dict, hedge: bool = False):
+        """`messages.create` on `client` through the buckets, with retries and optional hedging.
+
+        Args:
+            client: An `Anthropic` client
+            request (dict): Keyword arguments for `messages.create`
+            hedge (bool): The call is idempotent (a grading call) and may be hedged
+
+        Returns:
+            Message: Claude's response
+        """
+        create = client.with_options(max_retries=0).messages.with_raw_response.create
+        cost = request_tokens(request)
+        attempt = 0
+        while True:
+            self.acquire(cost)
+            self.count('calls')
+            try:
+                raw = self._hedged(create, request, cost) if hedge else self._send(create, request, False)
+            except anthropic.APIError as e:
+                delay = self.backoff(e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            message = raw.parse()
+            self.settle(cost, message.usage)
+            return message
+
+    async def acall(self, client, request: dict, hedge: bool = False):
+        """Async counterpart of `call`, for an `AsyncAnthropic` client."""
+        create = client.with_options(max_retries=0).messages.with_raw_response.create
+        cost = request_tokens(request)
+        attempt = 0
+        while True:
+            await self.aacquire(cost)
+            self.count('calls')
+            try:
+                raw = await (self._ahedged(create, request, cost) if hedge else self._asend(create, request, False))
+            except anthropic.APIError as e:
+                delay = self.backoff(e, attempt)
+                if delay is None:
+                    raise
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            message = raw.parse()
+            # Older SDKs return a `LegacyAPIResponse`, whose `parse` is synchronous
+            if inspect.isawaitable(message):
+                message = await message
+            self.settle(cost, message.usage)
+            return message
+
+    @contextmanager
+    def stream(self, client, request: dict):
+        """`messages.stream` on `client` through the buckets, retrying failures to open the stream.
+
+        Errors after the first event are raised, since the text has already been consumed."""
+        cost = request_tokens(request)
+        attempt = 0
+        while True:
+            self.acquire(cost)
+            self.count('calls')
+            manager = client.with_options(max_retries=0).messages.stream(**request)
+            try:
+                stream = manager.__enter__()
+            except anthropic.APIError as e:
+                delay = self.backoff(e, attempt)
+                if delay is None:
+                    raise
+                time.sleep(delay)
+                attempt += 1
+                continue
+            break
+        self.observe(stream.response.headers)
+        try:
+            yield stream
+            self.settle(cost, stream.current_message_snapshot.usage)
+        finally:
+            manager.__exit__(None, None, None)
+
+    def summary(self) -> str:
+        """One-line summary of retries, hedges and rate-limit waits, for the end of a run."""
+        counts = self.counts
+        hedges = f", {counts['hedged']} hedged ({counts['hedges_won']} won)" if self.hedge_percentile is not None else ""
+        return (f"Claude scheduler: {counts['calls']} calls, {counts['retries']} retries "
+                f"({counts['throttled']} rate limited, {counts['overloaded']} overloaded){hedges}, "
+                f"{self.waited:.1f}s waiting for rate limits")
+
+def create_message(client, hedge: bool = False, **request):
+    """`Scheduler.call` on the active scheduler, or a plain `messages.create` when there is none."""
+    residency.start_preload()
+    if active_scheduler is None:
+        return client.messages.create(**request)
+    return active_scheduler.call(client, request, hedge)
+
+async def acreate_message(client, hedge: bool = False, **request):
+    """Async counterpart of `create_message`."""
+    residency.start_preload()
+    if active_scheduler is None:
+        return await client.messages.create(**request)
+    return await active_scheduler.acall(client, request, hedge)
+
+def stream_message(client, **request):
+    """`Scheduler.stream` on the active scheduler, or a plain `messages.stream` when there is none."""
+    residency.start_preload()
+    if active_scheduler is None:
+        return client.messages.stream(**request)
+    return active_scheduler.stream(client, request)
+
+def configure_scheduler(requests_per_minute: float = None, tokens_per_minute: float = None, max_retries: int = 4,
+                        hedge_percentile: float = None) -> Scheduler:
+    """Create a scheduler and make it the process-wide `active_scheduler`."""
+    global active_scheduler
+    active_scheduler = Scheduler(requests_per_minute, tokens_per_minute, max_retries, hedge_percentile)
+    return active_scheduler
@@ -0,0 +1,206 @@
+import asyncio
+import itertools
+
+from anthropic import AsyncAnthropic
+
+import events
+import hosts
+import store
+import telemetry
+from claude_prompt_lab import build_meta_prompt_request, GenerationAborted
+from context import build_meta_prompt_context, history_entry
+from events import Notice
+from pipeline import generate_case, evaluate_case, acreate_message
+from utils import extract_xml, extract_xml_all, normalize_prompt
+
+async def score_prompt(node, cases, evaluate_one):
+    """Generate and grade every case with one candidate prompt, concurrently."""
+    node['results'] = await asyncio.gather(*(evaluate_one(node['prompt'], case) for case in cases))
+    # Errored cases count as failures
+    node['pass_rate'] = sum('grade' in result and result['grade']['passed'] for result in node['results']) / len(cases)
+    node['errors'] = sum('error' in result for result in node['results'])
+
+async def propose_candidates(anthropic_client, node, claude_model, num_candidates, context_budget, recent_attempts):
+    """Diagnose a prompt's first failing case and ask the meta-prompt for several alternatives."""
+    failing = next((result for result in node['results'] if 'grade' in result and not result['grade']['passed']), None)
+    if failing is None:
+        # Every case that did not pass errored, so there is nothing to diagnose
+        return []
+    medical_history, selected_thinking = build_meta_prompt_context(node['history'],
+                                                                   failing['thinking'],
+                                                                   focus=f"{failing['grade']['justification']}\n{failing['objective']}",
+                                                                   budget_tokens=context_budget,
+                                                                   recent_attempts=recent_attempts)
+    with telemetry.stage("meta_prompt"):
+        response = await acreate_message(anthropic_client, **build_meta_prompt_request(claude_model,
+                                                                                       failing['objective'],
+                                                                                       node['prompt'],
+                                                                                       failing['input'],
+                                                                                       selected_thinking,
+                                                                                       failing['response'],
+                                                                                       failing['grade']['justification'],
+                                                                                       medical_history,
+                                                                                       num_candidates=num_candidates))
+        telemetry.note_anthropic(response.usage)
+    diagnosis = response.content[0].text
+    parsed = {'assessment': extract_xml(diagnosis, 'assessment'),
+              'suggestions': extract_xml(diagnosis, 'suggestions'),
+              'improved_prompt': ""}
+    history = node['history'] + [history_entry(node['round'], node['prompt'], failing['grade'], parsed)]
+    return [{'prompt': prompt.strip(), 'parent': node, 'history': history, 'assessment': parsed['assessment'],
+             'suggestions': parsed['suggestions']}
+            for prompt in extract_xml_all(diagnosis, 'improved_prompt')[:num_candidates] if prompt.strip()]
+
+async def run_prompt_search(cases: list[dict],
+                            reasoning_model: str,
+                            claude_model: str,
+                            reasoning_model_objective: str,
+                            reasoning_model_system_prompt: str,
+                            think_tag: str,
+                            think_end_tag: str,
+                            max_rounds: int,
+                            beam_width: int = 2,
+                            num_candidates: int = 3,
+                            generator_concurrency: int = 1,
+                            evaluator_concurrency: int = 4,
+                            meta_concurrency: int = 4,
+                            stream: bool = False,
+                            max_thinking_tokens: int = None,
+                            max_generation_seconds: float = None,
+                            context_budget: int = 8000,
+                            recent_attempts: int = 2) -> str:
+    """Beam search over candidate system prompts.
+
+    Every round, each prompt that entered the beam in the previous round is diagnosed on its
+    first failing case and the meta-prompt returns `num_candidates` alternatives. Candidates that are identical after
+    normalization, or that were already scored, are dropped before any model is called.
+    The remaining candidates are generated and graded against every case concurrently,
+    and the `beam_width` prompts with the highest pass rate survive to the next round.
+    A case whose generation or grading call fails counts as failed. The search stops as
+    soon as a prompt passes every case.
+
+    Args:
+        cases: Test cases from `pipeline.load_dataset`, or a single `{'input': ...}` case
+        max_rounds: Maximum number of rounds, including scoring the initial prompt
+        beam_width: Number of prompts kept after each round
+        num_candidates: Number of candidate prompts requested per beam prompt
+        Other arguments are as for `pipeline.run_dataset`
+
+    Returns:
+        str: A medical-style report of the search and the best prompt found
+    """
+    anthropic_client = AsyncAnthropic()
+    ollama_client = hosts.async_client()
+    generate_slots = asyncio.Semaphore(generator_concurrency)
+    evaluate_slots = asyncio.Semaphore(evaluator_concurrency)
+    meta_slots = asyncio.Semaphore(meta_concurrency)
+
+    for index, case in enumerate(cases, 1):
+        case.setdefault('id', str(index))
+        case.setdefault('objective', reasoning_model_objective)
+
+    async def evaluate_one(prompt, case):
+        result = {'input': case['input'], 'objective': case['objective'], 'system_prompt': prompt}
+        # A pair graded before with the same models is not generated or graded again
+        memo = store.lookup_grade(prompt, case['objective'], case['input'], reasoning_model, claude_model)
+        if memo is not None:
+            return {**result, **memo}
+        async with generate_slots:
+            try:
+                await generate_case(ollama_client, result, reasoning_model, think_tag, think_end_tag,
+                                    stream, max_thinking_tokens, max_generation_seconds)
+            except GenerationAborted as e:
+                result['response'], result['thinking'] = e.chat_message, e.thinking_steps
+                result['grade'] = e.grade()
+            except Exception as e:
+                # A failed call fails its case, not the whole search
+                return {**result, 'error': f"generation failed: {e}"}
+        if 'grade' not in result:
+            async with evaluate_slots:
+                try:
+                    await evaluate_case(anthropic_client, result, claude_model)
+                except Exception as e:
+                    return {**result, 'error': f"evaluation failed: {e}"}
+        store.record_grade(prompt, case['objective'], case['input'], reasoning_model, claude_model,
+                           result['grade'], result['response'], result['thinking'])
+        return result
+
+    async def propose(node):
+        async with meta_slots:
+            try:
+                return await propose_candidates(anthropic_client, node, claude_model, num_candidates,
+                                                context_budget, recent_attempts)
+            except Exception as e:
+                events.emit(Notice(f"Meta-prompt failed for a round {node['round']} prompt: {e}", "warning"))
+                return []
+
+    report = ["# 🏥 Dr Claude's Prompt Lab: Prompt Search Report",
+              f"\n## Patient Information: {reasoning_model}",
+              f"\n**Treatment Objective**: {reasoning_model_objective}",
+              f"\n**Search**: beam width {beam_width}, {num_candidates} candidates per prompt, {len(cases)} cases"]
+
+    node_ids = itertools.count(1)
+    seen = {normalize_prompt(reasoning_model_system_prompt)}
+    beam = [{'id': next(node_ids), 'prompt': reasoning_model_system_prompt, 'parent': None, 'history': [], 'round': 1}]
+    store.record_prompt(reasoning_model_system_prompt)
+    scored = []
+    try:
+        for round_number in range(1, max_rounds + 1):
+            if round_number == 1:
+                fresh = beam
+            else:
+                # Prompts kept from earlier rounds were already expanded, only new ones are diagnosed
+                proposals = await asyncio.gather(*(propose(node) for node in beam if node['round'] == round_number - 1))
+                fresh = []
+                duplicates = 0
+                for candidate in (candidate for candidates in proposals for candidate in candidates):
+                    key = normalize_prompt(candidate['prompt'])
+                    if key in seen:
+                        duplicates += 1
+                        continue
+                    seen.add(key)
+                    candidate['id'] = next(node_ids)
+                    candidate['round'] = round_number
+                    store.record_prompt(candidate['prompt'], parent=candidate['parent']['prompt'],
+                                        attempt=round_number, suggestions=candidate['suggestions'])
+                    fresh.append(candidate)
+                events.emit(Notice(f"{len(fresh)} new candidates, {duplicates} duplicates skipped"))
+                if not fresh:
+                    report.append(f"\n### Round {round_number}\n\nNo new candidates, search converged.")
+                    break
+
+            events.emit(Notice(f"🔄 Round {round_number}/{max_rounds}: scoring {len(fresh)} prompts on {len(cases)} cases", "heading"))
+            await asyncio.gather(*(score_prompt(node, cases, evaluate_one) for node in fresh))
+            scored.extend(fresh)
+
+            # Stable sort, so earlier prompts win ties
+            pool = fresh if round_number == 1 else beam + fresh
+            beam = sorted(pool, key=lambda node: node['pass_rate'], reverse=True)[:beam_width]
+            survivors = {node['id'] for node in beam}
+
+            report.append(f"\n### Round {round_number}\n\n| Candidate | Pass Rate | Survives |\n|---|---|---|")
+            for node in fresh:
+                label = node['prompt'].strip().splitlines()[0][:80] if node['prompt'].strip() else "(empty)"
+                errors = f" ({node['errors']} errored)" if node['errors'] else ""
+                report.append(f"| {label} | {node['pass_rate']:.0%}{errors} | {'✅' if node['id'] in survivors else ''} |")
+            events.emit(Notice(f"Best pass rate so far: {beam[0]['pass_rate']:.0%}", "info"))
+
+            if beam[0]['pass_rate'] == 1.0:
+                break
+    finally:
+        await anthropic_client.close()
+
+    best = beam[0]
+    lineage = []
+    node = best
+    while node is not None:
+        lineage.insert(0, node)
+        node = node['parent']
+    steps = [f"round {node['round']} ({node['pass_rate']:.0%})" for node in lineage]
+    report.extend(["\n## 🎉 Final Diagnosis" if best['pass_rate'] == 1.0 else "\n## ⚠️ Best Treatment Found",
+                   f"\n**Pass Rate**: {best['pass_rate']:.0%} after scoring {len(scored)} distinct prompts",
+                   f"\n**Lineage**: {' → '.join(steps)}"])
+    if best.get('assessment'):
+        report.append(f"\n**Specialist Notes** 🔬:\n\n{best['assessment']}")
+    report.extend(["\n### Best System Prompt:", f"\n```\n{best['prompt']}\n```"])
+    return "\n".join(report)
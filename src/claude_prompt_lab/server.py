@@ -0,0 +1,254 @@
+import itertools
+import json
+import os
+import queue
+import stat
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+
+import events
+import residency
+from claude_prompt_lab import client, run_prompt_lab
+from events import Graded, Notice
+
+# Job request fields and the `run_prompt_lab` arguments they set
+JOB_FIELDS = {
+    'input': 'reasoning_model_input',
+    'objective': 'reasoning_model_objective',
+    'system_prompt': 'reasoning_model_system_prompt',
+    'reasoning_model': 'reasoning_model',
+    'claude_model': 'claude_model',
+    'think_tag': 'think_tag',
+    'think_end_tag': 'think_end_tag',
+    'max_attempts': 'max_attempts',
+    'stream': 'stream',
+    'max_thinking_tokens': 'max_thinking_tokens',
+    'max_generation_seconds': 'max_generation_seconds',
+    'context_budget': 'context_budget',
+    'recent_attempts': 'recent_attempts',
+    'count_tokens_api': 'count_tokens_api',
+    'samples': 'samples',
+    'sample_concurrency': 'sample_concurrency',
+    'pass_rate': 'pass_rate',
+}
+
+@dataclass
+class JobFinished:
+    """The last event of a job's stream."""
+    job_id: int
+    status: str
+    seconds: float
+    report: str = None
+    error: str = None
+
+class JobStream:
+    """Event sink for one job, queueing its events for the request thread to stream back."""
+
+    def __init__(self):
+        self.queue = queue.SimpleQueue()
+        self.passed = None
+
+    def emit(self, event):
+        if isinstance(event, Graded):
+            self.passed = event.passed
+        self.queue.put((time.time(), event))
+
+class LabServer:
+    """Runs `run_prompt_lab` jobs concurrently in one long-lived process.
+
+    Jobs share the process's Anthropic and Ollama clients, whose keep-alive connection
+    pools stay warm between jobs, as well as the cache, pre-grader, host pool, prompt store
+    and telemetry configured on the command line. Each job runs on a worker thread with
+    its own `JobStream` as the event sink, so its progress can be streamed to the caller.
+
+    Args:
+        defaults (dict): `run_prompt_lab` arguments used when a job does not set them
+        max_jobs (int): Number of jobs run at once; later jobs wait for a free worker
+    """
+
+    def __init__(self, defaults: dict, max_jobs: int = 4):
+        self.defaults = defaults
+        self.jobs = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_jobs, thread_name_prefix="job")
+
+    def submit(self, params: dict) -> JobStream:
+        """Queue a job from its request fields and return the stream of its events."""
+        unknown = sorted(set(params) - set(JOB_FIELDS))
+        if unknown:
+            raise ValueError(f"Unknown job fields: {', '.join(unknown)}")
+        arguments = {**self.defaults, **{JOB_FIELDS[name]: value for name, value in params.items()}}
+        stream = JobStream()
+        with self._lock:
+            job = {'id': next(self._ids), 'status': 'queued', 'submitted_at': time.time(), 'seconds': None}
+            self.jobs[job['id']] = job
+        self._executor.submit(self.run, job, stream, arguments)
+        return stream
+
+    def run(self, job, stream, arguments):
+        job['status'] = 'running'
+        started = time.perf_counter()
+        with events.sink(stream):
+            try:
+                report = run_prompt_lab(**arguments)
+            except Exception as e:
+                job['status'] = 'error'
+                finished = JobFinished(job['id'], 'error', time.perf_counter() - started, error=str(e))
+            else:
+                job['status'] = 'passed' if stream.passed else 'failed'
+                finished = JobFinished(job['id'], job['status'], time.perf_counter() - started, report=report)
+        job['seconds'] = finished.seconds
+        stream.emit(finished)
+        events.emit(Notice(f"Job {job['id']} {job['status']} in {finished.seconds:.1f}s", "detail"))
+
+    def status(self) -> dict:
+        with self._lock:
+            jobs = list(self.jobs.values())
+        counts = {state: sum(job['status'] == state for job in jobs) for state in ('queued', 'running', 'passed', 'failed', 'error')}
+        return {'status': 'ok', **counts}
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def summary(self) -> str:
+        """A short markdown summary of the jobs served, for the end of the run."""
+        status = self.status()
+        return (f"# 🏥 Dr Claude's Prompt Lab: Server\n\n**Jobs**: {len(self.jobs)} served, {status['passed']} passed, "
+                f"{status['failed']} failed, {status['error']} errored")
+
+class LabRequestHandler(BaseHTTPRequestHandler):
+    """`POST /jobs` runs a job and streams its events as NDJSON; `GET /jobs` and `GET /health` report state."""
+
+    protocol_version = "HTTP/1.1"
+    lab = None
+
+    def send_json(self, status: int, body):
+        payload = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+        if path == "/health":
+            self.send_json(200, self.lab.status())
+        elif path == "/jobs":
+            with self.lab._lock:
+                jobs = list(self.lab.jobs.values())
+            self.send_json(200, jobs)
+        else:
+            self.send_json(404, {'error': f"No route for {path}"})
+
+    def do_POST(self):
+        if self.path.split("?")[0] != "/jobs":
+            self.send_json(404, {'error': f"No route for {self.path}"})
+            return
+        try:
+            params = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            if not isinstance(params, dict):
+                raise ValueError("The job must be a JSON object")
+            stream = self.lab.submit(params)
+        except ValueError as e:
+            self.send_json(400, {'error': str(e)})
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        connected = True
+        while True:
+            emitted_at, event = stream.queue.get()
+            if connected:
+                line = (events.serialize(event, emitted_at) + "\n").encode()
+                try:
+                    self.wfile.write(f"{len(line):x}\r\n".encode() + line + b"\r\n")
+                    self.wfile.flush()
+                except OSError:
+                    # The caller went away; the job still finishes and is recorded
+                    connected = False
+            if isinstance(event, JobFinished):
+                break
+        if connected:
+            self.wfile.write(b"0\r\n\r\n")
+
+    def log_message(self, *args):
+        pass
+
+class UnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+    def get_request(self):
+        # BaseHTTPRequestHandler expects an (address, port) pair
+        request, _ = super().get_request()
+        return request, ("local", 0)
+
+def is_tcp_address(address: str) -> bool:
+    """Whether `address` is a port or host:port rather than a unix socket path."""
+    return address.rpartition(":")[2].isdigit()
+
+def remove_stale_socket(path: str):
+    """Remove a socket left behind by an earlier server, refusing to touch any other file."""
+    try:
+        mode = os.stat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise ValueError(f"{path} exists and is not a unix socket")
+    os.unlink(path)
+
+def check_address(address: str):
+    """Raise `ValueError` unless `address` is a port, host:port, or a usable unix socket path.
+
+    Socket paths need a "/" (e.g. ./lab.sock), so a bare host such as "localhost" is not
+    mistaken for one, and an existing file is only replaced if it is a socket."""
+    if is_tcp_address(address):
+        return
+    if "/" not in address:
+        raise ValueError(f"--serve {address}: give a port, host:port, or a socket path containing '/'")
+    if os.path.exists(address) and not stat.S_ISSOCK(os.stat(address).st_mode):
+        raise ValueError(f"--serve {address}: the file exists and is not a unix socket")
+
+def bind(address: str, handler):
+    """An HTTP server on `address`: a port, host:port, or the path of a unix socket."""
+    check_address(address)
+    if is_tcp_address(address):
+        host, _, port = address.rpartition(":")
+        server = ThreadingHTTPServer((host or "127.0.0.1", int(port)), handler)
+        server.daemon_threads = True
+        return server
+    remove_stale_socket(address)
+    return UnixHTTPServer(address, handler)
+
+def warm_anthropic():
+    """Open the Anthropic client's connection ahead of the first job."""
+    try:
+        client.with_options(max_retries=0).models.list(limit=1)
+    except Exception:
+        pass
+
+def serve(address: str, defaults: dict, max_jobs: int = 4) -> str:
+    """Serve jobs on `address` until interrupted, then return a summary of the jobs served."""
+    lab = LabServer(defaults, max_jobs)
+    server = bind(address, type("Handler", (LabRequestHandler,), {'lab': lab}))
+    threading.Thread(target=warm_anthropic, daemon=True).start()
+    # The server idles until the first job, so the model is loaded now rather than on its first Claude call
+    residency.start_preload()
+    events.emit(Notice(f"🧪 Serving prompt lab jobs on {address} (up to {max_jobs} at once)", "status"))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        lab.shutdown()
+        if not is_tcp_address(address):
+            remove_stale_socket(address)
+    return lab.summary()
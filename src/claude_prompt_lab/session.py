@@ -0,0 +1,106 @@
+import json
+import os
+import threading
+from datetime import datetime, timezone
+
+# The process-wide session log, if the run is checkpointed
+active_session = None
+
+class Session:
+    """Append-only JSONL log of the completed steps of a run.
+
+    The first line holds the run's settings. Every later line is one completed step of one
+    attempt (the generation, its grade, the token calibration or the meta-prompt diagnosis),
+    keyed by case id and attempt number and written as soon as the step completes. Resuming
+    a session loads the log and replays recorded steps instead of calling the models again,
+    so the run rebuilds its prompts, history and report exactly and continues with the first
+    step that never completed. A torn last line from a crash is ignored.
+
+    Args:
+        path (str): The session log file
+        resume (bool): Load the steps already in the log for replay
+    """
+
+    def __init__(self, path: str, resume: bool = False):
+        self.path = path
+        self.settings = None
+        self.steps = {}
+        self.replayed = 0
+        self.recorded = 0
+        self.diverged = set()
+        self._lock = threading.Lock()
+        if resume:
+            self.load()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def load(self):
+        with open(self.path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if entry.get('type') == 'session':
+                    self.settings = entry['settings']
+                elif entry.get('type') == 'step':
+                    self.steps[(entry['case'], entry['attempt'], entry['step'])] = entry['data']
+
+    def start(self, settings: dict):
+        """Write the settings header of a new session."""
+        if self.settings is None:
+            self.settings = settings
+            self._write({'type': 'session', 'settings': settings, 'started_at': datetime.now(timezone.utc).isoformat()})
+
+    def replay(self, step: str, attempt: int, case: str = None, system_prompt: str = None):
+        """Return the recorded data of a completed step, or None if it has to run.
+
+        A recorded generation made with a different system prompt means the case no longer
+        follows the log, so nothing more is replayed for it."""
+        if case in self.diverged:
+            return None
+        data = self.steps.get((case, attempt, step))
+        if data is None:
+            return None
+        if system_prompt is not None and data.get('system_prompt') != system_prompt:
+            self.diverged.add(case)
+            return None
+        with self._lock:
+            self.replayed += 1
+        return data
+
+    def record(self, step: str, attempt: int, data: dict, case: str = None):
+        """Append a completed step to the log."""
+        with self._lock:
+            self.recorded += 1
+        self._write({'type': 'step', 'case': case, 'attempt': attempt, 'step': step, 'data': data})
+
+    def _write(self, entry: dict):
+        with self._lock:
+            self._file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def summary(self) -> str:
+        """One-line summary of replayed and recorded steps, for the end of a run."""
+        note = f" ({len(self.diverged)} diverged from the log)" if self.diverged else ""
+        return f"Session {self.path}: {self.replayed} steps replayed, {self.recorded} recorded{note}"
+
+    def close(self):
+        self._file.close()
+
+def replay(step: str, attempt: int, case: str = None, system_prompt: str = None):
+    """`Session.replay` on the active session, or None when there is none."""
+    if active_session is None:
+        return None
+    return active_session.replay(step, attempt, case, system_prompt)
+
+def record(step: str, attempt: int, data: dict, case: str = None):
+    """`Session.record` on the active session, if there is one."""
+    if active_session is not None:
+        active_session.record(step, attempt, data, case)
+
+def configure_session(path: str, resume: bool = False) -> Session:
+    """Open a session log and make it the process-wide `active_session`."""
+    global active_session
+    active_session = Session(path, resume)
+    return active_session
@@ -0,0 +1,136 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+# The process-wide prompt store, if prompts and grades are being kept
+active_store = None
+
+def content_hash(text: str) -> str:
+    """SHA-256 of a prompt or input, the key it is stored under."""
+    return hashlib.sha256(text.encode()).hexdigest()
+
+def input_hash(objective: str, model_input: str) -> str:
+    """Hash of a test input together with the objective it is graded against."""
+    return content_hash(json.dumps([objective, model_input], ensure_ascii=False))
+
+class PromptStore:
+    """Versioned store of system prompts and their memoized grades.
+
+    Prompts are kept in SQLite under the hash of their text, with a link to the parent
+    prompt and the meta-prompt step (attempt and suggestions) that produced them, so the
+    lineage of any prompt can be walked back to the one a run started from. Grades are
+    memoized per (prompt hash, input hash, generator model, judge model), where the input
+    hash covers the objective as well, together with the response and thinking they judged.
+    Only the judge's verdicts are memoized: grades marked `local` (budget-aborted generations
+    and pre-grader failures) depend on settings outside the key and are not stored. A prompt
+    already stored keeps its first lineage, and a new grade replaces the old one.
+
+    Args:
+        path (str): The SQLite database file
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.memo_hits = 0
+        self.grades_stored = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("""CREATE TABLE IF NOT EXISTS prompts (
+                                hash TEXT PRIMARY KEY,
+                                text TEXT NOT NULL,
+                                parent_hash TEXT,
+                                attempt INTEGER,
+                                suggestions TEXT,
+                                created_at REAL NOT NULL)""")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS grades (
+                                prompt_hash TEXT NOT NULL,
+                                input_hash TEXT NOT NULL,
+                                generator_model TEXT NOT NULL,
+                                judge_model TEXT NOT NULL,
+                                passed INTEGER NOT NULL,
+                                justification TEXT NOT NULL,
+                                response TEXT,
+                                thinking TEXT,
+                                created_at REAL NOT NULL,
+                                PRIMARY KEY (prompt_hash, input_hash, generator_model, judge_model))""")
+        self._db.commit()
+
+    def add_prompt(self, text: str, parent: str = None, attempt: int = None, suggestions: str = None) -> str:
+        """Store a prompt, linked to the prompt it was derived from, and return its hash."""
+        key = content_hash(text)
+        with self._lock:
+            self._db.execute("INSERT OR IGNORE INTO prompts VALUES (?, ?, ?, ?, ?, ?)",
+                             (key, text, content_hash(parent) if parent is not None else None, attempt, suggestions,
+                              time.time()))
+            self._db.commit()
+        return key
+
+    def prompt(self, prefix: str) -> dict:
+        """Look up a prompt by its hash or a unique prefix of it, or raise `KeyError`."""
+        with self._lock:
+            rows = self._db.execute("SELECT hash, text, parent_hash, attempt, suggestions FROM prompts WHERE hash LIKE ?",
+                                    (prefix + "%",)).fetchall()
+        if len(rows) != 1:
+            raise KeyError(f"{'No' if not rows else 'More than one'} stored prompt matches {prefix!r}")
+        return dict(zip(('hash', 'text', 'parent_hash', 'attempt', 'suggestions'), rows[0]))
+
+    def get_grade(self, prompt: str, objective: str, model_input: str, generator_model: str, judge_model: str):
+        """The memoized result for a (prompt, input, generator, judge) pair, or None."""
+        with self._lock:
+            row = self._db.execute("""SELECT passed, justification, response, thinking FROM grades
+                                      WHERE prompt_hash = ? AND input_hash = ? AND generator_model = ? AND judge_model = ?""",
+                                   (content_hash(prompt), input_hash(objective, model_input),
+                                    generator_model, judge_model)).fetchone()
+        if row is None:
+            return None
+        passed, justification, response, thinking = row
+        return {'grade': {'passed': bool(passed), 'justification': justification},
+                'response': response, 'thinking': thinking}
+
+    def put_grade(self, prompt: str, objective: str, model_input: str, generator_model: str, judge_model: str,
+                  grade: dict, response: str = None, thinking: str = None):
+        """Memoize the grade of one (prompt, input, generator, judge) pair, unless it is `local`."""
+        if grade.get('local'):
+            return
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO grades VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                             (content_hash(prompt), input_hash(objective, model_input), generator_model, judge_model,
+                              int(grade['passed']), grade['justification'], response, thinking, time.time()))
+            self._db.commit()
+            self.grades_stored += 1
+
+    def summary(self) -> str:
+        """One-line summary of memoized and new grades, for the end of a run."""
+        return f"Prompt store: {self.memo_hits} memoized grades reused, {self.grades_stored} stored"
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+def record_prompt(text: str, parent: str = None, attempt: int = None, suggestions: str = None):
+    """`PromptStore.add_prompt` on the active store, if there is one."""
+    if active_store is not None:
+        active_store.add_prompt(text, parent, attempt, suggestions)
+
+def record_grade(prompt: str, objective: str, model_input: str, generator_model: str, judge_model: str,
+                 grade: dict, response: str = None, thinking: str = None):
+    """`PromptStore.put_grade` on the active store, if there is one."""
+    if active_store is not None:
+        active_store.put_grade(prompt, objective, model_input, generator_model, judge_model, grade, response, thinking)
+
+def lookup_grade(prompt: str, objective: str, model_input: str, generator_model: str, judge_model: str):
+    """`PromptStore.get_grade` on the active store, or None when there is none."""
+    if active_store is None:
+        return None
+    memo = active_store.get_grade(prompt, objective, model_input, generator_model, judge_model)
+    if memo is not None:
+        active_store.memo_hits += 1
+    return memo
+
+def configure_store(path: str) -> PromptStore:
+    """Open a prompt store and make it the process-wide `active_store`."""
+    global active_store
+    active_store = PromptStore(path)
+    return active_store
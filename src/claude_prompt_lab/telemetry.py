@@ -0,0 +1,235 @@
+import contextvars
+import json
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from rich.table import Table
+
+# The process-wide telemetry collector, if any
+active_telemetry = None
+
+# The attempt span and the stage record that measurements are attributed to
+current_span = contextvars.ContextVar("current_span", default=None)
+current_stage = contextvars.ContextVar("current_stage", default=None)
+
+ANTHROPIC_USAGE_FIELDS = ("input_tokens", "output_tokens", "cache_read_input_tokens", "cache_creation_input_tokens")
+OLLAMA_COUNT_FIELDS = ("prompt_eval_count", "eval_count")
+# Reported by Ollama in nanoseconds, recorded in seconds
+OLLAMA_DURATION_FIELDS = ("load_duration", "prompt_eval_duration", "eval_duration")
+
+class Span:
+    """One attempt: the generator, evaluator and meta-prompt stages that belong to it.
+
+    Entering the span makes it current for the stages that follow, in this thread or task.
+    Work handed to another thread is attributed to it with `run`. The span is exported
+    when it is exited or `finish`ed, whichever comes first."""
+
+    def __init__(self, **labels):
+        self.labels = labels
+        self.stages = []
+        self.started_at = datetime.now(timezone.utc)
+        self.started = time.perf_counter()
+        self.seconds = None
+        self._lock = threading.Lock()
+        self._token = None
+
+    def __enter__(self):
+        self._token = current_span.set(self)
+        return self
+
+    def __exit__(self, *exc):
+        current_span.reset(self._token)
+        self.finish()
+
+    def run(self, function, *args, **kwargs):
+        """Call `function` with this span current, e.g. as the target of an executor."""
+        token = current_span.set(self)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            current_span.reset(token)
+
+    def add(self, record: dict):
+        with self._lock:
+            self.stages.append(record)
+
+    def finish(self):
+        if self.seconds is not None:
+            return
+        self.seconds = time.perf_counter() - self.started
+        if active_telemetry is not None:
+            active_telemetry.export_span(self)
+
+def span(**labels) -> Span:
+    """Start a span for one attempt, labelled e.g. with the attempt number and case id."""
+    return Span(**labels)
+
+@contextmanager
+def stage(name: str, span: Span = None):
+    """Time one stage call and attribute it to `span`, or the current span.
+
+    Usage and Ollama counters noted with `note_anthropic` and `note_ollama` while the
+    stage is open are added to its record."""
+    record = {'stage': name}
+    token = current_stage.set(record)
+    started = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record['seconds'] = time.perf_counter() - started
+        current_stage.reset(token)
+        if active_telemetry is not None:
+            active_telemetry.record(record, span or current_span.get())
+
+def note_anthropic(usage):
+    """Add a Messages API `usage` object to the current stage."""
+    record = current_stage.get()
+    if record is None or usage is None:
+        return
+    for field in ANTHROPIC_USAGE_FIELDS:
+        record[field] = record.get(field, 0) + (getattr(usage, field, None) or 0)
+
+def note_ollama(response):
+    """Add the token counts and durations of a final Ollama chat response to the current stage."""
+    record = current_stage.get()
+    if record is None or response is None:
+        return
+    for field in OLLAMA_COUNT_FIELDS:
+        record[field] = record.get(field, 0) + (response.get(field) or 0)
+    for field in OLLAMA_DURATION_FIELDS:
+        record[field] = record.get(field, 0) + (response.get(field) or 0) / 1e9
+
+def percentile(values: list[float], fraction: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(int(fraction * len(ordered)), len(ordered) - 1)] if ordered else 0.0
+
+class Telemetry:
+    """Collects stage records, aggregates them per stage and exports them.
+
+    Exports:
+        JSONL: One line per finished span with its stage records, plus one line per stage
+            recorded outside any span
+        Prometheus: Text exposition of the per-stage counters, via `prometheus` or `serve`
+        Summary: A rich table of latency and token totals per stage, via `summary_table`
+    """
+
+    def __init__(self, jsonl_path: str = None):
+        self.durations = defaultdict(list)
+        self.totals = defaultdict(lambda: defaultdict(float))
+        self.spans = 0
+        self._lock = threading.Lock()
+        self._file = open(jsonl_path, "a", encoding="utf-8") if jsonl_path else None
+        self._server = None
+
+    def record(self, record: dict, span: Span = None):
+        with self._lock:
+            self.durations[record['stage']].append(record['seconds'])
+            totals = self.totals[record['stage']]
+            for field, value in record.items():
+                if field != 'stage':
+                    totals[field] += value
+        if span is not None:
+            span.add(record)
+        else:
+            self._write({'type': 'stage', **record})
+
+    def export_span(self, span: Span):
+        with self._lock:
+            self.spans += 1
+        self._write({'type': 'span', **span.labels, 'started_at': span.started_at.isoformat(),
+                     'seconds': span.seconds, 'stages': span.stages})
+
+    def _write(self, entry: dict):
+        if self._file is None:
+            return
+        with self._lock:
+            self._file.write(json.dumps(entry) + "\n")
+            self._file.flush()
+
+    def prometheus(self) -> str:
+        """The aggregated counters in the Prometheus text exposition format."""
+        lines = ["# HELP prompt_lab_spans_total Attempts finished.",
+                 "# TYPE prompt_lab_spans_total counter",
+                 f"prompt_lab_spans_total {self.spans}",
+                 "# HELP prompt_lab_stage_seconds Wall time of stage calls.",
+                 "# TYPE prompt_lab_stage_seconds summary"]
+        with self._lock:
+            stages = {name: (list(durations), dict(self.totals[name])) for name, durations in self.durations.items()}
+        for name, (durations, _) in stages.items():
+            for quantile in (0.5, 0.99):
+                lines.append(f'prompt_lab_stage_seconds{{stage="{name}",quantile="{quantile}"}} {percentile(durations, quantile):.6f}')
+            lines.append(f'prompt_lab_stage_seconds_sum{{stage="{name}"}} {sum(durations):.6f}')
+            lines.append(f'prompt_lab_stage_seconds_count{{stage="{name}"}} {len(durations)}')
+        lines.extend(["# HELP prompt_lab_tokens_total Tokens reported by Claude and Ollama.",
+                      "# TYPE prompt_lab_tokens_total counter"])
+        for name, (_, totals) in stages.items():
+            for field in ANTHROPIC_USAGE_FIELDS + OLLAMA_COUNT_FIELDS:
+                if field in totals:
+                    lines.append(f'prompt_lab_tokens_total{{stage="{name}",kind="{field}"}} {int(totals[field])}')
+        lines.extend(["# HELP prompt_lab_ollama_seconds_total Time Ollama reports spending per phase.",
+                      "# TYPE prompt_lab_ollama_seconds_total counter"])
+        for name, (_, totals) in stages.items():
+            for field in OLLAMA_DURATION_FIELDS:
+                if field in totals:
+                    lines.append(f'prompt_lab_ollama_seconds_total{{stage="{name}",phase="{field.removesuffix("_duration")}"}} {totals[field]:.6f}')
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port: int, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """Serve `prometheus` at /metrics from a daemon thread."""
+        telemetry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = telemetry.prometheus().encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self._server
+
+    def summary_table(self) -> Table:
+        """Per-stage latency and token totals, for the end of a run."""
+        table = Table(title="Stage Telemetry")
+        for column in ("Stage", "Calls", "Total s", "p50 s", "p99 s", "Claude in/out", "Cached", "Ollama tok/s", "Load s"):
+            table.add_column(column, justify="left" if column == "Stage" else "right")
+        with self._lock:
+            stages = {name: (list(durations), dict(self.totals[name])) for name, durations in self.durations.items()}
+        for name, (durations, totals) in stages.items():
+            claude = (f"{int(totals.get('input_tokens', 0))}/{int(totals.get('output_tokens', 0))}"
+                      if 'input_tokens' in totals else "")
+            cached = str(int(totals['cache_read_input_tokens'])) if 'cache_read_input_tokens' in totals else ""
+            rate = (f"{totals['eval_count'] / totals['eval_duration']:.1f}"
+                    if totals.get('eval_duration') else "")
+            load = f"{totals['load_duration']:.2f}" if 'load_duration' in totals else ""
+            table.add_row(name, str(len(durations)), f"{sum(durations):.2f}", f"{percentile(durations, 0.5):.2f}",
+                          f"{percentile(durations, 0.99):.2f}", claude, cached, rate, load)
+        return table
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+        if self._file is not None:
+            self._file.close()
+
+def configure_telemetry(jsonl_path: str = None, metrics_port: int = None) -> Telemetry:
+    """Create a collector and make it the process-wide `active_telemetry`."""
+    global active_telemetry
+    active_telemetry = Telemetry(jsonl_path)
+    if metrics_port:
+        active_telemetry.serve(metrics_port)
+    return active_telemetry
@@ -0,0 +1,165 @@
+import asyncio
+import statistics
+import time
+
+from anthropic import AsyncAnthropic
+
+import events
+import hosts
+import store
+from claude_prompt_lab import GenerationAborted
+from events import Notice
+from pipeline import generate_case, evaluate_case
+
+def pareto_front(cells: list[dict]) -> list[dict]:
+    """Cells no other cell beats on pass rate without also being slower, fastest first."""
+    timed = [cell for cell in cells if cell['latency'] is not None and cell['pass_rate'] is not None]
+    front = [cell for cell in timed
+             if not any(other['pass_rate'] >= cell['pass_rate'] and other['latency'] <= cell['latency'] and
+                        (other['pass_rate'] > cell['pass_rate'] or other['latency'] < cell['latency'])
+                        for other in timed)]
+    return sorted(front, key=lambda cell: cell['latency'])
+
+async def run_tournament(cases: list[dict],
+                         models: list[str],
+                         prompts: list[str],
+                         claude_model: str,
+                         reasoning_model_objective: str,
+                         think_tag: str,
+                         think_end_tag: str,
+                         generator_concurrency: int = 1,
+                         evaluator_concurrency: int = 4,
+                         stream: bool = False,
+                         max_thinking_tokens: int = None,
+                         max_generation_seconds: float = None) -> str:
+    """Grade every (reasoning model, system prompt) pair on a test suite in one run.
+
+    The whole grid is generated and graded concurrently. Generation holds one of
+    `generator_concurrency` slots per healthy Ollama host, and cells are queued model by
+    model, so a single daemon loads each model once while a host pool can serve several
+    models at a time. Grading holds one of `evaluator_concurrency` slots and overlaps with
+    the next generations. Identical cells (the same model, prompt, objective and input)
+    are generated and graded once, and with a prompt store, pairs with a stored verdict
+    are not run again.
+
+    Args:
+        cases: Test cases from `pipeline.load_dataset`
+        models: Ollama reasoning models to compare
+        prompts: Candidate system prompts to compare
+        Other arguments are as for `pipeline.run_dataset`
+
+    Returns:
+        str: A report with the pass-rate/latency matrix and the best pairs
+    """
+    anthropic_client = AsyncAnthropic()
+    ollama_client = hosts.async_client()
+    gpus = sum(host.healthy for host in hosts.active_pool.hosts) if hosts.active_pool is not None else 1
+    generate_slots = asyncio.Semaphore(generator_concurrency * max(gpus, 1))
+    evaluate_slots = asyncio.Semaphore(evaluator_concurrency)
+    counts = {'graded': 0, 'memoized': 0, 'shared': 0}
+    runs = {}
+
+    for index, case in enumerate(cases, 1):
+        case.setdefault('id', str(index))
+        case.setdefault('objective', reasoning_model_objective)
+
+    async def run_one(model, prompt, case):
+        memo = store.lookup_grade(prompt, case['objective'], case['input'], model, claude_model)
+        if memo is not None:
+            counts['memoized'] += 1
+            return {'grade': memo['grade'], 'seconds': None}
+        result = {'input': case['input'], 'objective': case['objective'], 'system_prompt': prompt}
+        try:
+            async with generate_slots:
+                started = time.perf_counter()
+                try:
+                    await generate_case(ollama_client, result, model, think_tag, think_end_tag,
+                                        stream, max_thinking_tokens, max_generation_seconds)
+                except GenerationAborted as e:
+                    result['response'], result['thinking'] = e.chat_message, e.thinking_steps
+                    result['grade'] = e.grade()
+                seconds = time.perf_counter() - started
+            if 'grade' not in result:
+                async with evaluate_slots:
+                    await evaluate_case(anthropic_client, result, claude_model)
+        except Exception as e:
+            # A model missing from the daemon fails its column, not the tournament
+            return {'error': f"{type(e).__name__}: {e}", 'seconds': None}
+        store.record_prompt(prompt)
+        store.record_grade(prompt, case['objective'], case['input'], model, claude_model,
+                           result['grade'], result['response'], result['thinking'])
+        counts['graded'] += 1
+        return {'grade': result['grade'], 'seconds': seconds}
+
+    def run_shared(model, prompt, case):
+        key = (model, prompt, case['objective'], case['input'])
+        if key in runs:
+            counts['shared'] += 1
+        else:
+            runs[key] = asyncio.ensure_future(run_one(model, prompt, case))
+        return runs[key]
+
+    async def run_cell(model, column, prompt, row):
+        results = await asyncio.gather(*(run_shared(model, prompt, case) for case in cases))
+        graded = [result for result in results if 'grade' in result]
+        latencies = [result['seconds'] for result in results if result['seconds'] is not None]
+        cell = {'model': model, 'prompt': row,
+                'pass_rate': sum(result['grade']['passed'] for result in graded) / len(graded) if graded else None,
+                'latency': statistics.median(latencies) if latencies else None,
+                'errors': [result['error'] for result in results if 'error' in result]}
+        passed = f"{cell['pass_rate']:.0%} passed" if cell['pass_rate'] is not None else "no grades"
+        events.emit(Notice(f"[{column}] {model} × P{row}: {passed}" +
+                           (f", {len(cell['errors'])} errors" if cell['errors'] else ""), "step"))
+        return cell
+
+    events.emit(Notice(f"🏆 Running {len(models)} models × {len(prompts)} prompts on {len(cases)} cases", "status"))
+    try:
+        # Created model by model, so generations queue for the slots in that order
+        cells = await asyncio.gather(*(run_cell(model, column, prompt, row)
+                                       for column, model in enumerate(models, 1)
+                                       for row, prompt in enumerate(prompts, 1)))
+    finally:
+        await anthropic_client.close()
+    events.emit(Notice(f"{counts['graded']} pairs graded, {counts['memoized']} memoized verdicts reused, "
+                       f"{counts['shared']} identical cells shared", "done"))
+
+    def describe(cell):
+        if cell['pass_rate'] is None:
+            return "⚠ error"
+        latency = f"{cell['latency']:.1f}s" if cell['latency'] is not None else "memo"
+        return f"{cell['pass_rate']:.0%} · {latency}"
+
+    grid = {(cell['model'], cell['prompt']): cell for cell in cells}
+    report = ["# 🏥 Dr Claude's Prompt Lab: Tournament Report",
+              f"\n**Judge**: {claude_model}",
+              f"\n**Cases**: {len(cases)} · **Pairs**: {counts['graded']} graded, {counts['memoized']} memoized, "
+              f"{counts['shared']} shared",
+              "\n## Pass Rate · Median Generation Time",
+              "\n| Prompt | " + " | ".join(models) + " |",
+              "|---|" + "---|" * len(models)]
+    for row in range(1, len(prompts) + 1):
+        report.append(f"| P{row} | " + " | ".join(describe(grid[(model, row)]) for model in models) + " |")
+
+    ranked = sorted((cell for cell in cells if cell['pass_rate'] is not None),
+                    key=lambda cell: (-cell['pass_rate'], cell['latency'] if cell['latency'] is not None else float('inf')))
+    if ranked:
+        best = ranked[0]
+        report.append(f"\n**Best quality**: {best['model']} with P{best['prompt']} ({describe(best)})")
+    front = pareto_front(cells)
+    if front:
+        report.extend(["\n## Quality vs. Speed",
+                       "\nPairs that no other pair beats on pass rate without being slower:",
+                       "\n| Model | Prompt | Pass Rate | Median Generation Time |",
+                       "|---|---|---|---|"])
+        report.extend(f"| {cell['model']} | P{cell['prompt']} | {cell['pass_rate']:.0%} | {cell['latency']:.1f}s |"
+                      for cell in front)
+
+    report.append("\n## Prompts")
+    for row, prompt in enumerate(prompts, 1):
+        first_line = prompt.strip().splitlines()[0] if prompt.strip() else ""
+        report.append(f"\n**P{row}** ({store.content_hash(prompt)[:12]}): {first_line[:100]}")
+    errors = [(cell, error) for cell in cells for error in cell['errors'][:1]]
+    if errors:
+        report.append("\n## Errors")
+        report.extend(f"\n**{cell['model']} × P{cell['prompt']}**: {error}" for cell, error in errors)
+    return "\n".join(report)
@@ -1,4 +1,5 @@
 import re
+from functools import lru_cache
 
 grade_response_schema =  {
                 "name": "grade_response",
@@ -19,6 +20,41 @@ grade_response_schema =  {
                 }
             }
 
+def text_block(text: str, cache: bool = False) -> dict:
+    """
+    Builds a Messages API text content block, optionally marked as an Anthropic prompt cache breakpoint.
+
+    Args:
+        text (str): The block text.
+        cache (bool): Whether the prompt prefix up to and including this block should be cached.
+
+    Returns:
+        dict: The content block.
+    """
+    block = {"type": "text", "text": text}
+    if cache:
+        block["cache_control"] = {"type": "ephemeral"}
+    return block
+
+def format_cache_usage(usage) -> str:
+    """
+    Summarizes the prompt cache statistics from a Messages API `usage` object.
+
+    Args:
+        usage: The `usage` field of a Messages API response.
+
+    Returns:
+        str: Cache read, cache write and uncached input token counts.
+    """
+    cache_read = getattr(usage, "cache_read_input_tokens", None) or 0
+    cache_write = getattr(usage, "cache_creation_input_tokens", None) or 0
+    return f"{cache_read} cached, {cache_write} written to cache, {usage.input_tokens} uncached input tokens"
+
+@lru_cache(maxsize=None)
+def xml_pattern(tag: str) -> re.Pattern:
+    """Compiled pattern matching the content of an XML tag, cached per tag."""
+    return re.compile(f'<{tag}>(.*?)</{tag}>', re.DOTALL)
+
 def extract_xml(text: str, tag: str) -> str:
     """
     Extracts the content of the specified XML tag from the given text. Used for parsing structured responses 
@@ -30,5 +66,212 @@ def extract_xml(text: str, tag: str) -> str:
     Returns:
         str: The content of the specified XML tag, or an empty string if the tag is not found.
     """
-    match = re.search(f'<{tag}>(.*?)</{tag}>', text, re.DOTALL)
-    return match.group(1) if match else ""
\ No newline at end of file
+    match = xml_pattern(tag).search(text)
+    return match.group(1) if match else ""
+
+def extract_xml_all(text: str, tag: str) -> list[str]:
+    """
+    Extracts the content of every occurrence of the specified XML tag from the given text.
+
+    Args:
+        text (str): The text containing the XML.
+        tag (str): The XML tag to extract content from.
+
+    Returns:
+        list[str]: The content of each occurrence, in order.
+    """
+    return xml_pattern(tag).findall(text)
+
+def split_thinking(text: str, think_tag: str, think_end_tag: str) -> tuple[str, str]:
+    """
+    Splits a reasoning model's output into its thinking steps and final message.
+
+    Args:
+        text (str): The raw model output.
+        think_tag (str): Tag for the start of thinking steps.
+        think_end_tag (str): Tag for the end of thinking steps.
+
+    Returns:
+        tuple[str, str]: The message with thinking removed, and the stripped thinking steps
+        (empty if the output does not start with the thinking tag).
+    """
+    if not text.startswith(think_tag):
+        return text, ""
+    think_content, _, message = text[len(think_tag):].partition(think_end_tag)
+    return message, think_content.strip()
+
+class ThinkStreamParser:
+    """
+    Incremental state machine that separates thinking from answer text as chunks arrive.
+
+    Mirrors `split_thinking`: text is only treated as thinking when the output starts with
+    the thinking tag. Tags split across chunk boundaries are handled by holding back a
+    partial tag until the next chunk decides it.
+
+    States:
+        start: Waiting for enough text to tell whether the output opens with the thinking tag
+        thinking: Inside the thinking block, waiting for the end tag
+        answer: Everything after the thinking block (or the whole output if there is none)
+    """
+
+    def __init__(self, think_tag: str, think_end_tag: str):
+        self.think_tag = think_tag
+        self.think_end_tag = think_end_tag
+        self.state = "start"
+        self.thinking = ""
+        self.answer = ""
+        self._pending = ""
+
+    def feed(self, chunk: str) -> list[tuple[str, str]]:
+        """
+        Consume a chunk of model output.
+
+        Args:
+            chunk (str): The next piece of streamed text.
+
+        Returns:
+            list[tuple[str, str]]: ("thinking" | "answer", text) segments that are now certain.
+        """
+        self._pending += chunk
+        segments = []
+
+        if self.state == "start":
+            if self.think_tag.startswith(self._pending):
+                return segments
+            if self._pending.startswith(self.think_tag):
+                self.state = "thinking"
+                self._pending = self._pending[len(self.think_tag):]
+            else:
+                self.state = "answer"
+
+        if self.state == "thinking":
+            head, found, tail = self._pending.partition(self.think_end_tag)
+            if found:
+                self._emit("thinking", head, segments)
+                self.state = "answer"
+                self._pending = tail
+            else:
+                # Keep back the longest suffix that could still grow into the end tag
+                hold = 0
+                for size in range(min(len(self.think_end_tag) - 1, len(self._pending)), 0, -1):
+                    if self.think_end_tag.startswith(self._pending[-size:]):
+                        hold = size
+                        break
+                self._emit("thinking", self._pending[:len(self._pending) - hold], segments)
+                self._pending = self._pending[len(self._pending) - hold:]
+
+        if self.state == "answer":
+            self._emit("answer", self._pending, segments)
+            self._pending = ""
+
+        return segments
+
+    def finish(self) -> tuple[str, str]:
+        """
+        Flush any held-back text once the stream has ended.
+
+        Returns:
+            tuple[str, str]: The message with thinking removed, and the stripped thinking steps,
+            exactly as `split_thinking` would return for the full output.
+        """
+        if self._pending:
+            self._emit("answer" if self.state == "start" else self.state, self._pending, [])
+            self._pending = ""
+        return self.answer, self.thinking.strip()
+
+    def _emit(self, kind, text, segments):
+        if not text:
+            return
+        if kind == "thinking":
+            self.thinking += text
+        else:
+            self.answer += text
+        segments.append((kind, text))
+
+class TagStreamParser:
+    """
+    Single-pass incremental parser for the XML-tagged sections of a streamed response.
+
+    Each section is emitted the moment its closing tag arrives, so callers can act on an
+    early section while later ones are still streaming. Every character is scanned once:
+    text outside a section is discarded up to the next opening tag, and the search for a
+    closing tag resumes where the previous chunk left off. Tags split across chunk
+    boundaries are held back until the next chunk decides them. Tags are not nested, so an
+    opening tag inside an open section is treated as content.
+
+    States:
+        outside: Between sections, waiting for one of the opening tags
+        inside: In the section `tag`, waiting for its closing tag
+    """
+
+    def __init__(self, tags: list[str]):
+        self.tags = tags
+        self.sections = {}
+        self.tag = None
+        self._openings = {f"<{tag}>": tag for tag in tags}
+        self._longest_opening = max(map(len, self._openings))
+        self._buffer = ""
+        self._scanned = 0
+
+    def feed(self, chunk: str) -> list[tuple[str, str]]:
+        """
+        Consume a chunk of streamed text.
+
+        Args:
+            chunk (str): The next piece of streamed text.
+
+        Returns:
+            list[tuple[str, str]]: (tag, content) for every section closed by this chunk.
+        """
+        self._buffer += chunk
+        completed = []
+        while True:
+            if self.tag is None:
+                if not self._open_section():
+                    return completed
+            closing = f"</{self.tag}>"
+            end = self._buffer.find(closing, self._scanned)
+            if end < 0:
+                # Only the last len(closing) - 1 characters can still start the closing tag
+                self._scanned = max(len(self._buffer) - len(closing) + 1, 0)
+                return completed
+            content = self._buffer[:end]
+            self.sections.setdefault(self.tag, content)
+            completed.append((self.tag, content))
+            self._buffer = self._buffer[end + len(closing):]
+            self.tag = None
+            self._scanned = 0
+
+    def partial(self) -> str:
+        """The content of the open section received so far, excluding a possible partial closing tag."""
+        return self._buffer[:self._scanned] if self.tag is not None else ""
+
+    def _open_section(self) -> bool:
+        start = self._buffer.find("<")
+        while start >= 0:
+            rest = self._buffer[start:start + self._longest_opening]
+            for opening, tag in self._openings.items():
+                if rest.startswith(opening):
+                    self.tag = tag
+                    self._buffer = self._buffer[start + len(opening):]
+                    self._scanned = 0
+                    return True
+            if any(opening.startswith(rest) for opening in self._openings) and start + len(rest) == len(self._buffer):
+                # A partial opening tag at the end of the buffer, decided by the next chunk
+                self._buffer = self._buffer[start:]
+                return False
+            start = self._buffer.find("<", start + 1)
+        self._buffer = ""
+        return False
+
+def normalize_prompt(prompt: str) -> str:
+    """
+    Normalizes a system prompt for comparison, so whitespace and case differences do not count as a new prompt.
+
+    Args:
+        prompt (str): The system prompt.
+
+    Returns:
+        str: Lowercased prompt with runs of whitespace collapsed.
+    """
+    return " ".join(prompt.split()).lower()
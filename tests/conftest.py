@@ -0,0 +1,51 @@
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parent.parent
+SOURCE_DIR = ROOT / "src" / "claude_prompt_lab"
+LAB = SOURCE_DIR / "claude_prompt_lab.py"
+
+# The lab's modules import each other as siblings, as when the script is run directly
+sys.path[:0] = [str(SOURCE_DIR), str(ROOT / "benchmarks")]
+os.environ.setdefault("ANTHROPIC_API_KEY", "mock-key")
+
+from mock_servers import LatencyDistribution, MockAnthropic, MockOllama
+
+@pytest.fixture(scope="session")
+def mock_servers():
+    """Fast local stand-ins for Ollama and Claude, shared by every CLI test."""
+    ollama = MockOllama(first_token_latency=LatencyDistribution(0.005, 0.01), tokens_per_second=5000.0)
+    anthropic = MockAnthropic(latency=LatencyDistribution(0.005, 0.01), tokens_per_second=5000.0, batch_seconds=0.1)
+    urls = {'OLLAMA_HOST': ollama.start(), 'ANTHROPIC_BASE_URL': anthropic.start()}
+    yield urls
+    ollama.stop()
+    anthropic.stop()
+
+@pytest.fixture
+def lab_env(mock_servers):
+    return {**os.environ, **mock_servers, 'ANTHROPIC_API_KEY': 'mock-key'}
+
+@pytest.fixture
+def run_lab(lab_env, tmp_path):
+    """Run the CLI against the stand-ins and return its events, parsed from `--events jsonl`."""
+    def run(*args, env=None):
+        process = subprocess.run([sys.executable, str(LAB), "--events", "jsonl", "--local-reasoning-model", "mock-reasoner",
+                                  "--claude-model", "mock-claude", *args],
+                                 env=env or lab_env, cwd=tmp_path, capture_output=True, text=True, timeout=300)
+        assert process.returncode == 0, process.stderr
+        return [json.loads(line) for line in process.stdout.splitlines() if line.startswith("{")]
+    return run
+
+@pytest.fixture
+def dataset(tmp_path):
+    path = tmp_path / "suite.jsonl"
+    path.write_text("".join(json.dumps({'id': str(index),
+                                        'input': f"<existing_summary>Summary {index} of recent model releases.</existing_summary>\n"
+                                                 f"<new_search_results>Search result {index} on benchmark scores.</new_search_results>"}) + "\n"
+                            for index in range(1, 5)))
+    return str(path)
@@ -0,0 +1,118 @@
+"""Smoke tests running the CLI in each mode against the stand-ins in benchmarks/mock_servers.py."""
+import json
+import signal
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+from conftest import LAB
+
+def finished(events: list[dict]) -> dict:
+    """The `RunFinished` event that ends a run."""
+    assert events and events[-1]['event'] == "RunFinished", events[-1:]
+    return events[-1]
+
+def summary(run: dict, prefix: str) -> str:
+    return next(line for line in run['summaries'] if line.startswith(prefix))
+
+def test_interactive(run_lab):
+    events = run_lab("--max-attempts", "2")
+    run = finished(events)
+    assert "Dr Claude's Prompt Lab: Report" in run['report']
+    assert any(event['event'] == "Graded" for event in events)
+    assert " 0 calls" not in summary(run, "Claude scheduler")
+
+def test_interactive_streaming_with_budgets(run_lab):
+    events = run_lab("--max-attempts", "2", "--stream", "--max-thinking-tokens", "20")
+    assert any(event['event'] == "Graded" for event in events)
+    finished(events)
+
+def test_samples(run_lab):
+    events = run_lab("--max-attempts", "1", "--samples", "4", "--sample-concurrency", "2")
+    assert any(event['event'] == "SampleGraded" for event in events)
+    finished(events)
+
+def test_dataset_grades_every_case_through_the_scheduler(run_lab, dataset):
+    run = finished(run_lab("--dataset", dataset, "--max-attempts", "2", "--generator-concurrency", "2"))
+    assert "**Pass Rate**:" in run['report']
+    assert "errored" not in run['report']
+    assert " 0 calls" not in summary(run, "Claude scheduler")
+
+def test_dataset_batch_evaluation(run_lab, dataset):
+    run = finished(run_lab("--dataset", dataset, "--max-attempts", "2", "--batch-evaluation", "--batch-poll-interval", "0.05"))
+    assert "errored" not in run['report']
+
+def test_cached_rerun_makes_no_calls(run_lab, dataset, lab_env):
+    run_lab("--dataset", dataset, "--max-attempts", "2", "--cache", "cache.db")
+    # Nothing listens on port 9, so any call that misses the cache errors its case
+    offline = {**lab_env, 'OLLAMA_HOST': "http://127.0.0.1:9", 'ANTHROPIC_BASE_URL': "http://127.0.0.1:9"}
+    run = finished(run_lab("--dataset", dataset, "--max-attempts", "2", "--cache", "cache.db", "--cache-mode", "offline",
+                           "--api-retries", "0", env=offline))
+    assert "errored" not in run['report']
+
+def test_search(run_lab, dataset):
+    run = finished(run_lab("--search", "--dataset", dataset, "--max-attempts", "3", "--candidates", "2"))
+    assert "Prompt Search Report" in run['report']
+
+def test_search_records_failed_calls(run_lab, dataset, lab_env):
+    run = finished(run_lab("--search", "--dataset", dataset, "--max-attempts", "2", "--api-retries", "0",
+                           env={**lab_env, 'ANTHROPIC_BASE_URL': "http://127.0.0.1:9"}))
+    assert "(4 errored)" in run['report']
+
+def test_regress_reuses_memoized_grades(run_lab, dataset):
+    first = finished(run_lab("--dataset", dataset, "--store", "prompts.db", "--regress"))
+    assert "**Pairs**: 4 graded" in first['report']
+    second = finished(run_lab("--dataset", dataset, "--store", "prompts.db", "--regress"))
+    assert "**Pairs**: 0 graded, 4 memoized" in second['report']
+
+def test_regress_does_not_memoize_aborted_generations(run_lab, dataset):
+    run_lab("--dataset", dataset, "--store", "prompts.db", "--regress", "--stream", "--max-thinking-tokens", "1")
+    rerun = finished(run_lab("--dataset", dataset, "--store", "prompts.db", "--regress"))
+    assert "**Pairs**: 4 graded" in rerun['report']
+
+def test_tournament(run_lab, dataset, tmp_path):
+    (tmp_path / "terse.txt").write_text("Answer with the updated summary only.")
+    (tmp_path / "merge.txt").write_text("Weave the new results into the existing summary.")
+    run = finished(run_lab("--dataset", dataset, "--tournament", "reasoner-a", "reasoner-b",
+                           "--prompt-file", "terse.txt", "--prompt-file", "merge.txt"))
+    assert "**Pairs**: 16 graded" in run['report']
+    assert "| P2 |" in run['report']
+
+def test_resume_replays_the_session(run_lab, tmp_path):
+    log = tmp_path / "session.jsonl"
+    first = finished(run_lab("--max-attempts", "2", "--session", str(log)))
+    lines = log.read_text().splitlines()
+    # Keep the header and the first generation, so grading resumes from there
+    log.write_text("\n".join(lines[:2]) + "\n")
+    resumed = finished(run_lab("--resume", str(log)))
+    assert resumed['report'] == first['report']
+
+def free_port() -> int:
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+def test_serve_streams_job_events(lab_env, tmp_path):
+    address = f"127.0.0.1:{free_port()}"
+    server = subprocess.Popen([sys.executable, str(LAB), "--events", "none", "--local-reasoning-model", "mock-reasoner",
+                               "--claude-model", "mock-claude", "--max-attempts", "1", "--serve", address],
+                              env=lab_env, cwd=tmp_path, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+    try:
+        for _ in range(100):
+            try:
+                with urllib.request.urlopen(f"http://{address}/health", timeout=1) as response:
+                    assert json.load(response)['status'] == "ok"
+                break
+            except OSError:
+                time.sleep(0.1)
+        request = urllib.request.Request(f"http://{address}/jobs", data=json.dumps({'input': "Summarize this."}).encode(),
+                                         headers={'Content-Type': "application/json"})
+        with urllib.request.urlopen(request, timeout=60) as response:
+            events = [json.loads(line) for line in response.read().decode().splitlines()]
+        assert events[-1]['event'] == "JobFinished"
+        assert events[-1]['status'] in ("passed", "failed")
+    finally:
+        server.send_signal(signal.SIGINT)
+        server.communicate(timeout=30)
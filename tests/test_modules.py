@@ -0,0 +1,98 @@
+"""Unit tests for the lab's building blocks, without network access."""
+import json
+
+import pytest
+
+import events
+import pregrader
+import residency
+import server
+import store
+from context import compact_history, truncate_to_budget
+from scheduler import TokenBucket
+from tournament import pareto_front
+from utils import TagStreamParser, ThinkStreamParser, split_thinking
+
+def test_token_bucket_waits_for_refill():
+    bucket = TokenBucket(60)
+    bucket.take(60)
+    assert bucket.wait_time(1) == pytest.approx(1.0)
+    bucket.refill(bucket._updated + 30)
+    assert bucket.level == pytest.approx(30)
+    assert TokenBucket().wait_time(10 ** 6) == 0.0
+
+def test_think_stream_parser_matches_split_thinking():
+    text = "<think>step one, step two</think>The answer."
+    parser = ThinkStreamParser("<think>", "</think>")
+    for index in range(0, len(text), 3):
+        parser.feed(text[index:index + 3])
+    assert parser.finish() == split_thinking(text, "<think>", "</think>")
+
+def test_tag_stream_parser_emits_sections_as_they_close():
+    parser = TagStreamParser(['assessment', 'improved_prompt'])
+    assert parser.feed("<improved_prompt>Be br") == []
+    assert parser.feed("ief.</improved_pro") == []
+    assert parser.feed("mpt> <assessment>ok</assessment>") == [('improved_prompt', "Be brief."), ('assessment', "ok")]
+
+def test_compact_history_keeps_a_stable_prefix():
+    history = [{'attempt': index, 'system_prompt': f"Prompt {index}", 'passed': False, 'justification': "Too long.",
+                'response': "Response", 'thinking': "Thinking"} for index in range(1, 6)]
+    previous = compact_history(history[:4], 100000, recent_attempts=2)
+    current = compact_history(history, 100000, recent_attempts=2)
+    assert current.stable == 3
+    assert current[:previous.stable] == previous[:previous.stable]
+
+def test_truncate_to_budget_keeps_both_ends():
+    text = " ".join(f"word{index}" for index in range(1000))
+    truncated = truncate_to_budget(text, 100)
+    assert truncated.startswith("word0 ") and truncated.endswith("word999")
+    assert len(truncated) < len(text)
+
+def test_pregrader_checks():
+    preamble = pregrader.check_preamble()
+    assert preamble(None, None, "Here is the updated summary:\nModels improved.")
+    assert preamble(None, None, "This summary covers recent models.") is None
+    summary = " ".join(f"word{index}" for index in range(30))
+    model_input = f"<existing_summary>{summary}</existing_summary><new_search_results>new findings</new_search_results>"
+    copies = pregrader.check_copies_input()
+    assert copies(None, model_input, summary)
+    assert copies(None, model_input, summary + " " + " ".join(f"new{index}" for index in range(30))) is None
+
+def test_store_memoizes_only_judge_verdicts(tmp_path):
+    prompts = store.PromptStore(str(tmp_path / "prompts.db"))
+    key = ("Prompt", "Objective", "Input", "generator", "judge")
+    prompts.put_grade(*key, {'passed': False, 'justification': "Aborted", 'local': True})
+    assert prompts.get_grade(*key) is None
+    prompts.put_grade(*key, {'passed': True, 'justification': "Good"}, "Response", "Thinking")
+    assert prompts.get_grade(*key)['grade'] == {'passed': True, 'justification': "Good"}
+    child = prompts.add_prompt("Better prompt", parent="Prompt", attempt=2)
+    assert prompts.prompt(child[:8])['parent_hash'] == store.content_hash("Prompt")
+    prompts.close()
+
+def test_residency_preload_is_dropped_when_generation_comes_first():
+    manager = residency.ResidencyManager("model", "-1")
+    assert manager.keep_alive == -1
+    manager.arm()
+    manager.cancel()
+    manager.trigger()
+    assert manager.state == 'skipped'
+
+def test_events_serialize():
+    line = json.loads(events.serialize(events.Graded(1, True, "Fine"), 12.5))
+    assert line == {'event': "Graded", 'time': 12.5, 'attempt': 1, 'passed': True, 'justification': "Fine", 'case_id': None}
+
+def test_server_check_address(tmp_path):
+    server.check_address("8080")
+    server.check_address("localhost:8080")
+    server.check_address(str(tmp_path / "lab.sock"))
+    with pytest.raises(ValueError):
+        server.check_address("localhost")
+    regular = tmp_path / "notes.txt"
+    regular.write_text("keep me")
+    with pytest.raises(ValueError):
+        server.check_address(str(regular))
+
+def test_pareto_front():
+    cells = [{'pass_rate': 0.9, 'latency': 3.0}, {'pass_rate': 0.5, 'latency': 1.0},
+             {'pass_rate': 0.5, 'latency': 2.0}, {'pass_rate': None, 'latency': None}]
+    assert pareto_front(cells) == [cells[1], cells[0]]